@@ -0,0 +1,126 @@
+"""
+Times the data preparation steps the dashboards run on every rerun against the code they
+replaced, on generated data (see generate_dataset.py): 1M dataset rows, or 1M vital rows
+drawn from them for the vitals benchmark. Every benchmark first checks that both versions
+give the same result.
+
+    python benchmark.py                  # 1M rows
+    python benchmark.py 5M --repeat 5 --seed 7
+"""
+import argparse
+import logging
+import time
+
+import pandas as pd
+
+from data_store import normalize_values
+from generate_dataset import generate, parse_rows
+import vitals
+
+# The vital types the vitals tab parsed before the parser registry
+LEGACY_VITALS = ['Blood pressure (BP)', 'Pulse', 'Weight', 'Oxygen saturation (SpO2)']
+
+
+def legacy_clean_values(values):
+    # clean_medical_data before normalize_values: four passes of per-row Python
+    values = values.str.lower().apply(lambda x: "pain in abdomen" if "pain in abd" in str(x) else x)
+    replacements = {
+        'cbc': 'cbc',
+        'urine': 'urine',
+        'hbsag': 'hbsag',
+    }
+    for key, value in replacements.items():
+        values = values.str.lower().apply(lambda x: key if value in str(x) else x)
+    return values
+
+def legacy_parse_vitals(data):
+    # The per-vital cleaning of visualize_vitals before the parser registry, keeping the
+    # rows each vital kept that hold a reading
+    parsed = []
+    for vital_type in LEGACY_VITALS:
+        vital_data = data[data['vital_type'] == vital_type].copy()
+        vital_data['value'] = vital_data['value'].astype(str)
+        if vital_type == 'Blood pressure (BP)':
+            vital_data['value'] = (
+                vital_data['value'].str.lower()
+                .str.replace('mmhg', '', regex=True)
+                .str.replace('mm/hg', '', regex=True)
+                .str.strip()
+            )
+            vital_data = vital_data[vital_data['value'].str.fullmatch(r'\d{2,3}/\d{2,3}')].copy()
+            vital_data[['systolic', 'diastolic']] = vital_data['value'].str.split('/', expand=True).astype(int)
+            parsed.append(vital_data[['systolic', 'diastolic']])
+            continue
+        if vital_type == 'Weight':
+            vital_data = vital_data[vital_data['value'].str.contains('kg|kgs', case=False, na=True)]
+        if vital_type == 'Oxygen saturation (SpO2)':
+            vital_data = vital_data[vital_data['value'].str.contains('%', case=False, na=True)]
+            vital_data['value'] = vital_data['value'].str.split('%').str[0].str.strip()
+            vital_data['value'] = vital_data['value'].apply(lambda x:
+                str((int(x.split('-')[0].strip()) + int(x.split('-')[1].strip())) // 2)
+                if '-' in str(x) else x)
+            vital_data['value'] = vital_data['value'].apply(lambda x:
+                x[:3] if str(x)[0] == '1' else x[:2])
+            vital_data['value'] = pd.to_numeric(vital_data['value'], errors='coerce')
+            vital_data = vital_data[(vital_data['value'] >= 0) & (vital_data['value'] <= 100)]
+        else:
+            vital_data['value'] = vital_data['value'].str.extract(r'(\d+\.?\d*)')
+            vital_data['value'] = pd.to_numeric(vital_data['value'], errors='coerce')
+        parsed.append(vital_data[['value']].dropna())
+    return pd.concat(parsed).sort_index()
+
+def parse_vitals(data):
+    parsed = []
+    for vital_type in LEGACY_VITALS:
+        readings = vitals.parse_vital(data.loc[data['vital_type'] == vital_type, 'value'], vital_type)
+        parsed.append(readings[readings['valid']].drop(columns='valid'))
+    return pd.concat(parsed).sort_index()
+
+def vital_rows(data, rows, seed):
+    """rows vital rows drawn from data, with repeats when it holds fewer."""
+    return data[data['vital_type'].notna()].sample(rows, replace=True, random_state=seed).reset_index(drop=True)
+
+# name: (input of rows rows from the generated data, legacy implementation, current implementation)
+BENCHMARKS = {
+    'clean values': (lambda data, rows, seed: data[['value']], lambda data: legacy_clean_values(data['value']),
+                     lambda data: normalize_values(data['value'])),
+    'parse vitals': (vital_rows, legacy_parse_vitals, parse_vitals),
+}
+
+
+def best_time(function, data, repeat):
+    """The fastest of repeat runs of function(data), in seconds, and its last result."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function(data)
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+def run(data, rows, seed, repeat):
+    for name, (prepare, legacy, current) in BENCHMARKS.items():
+        frame = prepare(data, rows, seed)
+        legacy_seconds, expected = best_time(legacy, frame, repeat)
+        current_seconds, result = best_time(current, frame, repeat)
+        if isinstance(expected, pd.DataFrame):
+            pd.testing.assert_frame_equal(result, expected, check_dtype=False, check_like=True)
+        else:
+            pd.testing.assert_series_equal(result, expected, check_dtype=False)
+        logging.info("%-16s legacy %8.3fs  current %8.3fs  %6.1fx", name, legacy_seconds, current_seconds,
+                     legacy_seconds / current_seconds)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('rows', type=parse_rows, nargs='?', default=1_000_000, help="number of rows (default: 1M)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed (default: 0)")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per benchmark; the fastest counts (default: 3)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    data = pd.concat(generate(args.rows, args.seed), ignore_index=True)
+    logging.info("%d generated rows", len(data))
+    run(data, args.rows, args.seed, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Converts Excel workbooks into the typed Parquet snapshots that load_data reads, so the
+dashboards never go through openpyxl at startup. Every sheet becomes its own snapshot;
+the first one is the snapshot load_data picks up. Sheets are converted in parallel.
+
+    python convert_excel.py                       # the dermat and gynac workbooks
+    python convert_excel.py path/to/book.xlsx --workers 4
+"""
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from data_store import convert_sheet, snapshot_path
+
+WORKBOOKS = [
+    r'data\DERMA-Digitised Dataset.xlsx',
+    r'data\Gynac.xlsx',
+]
+
+
+def list_sheets(file_path):
+    """(file_path, sheet_name) for every sheet; the first sheet is the dashboards' default (None)."""
+    with pd.ExcelFile(file_path) as workbook:
+        sheet_names = workbook.sheet_names
+    return [(file_path, None)] + [(file_path, sheet_name) for sheet_name in sheet_names[1:]]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('workbooks', nargs='*', default=WORKBOOKS, help="Excel files to convert")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per CPU)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    sheets = []
+    for file_path in args.workbooks:
+        if not os.path.exists(file_path):
+            logging.warning("Skipping %s: file not found", file_path)
+            continue
+        sheets.extend(list_sheets(file_path))
+    started = time.time()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(convert_sheet, file_path, sheet_name): (file_path, sheet_name)
+                   for file_path, sheet_name in sheets}
+        for future in as_completed(futures):
+            file_path, sheet_name = futures[future]
+            logging.info("%s [%s]: %d rows -> %s", file_path, sheet_name or 'first sheet', future.result(),
+                         snapshot_path(file_path, sheet_name))
+    logging.info("Converted %d sheet(s) in %.1fs", len(sheets), time.time() - started)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1275 @@
+import codecs
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as pads
+import pyarrow.parquet as pq
+import requests
+
+import vitals
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the snapshot layout or dtypes change so older snapshots are ignored
+SNAPSHOT_VERSION = 7
+# Snapshots are partitioned by the month ('YYYY-MM') of start_time; rows without one go to
+# UNDATED_PARTITION, which sorts after every month so no date range ever selects it
+PARTITION_COLUMN = 'month'
+UNDATED_PARTITION = 'undated'
+
+# Records are normalized into a typed frame every JSON_CHUNK_RECORDS, and the file is
+# read JSON_READ_BYTES at a time, so only one chunk of Python dicts is alive at once
+JSON_CHUNK_RECORDS = 50_000
+JSON_READ_BYTES = 1 << 20
+
+# dtype contract applied to every dataset at ingest; columns a dataset lacks are skipped
+SCHEMA = {
+    'state_name': 'category',
+    'city': 'category',
+    'speciality': 'category',
+    'type': 'category',
+    'gender': 'category',
+    'vital_type': 'category',
+    'manufacturers': 'category',
+    'zone': 'category',
+    'all_city_group': 'category',
+    'min_mrp': 'float32',
+    'max_mrp': 'float32',
+    'age': 'Int16',
+    'start_time': 'datetime64[ns]',
+}
+# UUID identifier columns that are replaced with dense integer surrogate keys at ingest
+KEY_COLUMNS = ['id', 'doctor_id', 'ptp_id']
+# A record appended to an existing dataset is a duplicate when these columns match a stored row
+DEDUP_KEYS = ['row_number', 'id']
+# Multi-valued text columns, with the separator their values are split on and how each value
+# is normalized. Ingest stores them as bridge tables so dashboards never re-split the strings.
+MULTI_VALUE_FIELDS = {
+    'primary_use': (r'\|', lambda value: value.strip().upper()),
+    'state_name': (r'[,/]', str.strip),
+    'city': (r'[,/]', str.strip),
+    'pincode': (r'[,/]', str.strip),
+}
+# Star schema kept with every snapshot: each dimension table holds the distinct combinations
+# of its columns, and the fact table holds one integer key per dimension for every row, so
+# questions about doctors, patients, places or drugs alone scale with those tables, not rows
+DIMENSIONS = {
+    'doctor': ['doctor_id', 'speciality'],
+    'patient': ['id', 'age', 'gender'],
+    'geography': ['zone', 'state_name', 'all_city_group', 'city', 'pincode'],
+    'drug': ['manufacturers', 'primary_use', 'min_mrp', 'max_mrp'],
+}
+# Normalization rules for value, one per row of kind,pattern,name, highest priority first. A
+# lowercased value that the pattern matches becomes name: 'substring' rules match anywhere in
+# the value, 'exact' rules the whole value, and 'regex' rules are regular expressions searched
+# for in it. Every spelling of a medicine, test or complaint can so be counted as one item.
+VALUE_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'value_rules.csv')
+VALUE_RULE_KINDS = ['substring', 'exact', 'regex']
+# Bumped whenever clean_columns changes what it derives, so cleaned columns stored by an
+# older version are rebuilt instead of read
+CLEANING_VERSION = 1
+# The dataset columns clean_columns derives its columns from
+CLEANING_SOURCE_COLUMNS = ['min_mrp', 'max_mrp', 'gender', 'value']
+# Ages outside this range fall outside every age bin the dashboards use, so they are stored as missing
+AGE_RANGE = (0, 200)
+
+# Downloads live in DOWNLOAD_DIR/<url hash>/<content hash>-<name>; a cached file is
+# revalidated against the server at most once every REVALIDATE_SECONDS
+DOWNLOAD_DIR = 'downloads'
+REVALIDATE_SECONDS = 300
+DOWNLOAD_TIMEOUT = 60
+# Downloads are streamed to disk in DOWNLOAD_CHUNK_BYTES pieces; a dropped connection is
+# resumed up to DOWNLOAD_RETRIES times in a row, with a growing delay
+DOWNLOAD_CHUNK_BYTES = 1 << 20
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_RETRY_DELAY = 1
+# A dataset published as several exports (one per client/project) is downloaded and parsed
+# SOURCE_WORKERS exports at a time, and combined under DOWNLOAD_DIR/COMBINED_DIR
+SOURCE_WORKERS = 8
+COMBINED_DIR = 'combined'
+# Source entries may tag their rows with these columns
+SOURCE_TAGS = ['client', 'project']
+
+
+def read_source(file_path, sheet_name=None):
+    """Parses a raw dataset; sheet_name picks a workbook sheet other than the first."""
+    file_extension = os.path.splitext(file_path)[1].lower()
+
+    if file_extension == '.csv':
+        return pd.read_csv(file_path)
+    elif file_extension in ['.xls', '.xlsx']:
+        return pd.read_excel(file_path, sheet_name=0 if sheet_name is None else sheet_name)
+    elif file_extension == '.json':
+        return json_to_dataframe(file_path)
+    elif file_extension == '.parquet':
+        return pd.read_parquet(file_path)
+    else:
+        raise ValueError("Unsupported file format. Please provide a CSV, Excel, JSON or Parquet file.")
+
+def iter_source(file_path, chunk_rows, sheet_name=None):
+    """
+    Parses a raw dataset chunk_rows rows at a time, for datasets too large for read_source.
+    Excel workbooks cannot be read incrementally, so they are parsed whole and then sliced.
+    """
+    file_extension = os.path.splitext(file_path)[1].lower()
+
+    if file_extension == '.csv':
+        yield from pd.read_csv(file_path, chunksize=chunk_rows)
+    elif file_extension in ['.xls', '.xlsx']:
+        data = read_source(file_path, sheet_name)
+        for start in range(0, len(data), chunk_rows):
+            yield data.iloc[start:start + chunk_rows]
+    elif file_extension == '.json':
+        yield from iter_json_frames(file_path, chunk_rows)
+    elif file_extension == '.parquet':
+        for batch in pq.ParquetFile(file_path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        raise ValueError("Unsupported file format. Please provide a CSV, Excel, JSON or Parquet file.")
+
+def json_to_dataframe(file_path, progress=None):
+    """
+    Parses a JSON export in chunks instead of json.load-ing every record at once. Each chunk
+    is cast to SCHEMA as it is produced, so only one untyped chunk is held at a time.
+    progress, if given, is called as progress(bytes_read, total_bytes).
+    """
+    chunks = [apply_schema(chunk) for chunk in iter_json_frames(file_path, JSON_CHUNK_RECORDS, progress)]
+    if len(chunks) == 1:
+        return chunks[0]
+    return concat_frames(chunks)
+
+def iter_json_frames(file_path, chunk_records=JSON_CHUNK_RECORDS, progress=None):
+    """Yields the records of a JSON export as frames of chunk_records rows (at least one frame)."""
+    total_bytes = os.path.getsize(file_path)
+    records = []
+    empty = True
+    for record, bytes_read in iter_json_records(file_path):
+        records.append(record)
+        if len(records) == chunk_records:
+            yield pd.json_normalize(records)
+            records = []
+            empty = False
+            _report_progress(file_path, bytes_read, total_bytes, progress)
+    _report_progress(file_path, total_bytes, total_bytes, progress)
+    if records or empty:
+        yield pd.json_normalize(records)
+
+def iter_json_records(file_path):
+    """
+    Yields (record, bytes_read) for every element of a top-level JSON array.
+    A file holding a single JSON object yields that object once.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    with open(file_path, 'rb') as file:
+        buffer = ''
+        pos = 0
+        bytes_read = 0
+        eof = False
+        in_array = None
+
+        while True:
+            # Skip whitespace and the separators between array elements
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if in_array is None and pos < len(buffer):
+                in_array = buffer[pos] == '['
+                if in_array:
+                    pos += 1
+                continue
+            if in_array and pos < len(buffer) and buffer[pos] == ']':
+                return
+
+            if pos < len(buffer):
+                try:
+                    record, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    end = None
+                # A value that runs up to the end of the buffer may still be truncated
+                if end is not None and (end < len(buffer) or eof):
+                    pos = end
+                    yield record, bytes_read
+                    if not in_array:
+                        return
+                    continue
+            elif eof:
+                if in_array:
+                    raise ValueError(f"Unterminated JSON array in {file_path}")
+                return
+
+            block = file.read(JSON_READ_BYTES)
+            bytes_read += len(block)
+            eof = not block
+            buffer = buffer[pos:] + text_decoder.decode(block, final=eof)
+            pos = 0
+
+def _report_progress(file_path, bytes_read, total_bytes, progress):
+    percent = 100 * bytes_read / total_bytes if total_bytes else 100
+    logger.info("Parsed %s: %.0f%%", file_path, percent)
+    if progress is not None:
+        progress(bytes_read, total_bytes)
+
+_process_locks = {}
+_process_locks_guard = threading.Lock()
+
+@contextmanager
+def single_flight(lock_path):
+    """
+    Serializes work on lock_path across the sessions of this process (a threading lock)
+    and across processes (an OS file lock), so that when several sessions need the same
+    download or snapshot at once, one does the work and the others wait and reuse it.
+    Callers re-check for the result after acquiring the lock.
+    """
+    key = os.path.abspath(lock_path)
+    with _process_locks_guard:
+        process_lock = _process_locks.setdefault(key, threading.Lock())
+    with process_lock:
+        with open(key, 'a+b') as lock_file:
+            _lock_file(lock_file)
+            try:
+                yield
+            finally:
+                _unlock_file(lock_file)
+
+def _lock_file(lock_file):
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return
+    lock_file.seek(0)
+    while True:
+        try:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            # LK_LOCK gives up after ~10 seconds; keep waiting for the other process
+            pass
+
+def _unlock_file(lock_file):
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return
+    lock_file.seek(0)
+    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def snapshot_path(file_path, sheet_name=None):
+    """Location of the month-partitioned snapshot directory kept next to the raw dataset file."""
+    if sheet_name is None:
+        return f"{file_path}.v{SNAPSHOT_VERSION}.parquet"
+    sheet_label = re.sub(r'[^\w-]+', '_', str(sheet_name))
+    return f"{file_path}.{sheet_label}.v{SNAPSHOT_VERSION}.parquet"
+
+def read_snapshot(file_path, start_date=None, end_date=None, sheet_name=None, columns=None, rows=None):
+    """
+    Returns the snapshot for file_path, or None when it is missing or older than the raw file.
+    With a date range, only the month partitions overlapping it are read, with columns,
+    only those of them the dataset has, and with rows (a range of row positions), only those rows.
+    """
+    path = snapshot_path(file_path, sheet_name)
+    manifest = read_manifest(file_path, sheet_name)
+    if manifest is None:
+        return None
+    if columns is not None:
+        names = pads.dataset(path, format='parquet', partitioning='hive').schema.names
+        columns = [column for column in names if column in columns] + [PARTITION_COLUMN]
+    first_month, last_month = month_bounds(start_date, end_date)
+    filters = [(PARTITION_COLUMN, '>=', first_month), (PARTITION_COLUMN, '<=', last_month)]
+    if rows is not None:
+        # Appended rows go to files of their own, whose row statistics let the others be skipped
+        filters += [('row', '>=', rows.start), ('row', '<', rows.stop)]
+    data = pd.read_parquet(path, columns=columns, filters=filters)
+    data = data.drop(columns=PARTITION_COLUMN).sort_index()
+    data.index.name = None
+    if start_date is None and end_date is None and rows is None:
+        data = data.reset_index(drop=True)
+
+    # Each partition file carries its own dictionary, so restore the dataset-wide categories
+    for column, categories in manifest['categories'].items():
+        if column in data.columns:
+            data[column] = data[column].cat.set_categories(categories)
+    for column in KEY_COLUMNS:
+        if column in data.columns:
+            data[column] = _order_by_appearance(data[column])
+    return data
+
+def read_manifest(file_path, sheet_name=None):
+    """The _manifest.json of the snapshot of file_path, or None when there is no fresh snapshot."""
+    manifest_path = os.path.join(snapshot_path(file_path, sheet_name), '_manifest.json')
+    manifest = _read_meta(manifest_path)
+    if not manifest or os.path.getmtime(manifest_path) < os.path.getmtime(file_path):
+        return None
+    return manifest
+
+def dataset_revision(file_path, sheet_name=None):
+    """Changes whenever records are appended to the snapshot; include it in cache keys."""
+    manifest = read_manifest(file_path, sheet_name)
+    return manifest.get('revision', 0) if manifest else 0
+
+def write_snapshot(data, file_path, sheet_name=None):
+    path = snapshot_path(file_path, sheet_name)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    # Rows keep their position in the full dataset as the index, so partitions read
+    # back in any combination come out in the original order with the original labels
+    frame = data.set_axis(pd.Index(np.arange(len(data)), name='row'))
+    months = partition_months(frame)
+    try:
+        try:
+            _write_partitions(frame, months, tmp_path, 'part-0')
+        except (TypeError, ValueError):
+            # JSON exports can mix numbers and strings in one column (e.g. pincode)
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            _write_partitions(frame.pipe(_stringify_mixed_columns), months, tmp_path, 'part-0')
+        _write_bridges(build_bridges(data), tmp_path)
+        _write_dimensions(build_dimensions(data), tmp_path)
+        _write_meta(os.path.join(tmp_path, '_manifest.json'), {
+            'version': SNAPSHOT_VERSION,
+            'revision': 0,
+            'rows': len(data),
+            'watermark': _watermark(data),
+            'deltas': [],
+            'categories': {
+                column: data[column].cat.categories.tolist()
+                for column, dtype in SCHEMA.items()
+                if dtype == 'category' and column in data.columns
+            },
+        })
+        _replace_dir(tmp_path, path)
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning("Could not write snapshot for %s: %s", file_path, e)
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+def append_records(file_path, delta_path):
+    """
+    Merges the records of delta_path (any format read_source reads) into the snapshot
+    of file_path without re-parsing the full dataset, and returns the number of rows added.
+
+    A record whose DEDUP_KEYS match a stored row is skipped, however late it arrives; only
+    a delta without any of DEDUP_KEYS falls back to taking the records at or after the
+    start_time watermark of the snapshot. The new rows go through ingest
+    on their own and are written as extra files in the month partitions they fall in, so
+    no existing partition file is rewritten. A delta file is applied at most once.
+    A dataset without a snapshot gets one through load_frame first.
+    """
+    path = snapshot_path(file_path)
+    manifest_path = os.path.join(path, '_manifest.json')
+    if read_manifest(file_path) is None:
+        logger.info("No snapshot of %s to append %s to, building it first", file_path, delta_path)
+        load_frame(file_path, columns=[])
+    with single_flight(path + '.lock'):
+        manifest = read_manifest(file_path)
+        if manifest is None:
+            logger.warning("Could not append %s: %s has no snapshot", delta_path, file_path)
+            return 0
+
+        digest = _file_sha256(delta_path)
+        if digest in manifest['deltas']:
+            return 0
+        data = _new_records(ingest(read_source(delta_path)), path, manifest)
+        if len(data):
+            _append_partitions(data, path, manifest)
+        manifest['deltas'].append(digest)
+        _write_meta(manifest_path, manifest)
+
+    logger.info("Appended %d new rows from %s to %s", len(data), delta_path, file_path)
+    return len(data)
+
+def _new_records(data, path, manifest):
+    """The rows of an ingested delta whose DEDUP_KEYS are not stored yet."""
+    keys = [column for column in DEDUP_KEYS if column in data.columns]
+    if not keys:
+        # Nothing identifies a record, so only those past the watermark can be told apart
+        if manifest['watermark'] is None or 'start_time' not in data.columns:
+            return data
+        return data[~(data['start_time'] < pd.Timestamp(manifest['watermark']))]
+    if data.empty:
+        return data
+    data = data.drop_duplicates(subset=keys, keep='last')
+    stored = pd.read_parquet(path, columns=keys)
+    seen = pd.MultiIndex.from_frame(stored[keys].astype(object))
+    return data[~pd.MultiIndex.from_frame(data[keys].astype(object)).isin(seen)]
+
+def _append_partitions(data, path, manifest):
+    manifest_path = os.path.join(path, '_manifest.json')
+    schema = pads.dataset(path, format='parquet', partitioning='hive').schema
+    schema = schema.remove(schema.get_field_index(PARTITION_COLUMN))
+    # New rows continue the row numbering, so they sort after every stored row
+    data = data.set_axis(pd.Index(np.arange(manifest['rows'], manifest['rows'] + len(data)), name='row'))
+    months = partition_months(data)
+    data = data.reindex(columns=[name for name in schema.names if name != 'row'])
+
+    _write_bridges(_concat_bridges(read_bridges(path), build_bridges(data)), path)
+    # Publish the widened categories before the files that use them
+    for column, categories in manifest['categories'].items():
+        manifest['categories'][column] = pd.Index(categories).union(data[column].dropna().unique()).tolist()
+    _write_dimensions(build_dimensions(data, read_dimensions(path, manifest['categories'])), path)
+    _write_meta(manifest_path, manifest)
+
+    revision = manifest['revision'] + 1
+    _write_partitions(data, months, path, f"append-{revision}", schema)
+
+    manifest['revision'] = revision
+    manifest['rows'] += len(data)
+    manifest['watermark'] = max(filter(None, [manifest['watermark'], _watermark(data)]), default=None)
+
+def _write_partitions(data, months, path, name, schema=None):
+    """
+    Writes the rows of data of every month to <path>/month=<month>/<name>.parquet, all with
+    schema (that of data by default). Each file only keeps the categories its own rows use;
+    a month would otherwise store the dictionary of the whole dataset, and read_snapshot
+    restores the dataset-wide categories anyway.
+    """
+    schema = schema or pa.Schema.from_pandas(data, preserve_index=True)
+    categorical = [column for column in data.columns if isinstance(data[column].dtype, pd.CategoricalDtype)]
+    for month, rows in data.groupby(months, sort=True):
+        rows = rows.assign(**{column: rows[column].cat.remove_unused_categories() for column in categorical})
+        part_dir = os.path.join(path, f"{PARTITION_COLUMN}={month}")
+        os.makedirs(part_dir, exist_ok=True)
+        tmp_path = os.path.join(part_dir, f".{name}.{os.getpid()}.tmp")
+        pq.write_table(pa.Table.from_pandas(rows, schema=schema, preserve_index=True), tmp_path)
+        os.replace(tmp_path, os.path.join(part_dir, f"{name}.parquet"))
+
+def _watermark(data):
+    if 'start_time' not in data.columns or data['start_time'].isna().all():
+        return None
+    return data['start_time'].max().isoformat()
+
+def build_bridges(data):
+    """
+    Bridge tables for the MULTI_VALUE_FIELDS of data, keyed by column. Each one maps row
+    positions to value codes in compressed form: the values of row r are
+    values[codes[offsets[r]:offsets[r + 1]]]. Missing and blank entries have no values.
+    """
+    bridges = {}
+    for column, (separator, normalize) in MULTI_VALUE_FIELDS.items():
+        if column not in data.columns:
+            continue
+        # Split each distinct entry once, then expand to rows through the factorized codes
+        row_codes, uniques = pd.factorize(data[column])
+        split = [[value for value in map(normalize, re.split(separator, str(entry))) if value] for entry in uniques]
+        split.append([])  # what missing entries (code -1) point to
+        values = pd.Index(sorted({value for entry_values in split for value in entry_values}), dtype=object)
+        entries = {
+            'offsets': np.concatenate([[0], np.cumsum([len(entry_values) for entry_values in split])]),
+            'codes': values.get_indexer([value for entry_values in split for value in entry_values]).astype(np.int32),
+        }
+        row_codes = np.where(row_codes >= 0, row_codes, len(uniques))
+        lengths = np.diff(entries['offsets'])[row_codes]
+        bridges[column] = {
+            'values': values,
+            'offsets': np.concatenate([[0], np.cumsum(lengths)]),
+            'codes': _bridge_lookup(entries, row_codes)[1],
+        }
+    return bridges
+
+def load_bridges(file_path, sheet_name=None):
+    """The bridge tables written with the snapshot of file_path (built on the fly for URLs)."""
+    if '://' in file_path:
+        return build_bridges(load_frame(file_path, sheet_name=sheet_name))
+    if read_manifest(file_path, sheet_name) is None:
+        load_frame(file_path, sheet_name=sheet_name)
+    return read_bridges(snapshot_path(file_path, sheet_name))
+
+def read_bridges(path):
+    bridges = {}
+    with np.load(os.path.join(path, '_bridges.npz')) as arrays:
+        for column in MULTI_VALUE_FIELDS:
+            if f'{column}.values' in arrays:
+                bridges[column] = {
+                    'values': pd.Index(arrays[f'{column}.values'].astype(object)),
+                    'offsets': arrays[f'{column}.offsets'],
+                    'codes': arrays[f'{column}.codes'],
+                }
+    return bridges
+
+def _write_bridges(bridges, path):
+    arrays = {}
+    for column, bridge in bridges.items():
+        arrays[f'{column}.values'] = np.array(bridge['values'].tolist(), dtype=str)
+        arrays[f'{column}.offsets'] = bridge['offsets']
+        arrays[f'{column}.codes'] = bridge['codes']
+    tmp_path = os.path.join(path, f'.bridges.{os.getpid()}.tmp.npz')
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, os.path.join(path, '_bridges.npz'))
+
+def _concat_bridges(bridges, new_bridges):
+    """Bridges of the stored rows followed by those of appended rows, on a merged value list."""
+    merged = {}
+    for column, new in new_bridges.items():
+        old = bridges.get(column)
+        if old is None:
+            continue
+        values = old['values'].union(new['values'])
+        merged[column] = {
+            'values': values,
+            'offsets': np.concatenate([old['offsets'], old['offsets'][-1] + new['offsets'][1:]]),
+            'codes': np.concatenate([
+                values.get_indexer(old['values'])[old['codes']],
+                values.get_indexer(new['values'])[new['codes']],
+            ]).astype(np.int32),
+        }
+    return merged
+
+def _bridge_lookup(bridge, rows):
+    """For every value held by the given row positions: the index into rows it belongs to, and its code."""
+    starts = bridge['offsets'][rows]
+    lengths = bridge['offsets'][rows + 1] - starts
+    owners = np.repeat(np.arange(len(rows)), lengths)
+    within = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return owners, bridge['codes'][starts[owners] + within].astype(np.int32)
+
+def explode_values(data, bridges, column, name=None):
+    """
+    data.assign(name=<split values of column>).explode(name), read from the bridge table:
+    one row per value, no rows for missing or blank entries. name defaults to column.
+    The index of data must be the row positions in the loaded dataset, as load_frame returns it.
+    """
+    bridge = bridges[column]
+    owners, codes = _bridge_lookup(bridge, data.index.to_numpy())
+    exploded = data.iloc[owners]
+    exploded[name or column] = pd.Categorical.from_codes(codes, bridge['values'])
+    return exploded
+
+def rows_with_values(data, bridges, column, values):
+    """Boolean mask of the rows of data that hold any of values in the multi-valued column."""
+    bridge = bridges[column]
+    owners, codes = _bridge_lookup(bridge, data.index.to_numpy())
+    wanted = np.isin(codes, bridge['values'].get_indexer(list(values)))
+    return np.bincount(owners[wanted], minlength=len(data)) > 0
+
+def distinct_values(data, bridges, column):
+    """Sorted distinct values of the multi-valued column over the rows of data."""
+    bridge = bridges[column]
+    _, codes = _bridge_lookup(bridge, data.index.to_numpy())
+    return bridge['values'][np.unique(codes)].tolist()
+
+def build_dimensions(data, star=None):
+    """
+    Splits data into the star schema of DIMENSIONS: {'fact': <one <name>_key column per
+    dimension, one row per row of data>, <name>: <dimension table>}. Given the star schema
+    of earlier rows, data is keyed against its tables, which only grow by the combinations
+    they lack, and the returned fact table covers the earlier rows followed by data.
+    """
+    star = star or {}
+    fact = {}
+    tables = {}
+    for name, columns in DIMENSIONS.items():
+        columns = [column for column in columns if column in data.columns]
+        if not columns:
+            continue
+        rows = data[columns].reset_index(drop=True)
+        table = star.get(name)
+        if table is not None:
+            rows = pd.concat([table, _align_categories(rows, table)], ignore_index=True)
+        # Stored combinations come first and are distinct, so they keep their keys
+        keys = rows.groupby(columns, dropna=False, observed=True, sort=False).ngroup().to_numpy(np.int32)
+        tables[name] = rows[~pd.Series(keys).duplicated().to_numpy()].reset_index(drop=True)
+        offset = 0 if table is None else len(table)
+        fact[f'{name}_key'] = keys[offset:]
+    fact = pd.DataFrame(fact)
+    if 'fact' in star:
+        fact = pd.concat([star['fact'], fact], ignore_index=True)
+    return {'fact': fact, **tables}
+
+def _align_categories(rows, table):
+    """rows with the categories of table, so the two concatenate as categoricals."""
+    rows = rows.copy()
+    for column in rows.columns:
+        if isinstance(table[column].dtype, pd.CategoricalDtype):
+            categories = table[column].cat.categories.union(rows[column].dropna().unique())
+            table[column] = table[column].cat.set_categories(categories)
+            rows[column] = rows[column].astype(object).astype(table[column].dtype)
+    return rows
+
+def load_dimensions(file_path, sheet_name=None):
+    """The star schema written with the snapshot of file_path (built on the fly for URLs)."""
+    if '://' in file_path:
+        return build_dimensions(load_frame(file_path, sheet_name=sheet_name))
+    if read_manifest(file_path, sheet_name) is None:
+        load_frame(file_path, sheet_name=sheet_name)
+    return read_dimensions(snapshot_path(file_path, sheet_name), read_manifest(file_path, sheet_name)['categories'])
+
+def read_dimensions(path, categories):
+    star = {'fact': pd.read_parquet(os.path.join(path, '_fact.parquet'))}
+    for name in DIMENSIONS:
+        table_path = os.path.join(path, f'_dim_{name}.parquet')
+        if os.path.exists(table_path):
+            table = pd.read_parquet(table_path)
+            for column in table.columns.intersection(list(categories)):
+                table[column] = table[column].cat.set_categories(categories[column])
+            star[name] = table
+    return star
+
+def _write_dimensions(star, path):
+    for name, table in star.items():
+        file_name = '_fact.parquet' if name == 'fact' else f'_dim_{name}.parquet'
+        tmp_path = os.path.join(path, f'.{name}.{os.getpid()}.tmp')
+        try:
+            table.to_parquet(tmp_path, index=False)
+        except (TypeError, ValueError):
+            table.pipe(_stringify_mixed_columns).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, os.path.join(path, file_name))
+
+def dimension_rows(data, star, name):
+    """The rows of the name dimension table that the rows of data refer to, each once."""
+    keys = star['fact'][f'{name}_key'].to_numpy()[data.index.to_numpy()]
+    return star[name].iloc[np.unique(keys)]
+
+def partition_months(data):
+    """The snapshot partition ('YYYY-MM' of start_time) every row of data belongs to."""
+    if 'start_time' not in data.columns:
+        return pd.Series(UNDATED_PARTITION, index=data.index)
+    return pd.to_datetime(data['start_time'], errors='coerce').dt.strftime('%Y-%m').fillna(UNDATED_PARTITION)
+
+def month_bounds(start_date=None, end_date=None):
+    """First and last partition overlapping [start_date, end_date]; an open end includes undated rows."""
+    first_month = pd.Timestamp(start_date).strftime('%Y-%m') if start_date is not None else ''
+    last_month = pd.Timestamp(end_date).strftime('%Y-%m') if end_date is not None else UNDATED_PARTITION
+    return first_month, last_month
+
+def select_months(data, start_date=None, end_date=None):
+    """In-memory equivalent of the partition pruning done by read_snapshot."""
+    if start_date is None and end_date is None:
+        return data
+    first_month, last_month = month_bounds(start_date, end_date)
+    months = partition_months(data)
+    return data[(months >= first_month) & (months <= last_month)]
+
+def _order_by_appearance(series):
+    """Recodes a categorical so its categories follow first appearance, as pd.factorize numbers them."""
+    codes = series.cat.codes.to_numpy()
+    seen = pd.unique(codes[codes >= 0])
+    remap = np.full(len(series.cat.categories), -1, dtype=codes.dtype)
+    remap[seen] = np.arange(len(seen), dtype=codes.dtype)
+    new_codes = np.where(codes >= 0, remap[codes], -1)
+    categories = series.cat.categories[seen]
+    return pd.Series(pd.Categorical.from_codes(new_codes, categories), index=series.index, name=series.name)
+
+def _replace_dir(tmp_path, path):
+    old_path = f"{path}.{os.getpid()}.old"
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+def _stringify_mixed_columns(data):
+    data = data.copy()
+    for column in data.columns[data.dtypes == object]:
+        values = data[column]
+        data[column] = values.where(values.isna(), values.astype(str))
+    return data
+
+def apply_schema(data):
+    """Casts the columns named in SCHEMA to their declared compact dtypes."""
+    for column, dtype in SCHEMA.items():
+        if column not in data.columns:
+            continue
+        if dtype == 'category':
+            data[column] = data[column].astype('category')
+        elif dtype == 'datetime64[ns]':
+            data[column] = pd.to_datetime(data[column], errors='coerce')
+        elif column == 'age':
+            age = pd.to_numeric(data[column], errors='coerce')
+            data[column] = age.where(age.between(*AGE_RANGE)).round().astype(dtype)
+        else:
+            data[column] = pd.to_numeric(data[column], errors='coerce').astype(dtype)
+    return data
+
+def encode_keys(data):
+    """
+    Factorizes the UUID columns in KEY_COLUMNS into dense integer codes. They are kept as
+    categoricals, so the codes are the surrogate keys that nunique/groupby/joins hash, and
+    the categories are the lookup table back to the UUID for display (e.g. doctor pickers).
+    """
+    for column in KEY_COLUMNS:
+        if column not in data.columns or isinstance(data[column].dtype, pd.CategoricalDtype):
+            continue
+        codes, uniques = pd.factorize(data[column])
+        data[column] = pd.Categorical.from_codes(codes, uniques)
+    return data
+
+def ingest(data):
+    """Every transformation a freshly parsed dataset goes through before it is snapshotted."""
+    return encode_keys(apply_schema(data))
+
+def recode_categories(series, mapping):
+    """
+    Series.replace that also works on categorical columns, where replacing a value
+    with one that is not already a category raises. Only the categories are rewritten.
+    """
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        return series.replace(mapping)
+    categories = series.cat.categories
+    if categories.empty:
+        return series
+    renamed = pd.Index(categories.to_series().replace(mapping))
+    new_categories = renamed.unique().sort_values()
+    remap = new_categories.get_indexer(renamed)
+    codes = series.cat.codes.to_numpy()
+    new_codes = np.where(codes >= 0, remap[codes], -1)
+    return pd.Series(pd.Categorical.from_codes(new_codes, new_categories), index=series.index, name=series.name)
+
+def read_value_rules(rules_path=VALUE_RULES_PATH):
+    """The rules of rules_path as [(kind, pattern, name)], in priority order."""
+    rules = pd.read_csv(rules_path, dtype=str, keep_default_na=False)
+    unknown = set(rules['kind']) - set(VALUE_RULE_KINDS)
+    if unknown:
+        raise ValueError(f"{rules_path}: unknown rule kinds {sorted(unknown)}")
+    if (rules['pattern'] == '').any():
+        raise ValueError(f"{rules_path}: rules need a pattern")
+    return list(rules[['kind', 'pattern', 'name']].itertuples(index=False, name=None))
+
+@functools.lru_cache(maxsize=4)
+def compile_value_rules(rules_path=VALUE_RULES_PATH, digest=None):
+    """
+    The rules of rules_path compiled for match_rule: an Aho-Corasick automaton of the substring
+    rules, a dict of the exact ones and the compiled regex ones, each keyed by rule index, and
+    the name of every rule. digest is the content hash of the file, so edits are compiled again.
+    """
+    rules = read_value_rules(rules_path)
+    substrings = {}
+    exact = {}
+    regexes = []
+    for index, (kind, pattern, _) in enumerate(rules):
+        if kind == 'substring':
+            substrings.setdefault(pattern.lower(), index)
+        elif kind == 'exact':
+            exact.setdefault(pattern.lower(), index)
+        else:
+            regexes.append((index, re.compile(pattern)))
+    names = np.array([name for _, _, name in rules] + [None], dtype=object)
+    return build_automaton(substrings, len(rules)), exact, regexes, names
+
+def build_automaton(patterns, no_match):
+    """
+    Aho-Corasick automaton of {pattern: index}, as (transitions, fail, best). transitions[state]
+    maps a character to the next state, fail[state] is the state of the longest proper suffix,
+    and best[state] is the lowest index of the patterns ending there (no_match for none).
+    """
+    transitions = [{}]
+    best = [no_match]
+    for pattern, index in patterns.items():
+        state = 0
+        for char in pattern:
+            if char not in transitions[state]:
+                transitions[state][char] = len(transitions)
+                transitions.append({})
+                best.append(no_match)
+            state = transitions[state][char]
+        best[state] = min(best[state], index)
+
+    # Breadth first, so the failure link of a state is complete before its children's
+    fail = [0] * len(transitions)
+    queue = deque(transitions[0].values())
+    while queue:
+        state = queue.popleft()
+        for char, child in transitions[state].items():
+            suffix = fail[state]
+            while suffix and char not in transitions[suffix]:
+                suffix = fail[suffix]
+            if state:
+                fail[child] = transitions[suffix].get(char, 0)
+            # A pattern that ends at the suffix also ends here
+            best[child] = min(best[child], best[fail[child]])
+            queue.append(child)
+    return transitions, fail, best
+
+def match_rule(value, compiled):
+    """Index of the highest-priority rule matching value (lowercased), or the number of rules."""
+    (transitions, fail, best), exact, regexes, names = compiled
+    found = exact.get(value, len(names) - 1)
+    state = 0
+    for char in value:
+        while state and char not in transitions[state]:
+            state = fail[state]
+        state = transitions[state].get(char, 0)
+        found = min(found, best[state])
+    for index, regex in regexes:
+        if index >= found:
+            break
+        if regex.search(value):
+            return index
+    return found
+
+def normalize_values(series, rules_path=VALUE_RULES_PATH):
+    """
+    Lowercases series and renames the values the rules of rules_path match; when several
+    rules match, the highest-priority one wins. Each distinct value is matched once and the
+    result is expanded back to the rows through the factorized codes, so the cost grows with
+    the distinct values, not the rows. Missing and non-text values come back missing.
+    """
+    compiled = compile_value_rules(rules_path, _file_sha256(rules_path))
+    names = compiled[-1]
+    codes, uniques = pd.factorize(series)
+    lowered = pd.Series(uniques, dtype=object).str.lower().to_numpy(dtype=object)
+    rules = np.array([
+        match_rule(value, compiled) if isinstance(value, str) else len(names) - 1 for value in lowered
+    ], dtype=np.int64)
+    normalized = np.where(rules < len(names) - 1, names[rules], lowered)
+    # Code -1 (missing) picks the trailing NaN
+    values = np.append(normalized, np.nan)[codes]
+    return pd.Series(values, index=series.index, name=series.name)
+
+def clean_columns(data):
+    """
+    The cleaned columns the dashboards analyse, for the rows of data: average_mrp (the mean of
+    min_mrp and max_mrp), gender with blanks as 'Unknown', and value through normalize_values,
+    as a categorical. Columns whose sources data lacks are left out.
+    """
+    cleaned = pd.DataFrame(index=data.index)
+    if 'min_mrp' in data.columns and 'max_mrp' in data.columns:
+        cleaned['average_mrp'] = data[['min_mrp', 'max_mrp']].astype('float64').round(2).mean(axis=1).round(2)
+    if 'gender' in data.columns:
+        cleaned['gender'] = recode_categories(data['gender'], {"": "Unknown"})
+    if 'value' in data.columns:
+        cleaned['value'] = normalize_values(data['value']).astype('category')
+    return cleaned
+
+def load_cleaned(file_path, sheet_name=None):
+    """
+    The clean_columns of every row of the dataset, by row position. They are derived from the
+    snapshot once per dataset revision, CLEANING_VERSION and version of the value rules, and
+    stored with it in _cleaned.parquet.
+    """
+    def clean(rows):
+        return clean_columns(load_frame(file_path, sheet_name=sheet_name, columns=CLEANING_SOURCE_COLUMNS, rows=rows))
+    return load_derived(file_path, sheet_name, 'cleaned', CLEANING_VERSION, clean,
+                        lambda table, rows: concat_frames([table, clean(rows)]))
+
+def load_vital_facts(file_path, sheet_name=None):
+    """
+    The vitals fact table of the dataset (see vitals.build_facts), built from its cleaned rows
+    once per dataset revision, vitals.FACTS_VERSION and version of the value rules, and
+    stored with the snapshot in _vitals.parquet.
+    """
+    def facts(rows):
+        return vitals.build_facts(load_frame(file_path, sheet_name=sheet_name, columns=vitals.FACT_SOURCE_COLUMNS,
+                                             cleaned=True, rows=rows))
+    return load_derived(file_path, sheet_name, 'vitals', vitals.FACTS_VERSION, facts,
+                        lambda table, rows: concat_frames([table, facts(rows)]))
+
+def load_patient_vitals(file_path, sheet_name=None):
+    """
+    The per-patient vitals matrix of the dataset (see vitals.patient_matrix), pivoted from
+    its vitals fact table once per revision and stored with the snapshot in _patient_vitals.parquet.
+    Appended rows only re-pivot the patients they have readings for.
+    """
+    def extend(matrix, rows):
+        facts = load_vital_facts(file_path, sheet_name)
+        patients = facts.loc[(facts['row'] >= rows.start) & (facts['row'] < rows.stop), 'id'].unique()
+        return concat_frames([matrix[~matrix['id'].isin(patients)],
+                              vitals.patient_matrix(facts[facts['id'].isin(patients)])])
+    return load_derived(file_path, sheet_name, 'patient_vitals', [vitals.FACTS_VERSION, vitals.MATRIX_VERSION],
+                        lambda rows: vitals.patient_matrix(load_vital_facts(file_path, sheet_name)), extend)
+
+def load_vital_bounds(file_path, sheet_name=None):
+    """
+    The quartiles and outlier fences of every vital reading of the dataset (see
+    vitals.robust_bounds), computed once per revision and stored with the snapshot in
+    _vital_bounds.parquet.
+    """
+    return load_derived(file_path, sheet_name, 'vital_bounds',
+                        [vitals.FACTS_VERSION, vitals.MATRIX_VERSION, vitals.BOUNDS_VERSION],
+                        lambda rows: vitals.robust_bounds(load_vital_facts(file_path, sheet_name),
+                                                          load_patient_vitals(file_path, sheet_name)))
+
+def load_vital_cells(file_path, sheet_name=None):
+    """
+    The mergeable summary cells of the vital readings of the dataset (see vitals.build_cells),
+    built once per revision and stored with the snapshot in _vital_cells.parquet. Appended
+    rows only rebuild the cells vitals.split_cells finds stale.
+    """
+    def extend(cells, rows):
+        facts, bounds = load_vital_facts(file_path, sheet_name), load_vital_bounds(file_path, sheet_name)
+        cells, rebuild = vitals.split_cells(cells, facts, bounds, rows)
+        return concat_frames([cells, vitals.build_cells(facts[rebuild], bounds)])
+    return load_derived(file_path, sheet_name, 'vital_cells',
+                        [vitals.FACTS_VERSION, vitals.MATRIX_VERSION, vitals.BOUNDS_VERSION, vitals.CELLS_VERSION],
+                        lambda rows: vitals.build_cells(load_vital_facts(file_path, sheet_name),
+                                                        load_vital_bounds(file_path, sheet_name)), extend)
+
+def load_derived(file_path, sheet_name, name, version, build, extend=None):
+    """
+    The table build(rows) derives from the rows of the dataset (a range of row positions, or
+    None for all of them), stored next to its snapshot as _<name>.parquet and read back
+    until the dataset revision, version or value rules change (built on the fly for URLs).
+    When only the revision changed, records having been appended, extend(table, rows)
+    updates the stored table with the rows past those it was stamped with, if given.
+    """
+    if '://' in file_path:
+        return build(None)
+    manifest = read_manifest(file_path, sheet_name)
+    if manifest is None:
+        load_frame(file_path, sheet_name=sheet_name, columns=[])
+        manifest = read_manifest(file_path, sheet_name) or {}
+    path = snapshot_path(file_path, sheet_name)
+    table_path = os.path.join(path, f'_{name}.parquet')
+    meta_path = os.path.join(path, f'_{name}.json')
+    stamp = {
+        'version': version,
+        'rules': _file_sha256(VALUE_RULES_PATH),
+        'revision': manifest.get('revision', 0),
+        'rows': manifest.get('rows'),
+    }
+    if _read_meta(meta_path) == stamp:
+        return pd.read_parquet(table_path)
+    with single_flight(os.path.join(path, f'_{name}.lock')):
+        # Another session may have built it for this revision while this one waited
+        stored = _read_meta(meta_path) or {}
+        if stored == stamp:
+            return pd.read_parquet(table_path)
+        rows = None if stamp['rows'] is None else range(0, stamp['rows'])
+        if (extend is not None and rows is not None and stored.get('rows') is not None
+                and (stored['version'], stored['rules']) == (stamp['version'], stamp['rules'])
+                and stored['rows'] <= stamp['rows']):
+            table = pd.read_parquet(table_path)
+            if stored['rows'] < stamp['rows']:
+                table = extend(table, range(stored['rows'], stamp['rows']))
+        else:
+            table = build(rows)
+        tmp_path = f"{table_path}.{os.getpid()}.tmp"
+        try:
+            table.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, table_path)
+            _write_meta(meta_path, stamp)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning("Could not store %s table for %s: %s", name, file_path, e)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return table
+
+def with_cleaned(data, cleaned, columns=None):
+    """data with the given columns of cleaned (all for None) replacing or added to its own, row by row."""
+    cleaned = select_columns(cleaned, columns).iloc[data.index.to_numpy()].set_axis(data.index)
+    return data.assign(**{column: cleaned[column] for column in cleaned.columns})
+
+def load_frame(file_path, start_date=None, end_date=None, sheet_name=None, columns=None, cleaned=False,
+               rows=None):
+    """
+    Loads a dataset through the snapshot layer: the raw file is parsed once and
+    every later cold start reads the typed Parquet snapshot written next to it.
+    Given a date range, only the months of start_time overlapping it are loaded; rows
+    still need filtering to the exact dates. Given columns, only those are loaded
+    (the ones the dataset lacks are skipped), e.g. project_columns of the views shown.
+    Given rows, a range of row positions, only those rows are loaded, by position.
+    With cleaned, the clean_columns of load_cleaned take the place of the raw ones.
+    """
+    if cleaned:
+        cleaned_columns = load_cleaned(file_path, sheet_name)
+        raw_columns = None if columns is None else [
+            column for column in columns if column not in cleaned_columns.columns
+        ]
+        data = load_frame(file_path, start_date, end_date, sheet_name, raw_columns, rows=rows)
+        return with_cleaned(data, cleaned_columns, columns)
+
+    # The file_path parameter can be a URL; there is nowhere to keep a snapshot for those.
+    if '://' in file_path:
+        data = select_months(ingest(read_source(file_path, sheet_name)), start_date, end_date)
+        return select_columns(select_rows(data, rows), columns)
+
+    data = read_snapshot(file_path, start_date, end_date, sheet_name, columns, rows)
+    if data is not None:
+        return data
+    with single_flight(snapshot_path(file_path, sheet_name) + '.lock'):
+        # Another session may have built the snapshot while this one waited
+        data = read_snapshot(file_path, start_date, end_date, sheet_name, columns, rows)
+        if data is None:
+            data = ingest(read_source(file_path, sheet_name))
+            write_snapshot(data, file_path, sheet_name)
+            data = select_columns(select_rows(select_months(data, start_date, end_date), rows), columns)
+    return data
+
+def uses_columns(*columns):
+    """Declares the dataset columns a dashboard view or filter reads, for project_columns."""
+    def declare(view):
+        view.columns = list(columns)
+        return view
+    return declare
+
+def project_columns(*views):
+    """The columns any of views declared with uses_columns, in first-declared order."""
+    return tuple(dict.fromkeys(column for view in views for column in view.columns))
+
+def select_columns(data, columns=None):
+    """The given columns of data that it has, in its own order; all of them for None."""
+    if columns is None:
+        return data
+    return data[[column for column in data.columns if column in columns]]
+
+def select_rows(data, rows=None):
+    """The rows of data whose position is in the range rows; all of them for None."""
+    if rows is None:
+        return data
+    return data[(data.index >= rows.start) & (data.index < rows.stop)]
+
+def build_snapshot(file_path, sheet_name=None):
+    """Writes the snapshot of file_path unless a fresh one exists. Safe to run in a worker process."""
+    with single_flight(snapshot_path(file_path, sheet_name) + '.lock'):
+        if read_manifest(file_path, sheet_name) is None:
+            write_snapshot(ingest(read_source(file_path, sheet_name)), file_path, sheet_name)
+
+def convert_sheet(file_path, sheet_name=None):
+    """
+    Parses one workbook sheet and writes its snapshot, so later loads skip openpyxl.
+    Returns the number of rows converted. Safe to run in a worker process.
+    """
+    with single_flight(snapshot_path(file_path, sheet_name) + '.lock'):
+        data = ingest(read_source(file_path, sheet_name))
+        write_snapshot(data, file_path, sheet_name)
+    return len(data)
+
+def combine_sources(sources, download_dir=DOWNLOAD_DIR):
+    """
+    Returns a local dataset holding the rows of every source, for the loaders to treat like
+    a single download. sources are URLs, or {'url': ..., 'client': ..., 'project': ...}
+    entries whose tags are added as columns (unless the export already has them).
+
+    Sources are downloaded in a pool of SOURCE_WORKERS threads, and the ones without a
+    snapshot yet are parsed in as many processes, so startup takes as long as the slowest
+    source rather than their sum. The combined file is named after the downloaded
+    contents, so it is only rebuilt when one of them changes, and then only the changed
+    source is parsed again.
+    """
+    sources = [dict(source) if isinstance(source, dict) else {'url': source} for source in sources]
+    with ThreadPoolExecutor(max_workers=SOURCE_WORKERS) as executor:
+        paths = list(executor.map(lambda source: download_dataset(source['url'], download_dir), sources))
+    tags = [{tag: source[tag] for tag in SOURCE_TAGS if source.get(tag) is not None} for source in sources]
+    digest = hashlib.sha256(json.dumps([paths, tags]).encode()).hexdigest()[:16]
+    combined_path = os.path.join(download_dir, COMBINED_DIR, f"{digest}.parquet")
+    if os.path.exists(combined_path):
+        return combined_path
+
+    os.makedirs(os.path.dirname(combined_path), exist_ok=True)
+    with single_flight(combined_path + '.lock'):
+        if os.path.exists(combined_path):
+            return combined_path
+        # Parsing is CPU-bound, so it runs in processes; the snapshots are then read in threads
+        unparsed = list(dict.fromkeys(path for path in paths if read_manifest(path) is None))
+        processes = min(SOURCE_WORKERS, len(unparsed), os.cpu_count() or 1)
+        if processes > 1:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                list(executor.map(build_snapshot, unparsed))
+        with ThreadPoolExecutor(max_workers=SOURCE_WORKERS) as executor:
+            frames = [
+                tag_frame(data.reset_index(drop=True), source_tags)
+                for data, source_tags in zip(executor.map(load_frame, paths), tags)
+            ]
+        _write_combined(concat_frames(frames), combined_path)
+    logger.info("Combined %d sources into %s", len(sources), combined_path)
+    return combined_path
+
+def tag_frame(data, tags):
+    """data with a categorical column per tag it does not have yet, holding the tag value."""
+    for column in SOURCE_TAGS:
+        if column in data.columns:
+            data[column] = data[column].astype('category')
+        elif column in tags:
+            data[column] = pd.Categorical.from_codes(np.zeros(len(data), dtype=np.int8), [tags[column]])
+    return data
+
+def concat_frames(frames):
+    """
+    pd.concat of ingested frames that keeps categorical columns categorical, on the union
+    of the categories of every frame (plain concat falls back to object for differing ones).
+    A column missing from some frames is missing (NaN) in their rows.
+    """
+    columns = list(dict.fromkeys(column for frame in frames for column in frame.columns))
+    for column in columns:
+        present = [frame[column].dtype for frame in frames if column in frame.columns]
+        if not all(isinstance(dtype, pd.CategoricalDtype) for dtype in present) or (
+                len(present) == len(frames) and all(dtype == present[0] for dtype in present)):
+            # Identical categoricals concatenate as they are, ordered ones staying ordered
+            continue
+        categories = pd.Index(pd.unique(np.concatenate([dtype.categories.to_numpy(dtype=object) for dtype in present])))
+        dtype = pd.CategoricalDtype(categories)
+        frames = [
+            frame.assign(**{column: frame[column].cat.set_categories(categories) if column in frame.columns
+                            else pd.Categorical.from_codes(np.full(len(frame), -1), dtype=dtype)})
+            for frame in frames
+        ]
+    return pd.concat(frames, ignore_index=True)[columns]
+
+def _write_combined(data, combined_path):
+    tmp_path = f"{combined_path}.{os.getpid()}.tmp"
+    try:
+        data.to_parquet(tmp_path, index=False)
+    except (TypeError, ValueError):
+        # Exports can disagree on a column's type (e.g. numeric and text pincodes)
+        data.pipe(_stringify_mixed_columns).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, combined_path)
+
+def download_dataset(file_url, download_dir=DOWNLOAD_DIR, session=None):
+    """
+    Returns a local copy of file_url, fetching it again only when it changed upstream.
+
+    The cache is keyed on the URL, and each copy is named after its content hash, so
+    snapshots and cached frames built from an old copy are never reused for a new one.
+    Revalidation is a conditional GET (If-None-Match / If-Modified-Since): an unchanged
+    file costs a single 304. If the server cannot be reached, the cached copy is used.
+    New content is streamed to a partial file that survives interruptions and is only
+    renamed into place once it is complete.
+    """
+    http = session or requests
+    cache_dir = os.path.join(download_dir, hashlib.sha256(file_url.encode()).hexdigest()[:16])
+    os.makedirs(cache_dir, exist_ok=True)
+    # One session downloads while concurrent ones wait, then find the fresh meta.json
+    with single_flight(os.path.join(cache_dir, '.lock')):
+        return _download_locked(http, file_url, cache_dir)
+
+def _download_locked(http, file_url, cache_dir):
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    meta = _read_meta(meta_path)
+    cached_path = os.path.join(cache_dir, meta['filename']) if meta else None
+    if cached_path and not os.path.exists(cached_path):
+        meta, cached_path = {}, None
+
+    if cached_path and time.time() - meta.get('checked_at', 0) < REVALIDATE_SECONDS:
+        return cached_path
+
+    headers = {}
+    if cached_path and meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if cached_path and meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+
+    part_path = os.path.join(cache_dir, 'download.part')
+    try:
+        response_headers = _stream_download(http, file_url, headers, part_path)
+    except requests.exceptions.RequestException as e:
+        if not cached_path:
+            raise
+        logger.warning("Could not revalidate %s, using cached copy: %s", file_url, e)
+        return cached_path
+
+    if response_headers is None:
+        meta['checked_at'] = time.time()
+        _write_meta(meta_path, meta)
+        return cached_path
+
+    digest = _file_sha256(part_path)
+    filename = f"{digest[:16]}-{os.path.basename(urlparse(file_url).path) or 'downloaded_file'}"
+    local_file_path = os.path.join(cache_dir, filename)
+    # Same content under a new ETag: keep the existing copy so its snapshot stays fresh
+    if os.path.exists(local_file_path):
+        os.remove(part_path)
+    else:
+        os.replace(part_path, local_file_path)
+    os.remove(part_path + '.json')
+
+    _write_meta(meta_path, {
+        'url': file_url,
+        'filename': filename,
+        'sha256': digest,
+        'etag': response_headers.get('ETag'),
+        'last_modified': response_headers.get('Last-Modified'),
+        'checked_at': time.time(),
+    })
+    _remove_stale_copies(cache_dir, filename)
+    return local_file_path
+
+def _stream_download(http, file_url, headers, part_path):
+    """
+    Streams file_url into part_path DOWNLOAD_CHUNK_BYTES at a time and returns the
+    response headers, or None when the server answers 304 Not Modified.
+
+    A partial file left by a dropped connection (in this call or an earlier run) is
+    resumed with a Range request. If-Range makes the server send the whole file again
+    instead when it changed in between, so a resumed file is never stitched together
+    from two versions.
+    """
+    part_meta_path = part_path + '.json'
+    started = time.time()
+    received = 0
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        received_before = received
+        request_headers = dict(headers)
+        validator = _read_meta(part_meta_path).get('validator')
+        offset = os.path.getsize(part_path) if validator and os.path.exists(part_path) else 0
+        if offset:
+            request_headers['Range'] = f'bytes={offset}-'
+            request_headers['If-Range'] = validator
+        try:
+            with http.get(file_url, headers=request_headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                if response.status_code == 304:
+                    return None
+                response.raise_for_status()
+                if response.status_code != 206:
+                    offset = 0
+                elif not response.headers.get('Content-Range', '').startswith(f'bytes {offset}-'):
+                    # The server sent a different range than asked for; start over
+                    os.remove(part_meta_path)
+                    continue
+                # Weak ETags cannot be used in If-Range
+                etag = response.headers.get('ETag')
+                validator = etag if etag and not etag.startswith('W/') else response.headers.get('Last-Modified')
+                _write_meta(part_meta_path, {'url': file_url, 'validator': validator})
+                if offset:
+                    logger.info("Resuming download of %s at %.1f MB", file_url, offset / 1e6)
+                with open(part_path, 'ab' if offset else 'wb') as f:
+                    for chunk in response.iter_content(DOWNLOAD_CHUNK_BYTES):
+                        f.write(chunk)
+                        received += len(chunk)
+                elapsed = time.time() - started
+                logger.info(
+                    "Downloaded %s: %.1f MB in %.1fs (%.1f MB/s, %d attempt(s))",
+                    file_url, received / 1e6, elapsed, received / 1e6 / max(elapsed, 1e-6), attempt + 1,
+                )
+                return response.headers
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.Timeout) as e:
+            # Only a transfer that was making progress is retried; an unreachable server is not
+            if attempt == DOWNLOAD_RETRIES or received == received_before:
+                raise
+            logger.warning("Download of %s interrupted after %.1f MB, retrying: %s", file_url, received / 1e6, e)
+            time.sleep(DOWNLOAD_RETRY_DELAY * (attempt + 1))
+
+def _file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(DOWNLOAD_CHUNK_BYTES), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_meta(meta_path, meta):
+    tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+def _remove_stale_copies(cache_dir, filename):
+    """Deletes older downloads of the same URL together with the snapshots derived from them."""
+    for name in os.listdir(cache_dir):
+        if name in ('meta.json', '.lock') or name.startswith(filename) or name.startswith('download.part'):
+            continue
+        path = os.path.join(cache_dir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
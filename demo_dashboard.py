@@ -2,38 +2,39 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 from datetime import datetime
-import os
+
+from data_store import load_frame, load_patient_vitals, normalize_values
+import sql_backend
 
 
 @st.cache_data
 def load_data(file_path):
-    file_extension = os.path.splitext(file_path)[1].lower()
+    return load_frame(file_path)
 
-    if file_extension == '.csv':
-        return pd.read_csv(file_path)
-    elif file_extension in ['.xls', '.xlsx']:
-        return pd.read_excel(file_path)
-    else:
-        raise ValueError("Unsupported file format. Please provide a CSV or Excel file.")
-    # The file_path parameter can be a URL. No additional code needed.
+@st.cache_resource
+def load_vitals_matrix(file_path):
+    # One row per patient with the latest reading of each vital, pivoted once per dataset revision
+    return load_patient_vitals(file_path)
 
 def load_state_coordinates(file_path):
     return pd.read_csv(file_path)
 
 def clean_medical_data(data):
-    data['average_mrp'] = data[['min_mrp', 'max_mrp']].mean(axis=1).round(2)
-    data['value'] = data['value'].str.lower().apply(lambda x: "pain in abdomen" if "pain in abd" in str(x) else x)
-    replacements = {
-        'cbc': 'cbc',
-        'urine': 'urine',
-        'hbsag': 'hbsag',
-    }
-    for key, value in replacements.items():
-        data['value'] = data['value'].str.lower().apply(lambda x: key if value in str(x) else x)
+    data['average_mrp'] = data[['min_mrp', 'max_mrp']].astype('float64').round(2).mean(axis=1).round(2)
+    data['value'] = normalize_values(data['value'])
     return data
 
 def apply_filters(data, state_filter=None, city_filter=None, pincode_filter=None, speciality_filter=None):
-    filtered_data = data.copy()
+    if sql_backend.BACKEND:
+        # The single-valued filters run as one SQL query; pincode values are split here
+        filtered_data = sql_backend.filter_rows(data, {
+            'state_name': state_filter,
+            'city': city_filter,
+            'speciality': speciality_filter,
+        })
+        state_filter = city_filter = speciality_filter = None
+    else:
+        filtered_data = data.copy()
     if state_filter:
         filtered_data = filtered_data[filtered_data['state_name'].isin(state_filter)]
     if city_filter:
@@ -56,7 +57,9 @@ def display_sidebar_totals(filtered_data):
     st.sidebar.metric("Total Patients", total_patients)
 
 def aggregate_geo_data(data, group_by_column, count_column):
-    aggregated_data = data.groupby(group_by_column)[count_column].nunique().reset_index()
+    if sql_backend.BACKEND:
+        return sql_backend.aggregate_geo_data(data, group_by_column, count_column)
+    aggregated_data = data.groupby(group_by_column, observed=True)[count_column].nunique().reset_index()
     aggregated_data.columns = [group_by_column, 'count']
     aggregated_data = aggregated_data.sort_values(by='count', ascending=False)
     return aggregated_data
@@ -99,6 +102,8 @@ def create_pie_chart(data, names_column, values_column, title=None,color_map=Non
     )
 
 def get_top_items(data, value_column, item_type):
+    if sql_backend.BACKEND:
+        return sql_backend.get_top_items(data, value_column, item_type)
     top_items = (
         data[data['type'] == item_type][value_column]
         .str.upper()
@@ -110,6 +115,8 @@ def get_top_items(data, value_column, item_type):
     return top_items
 
 def analyze_observation_by_gender(data):
+    if sql_backend.BACKEND:
+        return sql_backend.count_by_gender(data, 'Observation')
     observation_gender = (
         data[data['type'] == 'Observation']
         .dropna(subset=['value', 'gender'])
@@ -125,6 +132,8 @@ def analyze_observation_by_gender(data):
     return observation_gender
 
 def analyze_diagnostics_by_gender(data):
+    if sql_backend.BACKEND:
+        return sql_backend.count_by_gender(data, 'Diagnostic')
     diagnostics_gender = (
         data[data['type'] == 'Diagnostic']
         .dropna(subset=['value', 'gender'])
@@ -200,7 +209,7 @@ def visualize_data_types(tab, data):
             with col2:
                 st.dataframe(type_counts)
         with st.expander("Distribution of Speciality Doctors"):
-            speciality_counts = data.groupby('speciality')['doctor_id'].nunique().reset_index()
+            speciality_counts = data.groupby('speciality', observed=True)['doctor_id'].nunique().reset_index()
             speciality_counts.columns = ['Speciality', 'Count']
 
             col1, col2 = st.columns([2, 1])
@@ -555,7 +564,7 @@ def visualize_market_share_primary_use(tab, data):
 
         # Calculate the market share of each manufacturer
         manufacturer_market_share = (
-            filtered_data.groupby('manufacturers')
+            filtered_data.groupby('manufacturers', observed=True)
             .agg(Medicine_Count=('value', 'count'))
             .reset_index()
         )
@@ -586,25 +595,29 @@ def visualize_market_share_primary_use(tab, data):
         else:
             st.warning("No data available for the selected primary use.")
 
-def visualize_vitals(tab, data):
+def visualize_vitals(tab, data, vitals_matrix):
     """
     Creates a tab for displaying the distribution of vitals for patients.
     """
     with tab:
         st.subheader("Vitals Distribution")
 
+        # The latest vitals of the patients in the filtered data, one row per patient
+        data = vitals_matrix[vitals_matrix['id'].isin(data['id'])]
+
         # List of vitals to include
         vitals = [
-            'Blood pressure (BP)', 'Height', 'Oxygen saturation (SpO2)', 
-            'Pulse', 'Random Blood Sugar (RBS)', 'Respiration rate', 
-            'Temperature', 'Weight'
+            'Systolic BP', 'Diastolic BP', 'Mean arterial pressure (MAP)', 'Height', 'Weight', 'BMI',
+            'Oxygen saturation (SpO2)', 'Pulse', 'Random Blood Sugar (RBS)', 'Respiration rate',
+            'Temperature'
         ]
 
-        # Check if all vitals are present in the dataset
-        available_vitals = [vital for vital in vitals if vital in data.columns]
+        # Only the vitals with at least one reading for the selected patients
+        available_vitals = [vital for vital in vitals if vital in data.columns and data[vital].notna().any()]
 
         if not available_vitals:
-            st.warning("No vital columns found in the dataset.")
+            st.info("No vital readings are available for the selected patients: none of their vital "
+                    "values could be read as a measurement.")
             return
 
         # Display a toggle for each vital
@@ -613,10 +626,6 @@ def visualize_vitals(tab, data):
                 # Filter non-NaN values for the vital
                 vital_data = data[vital].dropna()
 
-                if vital_data.empty:
-                    st.info(f"No data available for {vital}.")
-                    continue
-
                 # Histogram for the vital
                 fig = px.histogram(
                     vital_data,
@@ -640,15 +649,18 @@ def visualize_value_comparison(tab, data):
         st.subheader("Value-Based Manufacturer Comparison")
 
         # Group data by manufacturers
-        manufacturer_comparison = (
-            data.groupby('manufacturers')
-            .agg(
-                Total_Value=('average_mrp', 'sum'),  # Replace with relevant column
-                Average_Value=('average_mrp', 'mean'),  # Replace with relevant column
-                Patient_Count=('id', 'nunique')
+        if sql_backend.BACKEND:
+            manufacturer_comparison = sql_backend.value_comparison(data)
+        else:
+            manufacturer_comparison = (
+                data.groupby('manufacturers', observed=True)
+                .agg(
+                    Total_Value=('average_mrp', 'sum'),  # Replace with relevant column
+                    Average_Value=('average_mrp', 'mean'),  # Replace with relevant column
+                    Patient_Count=('id', 'nunique')
+                )
+                .reset_index()
             )
-            .reset_index()
-        )
 
         # Get top 20 for charts
         top_20 = manufacturer_comparison.sort_values(by='Total_Value', ascending=False).head(20)
@@ -771,6 +783,7 @@ def main():
     # Load datasets
     
     medical_data = load_data(r"Generated_Random_Dataset.csv")
+    vitals_matrix = load_vitals_matrix(r"Generated_Random_Dataset.csv")
 
     # Sidebar filters for patient data
     # Sidebar filters for patient data
@@ -850,7 +863,7 @@ def main():
 
 
     # Visualization Tabs
-    tab1, tab2, tab3, tab4,tab5,tab6,tab7,tab8,tab9,tab10,tab11  = st.tabs([
+    tab1, tab2, tab3, tab4,tab5,tab6,tab7,tab8,tab9,tab10,tab11,tab12  = st.tabs([
         "🏷️ Manufacturer Analysis",
         "📂 Data Types within Rx",
         "📍 Geographical Distribution",
@@ -861,7 +874,8 @@ def main():
         "🧪 Diagnostics",
         "🔍 Manufacturer Comparison",
         "💰 Value-Based Comparison",
-        "🏭 Market Share by primary use"
+        "🏭 Market Share by primary use",
+        "🩸 Vitals"
     ])
     display_sidebar_totals(filtered_medical_data)
 
@@ -878,6 +892,7 @@ def main():
     manufacturer_comparison_tab(tab9, filtered_medical_data)
     visualize_value_comparison(tab10, filtered_medical_data)
     visualize_market_share_primary_use(tab11, filtered_medical_data)
+    visualize_vitals(tab12, filtered_medical_data, vitals_matrix)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,368 @@
+"""
+Generates a synthetic Rx export with the schema of Generated_Random_Dataset.csv at any size,
+for benchmarks and load tests. Manufacturers, medicines, observations and doctors follow
+Zipfian popularity; some doctors list several states, cities or pincodes (', ' or '/'
+separated); medicines carry 1-3 primary uses joined with ' | '; and vitals are free text
+with the unit spellings and junk readings the real exports have. Rows are generated and
+written GENERATE_CHUNK_ROWS at a time, so 50M rows never sit in memory at once. The same
+seed always gives the same file.
+
+    python generate_dataset.py 1M                            # generated/rx_1000000.csv
+    python generate_dataset.py 10M --format csv json parquet --seed 7
+    python generate_dataset.py 100k --output data/rx_100k
+"""
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+GENERATE_CHUNK_ROWS = 1_000_000
+FORMATS = ['csv', 'json', 'parquet']
+# Column order of the exports
+COLUMNS = [
+    'row_number', 'ptp_id', 'start_time', 'doctor_id', 'speciality', 'zone', 'state_name',
+    'all_city_group', 'city', 'pincode', 'id', 'age', 'gender', 'type', 'value', 'vital_type',
+    'min_mrp', 'max_mrp', 'primary_use', 'manufacturers',
+]
+PARQUET_SCHEMA = pa.schema(
+    [('row_number', pa.int64())]
+    + [(column, pa.string()) for column in COLUMNS[1:11]]
+    + [('age', pa.int16())]
+    + [(column, pa.string()) for column in COLUMNS[12:16]]
+    + [('min_mrp', pa.float64()), ('max_mrp', pa.float64())]
+    + [(column, pa.string()) for column in COLUMNS[18:]]
+)
+
+# Entity counts per generated row; every dataset has at least the minimum
+ROWS_PER_DOCTOR = 500
+ROWS_PER_PATIENT = 12
+MIN_DOCTORS = 50
+MIN_PATIENTS = 500
+# Exponent of the Zipf weights (rank ** -ZIPF_EXPONENT) of every skewed choice
+ZIPF_EXPONENT = 1.1
+# Items per prescription (ptp_id) are 1 + Poisson(PRESCRIPTION_ITEMS)
+PRESCRIPTION_ITEMS = 3
+MULTI_VALUE_SHARE = 0.05
+MISSING_SHARE = 0.02
+JUNK_VITAL_SHARE = 0.03
+TYPE_SHARES = {'Medicine': 0.55, 'Observation': 0.18, 'Diagnostic': 0.12, 'Vital': 0.15}
+
+SPECIALITIES = [
+    'Consulting Physician', 'General Physician', 'Gynaecologist', 'Dermatologist', 'Cardiologist',
+    'Paediatrician', 'Orthopedic', 'ENT', 'Neurologist', 'Diabetologist', 'Pulmonologist', 'Psychiatrist',
+]
+# state: (zone, {city: (all_city_group, first pincode)})
+GEOGRAPHY = {
+    'Maharashtra': ('Western', {'Mumbai': ('Mumbai Metropolitan', 400001), 'Thane': ('Mumbai Metropolitan', 400601),
+                                'Pune': ('Pune', 411001), 'Nagpur': ('Nagpur', 440001)}),
+    'Gujarat': ('Western', {'Ahmedabad': ('Ahmedabad', 380001), 'Surat': ('Surat', 395001),
+                            'Vadodara': ('Vadodara', 390001)}),
+    'Karnataka': ('Southern', {'Bangalore': ('Bangalore Urban', 560001), 'Mysore': ('Mysore', 570001),
+                               'Mangalore': ('Mangalore', 575001)}),
+    'Tamil Nadu': ('Southern', {'Chennai': ('Chennai Metropolitan', 600001), 'Coimbatore': ('Coimbatore', 641001),
+                                'Madurai': ('Madurai', 625001)}),
+    'Telangana': ('Southern', {'Hyderabad': ('Hyderabad Metropolitan', 500001), 'Warangal': ('Warangal', 506001)}),
+    'Kerala': ('Southern', {'Kochi': ('Kochi', 682001), 'Thiruvananthapuram': ('Thiruvananthapuram', 695001)}),
+    'West Bengal': ('Eastern', {'Kolkata': ('Kolkata Metropolitan', 700001), 'Howrah': ('Kolkata Metropolitan', 711101),
+                                'Durgapur': ('Durgapur', 713201)}),
+    'Odisha': ('Eastern', {'Bhubaneswar': ('Bhubaneswar', 751001), 'Cuttack': ('Cuttack', 753001)}),
+    'Bihar': ('Eastern', {'Patna': ('Patna', 800001), 'Gaya': ('Gaya', 823001)}),
+    'Uttar Pradesh': ('Northern', {'Lucknow': ('Lucknow', 226001), 'Noida': ('Delhi NCR', 201301),
+                                   'Ghaziabad': ('Delhi NCR', 201001), 'Kanpur': ('Kanpur', 208001)}),
+    'Delhi': ('Northern', {'New Delhi': ('Delhi NCR', 110001), 'Delhi': ('Delhi NCR', 110006)}),
+    'Punjab': ('Northern', {'Ludhiana': ('Ludhiana', 141001), 'Amritsar': ('Amritsar', 143001)}),
+    'Rajasthan': ('Northern', {'Jaipur': ('Jaipur', 302001), 'Jodhpur': ('Jodhpur', 342001)}),
+    'Madhya Pradesh': ('Central', {'Indore': ('Indore', 452001), 'Bhopal': ('Bhopal', 462001)}),
+    'Chhattisgarh': ('Central', {'Raipur': ('Raipur', 492001)}),
+}
+PINCODES_PER_CITY = 12
+
+MANUFACTURERS = [
+    'Sun Pharma', 'Cipla', 'LUPIN LTD', 'Mankind Pharma', 'Alkem Laboratories', 'Dr. Reddys Laboratories',
+    'Zydus Lifesciences', 'Torrent Pharmaceuticals', 'Glaxo SmithKline Pharmaceuticals Ltd', 'Abbott India',
+    'Intas Pharmaceuticals', 'Glenmark Pharmaceuticals', 'Macleods Pharmaceuticals', 'Micro Labs', 'Pfizer',
+    'Novartis', 'Sanofi India', 'Ipca Laboratories', 'Aristo Pharmaceuticals', 'Emcure Pharmaceuticals',
+    'USV', 'Ajanta Pharma', 'Wockhardt', 'Biocon', 'Franco-Indian Pharmaceuticals', 'Koye Pharmaceuticals',
+    'Eris Lifesciences', 'Indoco Remedies', 'Jagsonpal Pharmaceuticals', 'FDC Ltd',
+]
+PRIMARY_USES = [
+    'Pain relief', 'Fever', 'Allergy treatment', 'Diabetes management', 'Heart health', 'Hypertension',
+    'Bacterial infections', 'Bacterial skin infections', 'Fungal infections', 'Acidity', 'Vitamin deficiency',
+    'Cough and cold', 'Asthma', 'Thyroid disorder', 'Anxiety', 'Depression', 'Inflammation', 'Nausea',
+    'Anemia', 'Osteoporosis', 'Cholesterol', 'Constipation', 'Diarrhoea', 'Migraine', 'Acne', 'Eczema',
+    'Psoriasis', 'Pregnancy supplement', 'Menstrual disorders', 'Infertility',
+]
+# Medicine names are '<prefix><suffix> <strength> <form>'
+MEDICINE_PREFIXES = [
+    'Amlo', 'Panto', 'Azi', 'Cefi', 'Dolo', 'Metfo', 'Telmi', 'Rosu', 'Atorva', 'Levo', 'Monte', 'Cetri',
+    'Ome', 'Rabe', 'Domi', 'Ondi', 'Para', 'Ibu', 'Diclo', 'Aceclo', 'Glimi', 'Vilda', 'Sita', 'Dapa',
+    'Empa', 'Losa', 'Olme', 'Bisop', 'Meto', 'Clopi', 'Predni', 'Deflaz', 'Thyro', 'Escita', 'Sertra',
+    'Clona', 'Alpra', 'Fluco', 'Itra', 'Terbi', 'Mupi', 'Fusi', 'Clobe', 'Beta', 'Calci', 'Ferro', 'Folvi',
+    'Progest', 'Duphas', 'Letro',
+]
+MEDICINE_SUFFIXES = ['', 'zole', 'mycin', 'pril', 'sartan', 'statin', 'cin', 'fen', 'nac', 'pride', 'gliptin',
+                     'flozin', 'lol', 'grel', 'sone', 'pram', 'line', 'pam', 'conazole', 'ton']
+MEDICINE_STRENGTHS = ['5', '10', '20', '25', '40', '50', '100', '250', '500', '650', '1000']
+MEDICINE_FORMS = ['Tablet', 'Tab', 'Capsule', 'Cap', 'Syrup', 'Cream', 'Injection', 'Drops', 'Gel', 'Suspension']
+# Free-text entries come in the spellings doctors type; clean_medical_data folds most of them
+OBSERVATIONS = [
+    'Fever', 'fever', 'Cough', 'cough with sputum', 'Headache', 'Pain in abdomen', 'pain in abd', 'Pain in Abd.',
+    'Body ache', 'Cold', 'Vomiting', 'Nausea', 'Loose motion', 'Weakness', 'Giddiness', 'Chest pain',
+    'Breathlessness', 'Joint pain', 'Back pain', 'Knee pain', 'Burning micturition', 'Itching', 'Rash',
+    'Acne', 'Hair fall', 'White discharge', 'Irregular periods', 'Sore throat', 'Acidity', 'Constipation',
+    'Swelling of feet', 'Palpitations', 'Insomnia', 'Anxiety', 'Loss of appetite', 'Weight loss',
+]
+DIAGNOSTICS = [
+    'CBC', 'cbc', 'Complete Blood Count (CBC)', 'CBC with ESR', 'Urine routine', 'urine R/M', 'Urine culture',
+    'HbsAg', 'HBsAg (rapid)', 'Lipid profile', 'LFT', 'KFT', 'Thyroid profile', 'TSH', 'HbA1c', 'FBS', 'PPBS',
+    'RBS', 'Vitamin D', 'Vitamin B12', 'Serum creatinine', 'ECG', '2D Echo', 'X-ray chest', 'USG abdomen',
+    'USG pelvis', 'Dengue NS1', 'Widal', 'Malaria antigen', 'CRP', 'ESR', 'Serum iron', 'HIV', 'VDRL',
+]
+# vital_type: share of vital rows
+VITALS = {
+    'Blood pressure (BP)': 0.3, 'Pulse': 0.2, 'Weight': 0.2, 'Oxygen saturation (SpO2)': 0.12,
+    'Temperature': 0.1, 'Height': 0.05, 'Respiratory Rate': 0.03,
+}
+JUNK_VITALS = ['', 'NA', 'N/A', 'nil', 'normal', '-', 'abc', '0', '999']
+
+
+def parse_rows(text):
+    """'100k', '1M', '2.5m' or '1000' as a row count."""
+    scale = {'k': 1_000, 'm': 1_000_000}.get(text[-1:].lower(), 1)
+    number = text[:-1] if scale > 1 else text
+    try:
+        return int(float(number) * scale)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a row count: {text}")
+
+def zipf_choice(rng, options, size):
+    """size draws from options, the first ones the most popular (Zipf weights by position)."""
+    weights = np.arange(1, len(options) + 1, dtype=float) ** -ZIPF_EXPONENT
+    return np.asarray(options, dtype=object)[rng.choice(len(options), size, p=weights / weights.sum())]
+
+def random_uuids(rng, size):
+    """size random version-4 UUID strings."""
+    raw = rng.integers(0, 256, size=(size, 16), dtype=np.uint8)
+    raw[:, 6] = raw[:, 6] & 0x0F | 0x40
+    raw[:, 8] = raw[:, 8] & 0x3F | 0x80
+    digits = np.frombuffer(raw.tobytes().hex().encode(), dtype=np.uint8).reshape(size, 32)
+    dash = np.full((size, 1), ord('-'), dtype=np.uint8)
+    text = np.hstack([digits[:, :8], dash, digits[:, 8:12], dash, digits[:, 12:16], dash,
+                      digits[:, 16:20], dash, digits[:, 20:]])
+    return np.ascontiguousarray(text).view('S36').ravel().astype(str).astype(object)
+
+def join_second_value(rng, first, second, share=MULTI_VALUE_SHARE):
+    """first, with second appended as ', ' or '/' separated extra value in share of the entries."""
+    joined = first.copy()
+    extra = (rng.random(len(first)) < share) & (first != second)
+    separators = np.where(rng.random(extra.sum()) < 0.5, ', ', '/')
+    joined[extra] = first[extra] + separators + second[extra]
+    return joined
+
+def make_doctors(rng, count):
+    """Doctor attributes; a few practise in two places and list both."""
+    places = [(state, zone, city, group, first_pin)
+              for state, (zone, cities) in GEOGRAPHY.items()
+              for city, (group, first_pin) in cities.items()]
+    place_table = pd.DataFrame(places, columns=['state_name', 'zone', 'city', 'all_city_group', 'first_pin'])
+    home = place_table.iloc[zipf_choice(rng, np.arange(len(places)), count).astype(int)].reset_index(drop=True)
+    away = place_table.iloc[rng.integers(0, len(places), count)].reset_index(drop=True)
+    home_pin = (home['first_pin'] + rng.integers(0, PINCODES_PER_CITY, count)).astype(str).to_numpy(dtype=object)
+    away_pin = (away['first_pin'] + rng.integers(0, PINCODES_PER_CITY, count)).astype(str).to_numpy(dtype=object)
+    return pd.DataFrame({
+        'doctor_id': random_uuids(rng, count),
+        'speciality': zipf_choice(rng, SPECIALITIES, count),
+        'zone': home['zone'].to_numpy(dtype=object),
+        'state_name': join_second_value(rng, home['state_name'].to_numpy(dtype=object),
+                                        away['state_name'].to_numpy(dtype=object)),
+        'all_city_group': home['all_city_group'].to_numpy(dtype=object),
+        'city': join_second_value(rng, home['city'].to_numpy(dtype=object), away['city'].to_numpy(dtype=object)),
+        'pincode': join_second_value(rng, home_pin, away_pin),
+    })
+
+def make_patients(rng, count):
+    age = np.clip(rng.normal(42, 18, count), 0, 95).round().astype(float)
+    age[rng.random(count) < MISSING_SHARE] = np.nan
+    gender = rng.choice(np.array(['FEMALE', 'MALE', ''], dtype=object), count, p=[0.52, 0.46, 0.02])
+    return pd.DataFrame({'id': random_uuids(rng, count), 'age': pd.array(age, dtype='Int16'), 'gender': gender})
+
+def make_medicines(rng):
+    """The medicine catalog: one row per name, in popularity order."""
+    stems = np.array([prefix + suffix for prefix in MEDICINE_PREFIXES for suffix in MEDICINE_SUFFIXES], dtype=object)
+    # Each stem is sold in a few strengths and forms
+    stems = np.repeat(stems, 3)
+    names = pd.unique(stems + ' ' + rng.choice(np.array(MEDICINE_STRENGTHS, dtype=object), len(stems))
+                      + ' ' + rng.choice(np.array(MEDICINE_FORMS, dtype=object), len(stems)))
+    names = names[rng.permutation(len(names))]
+    count = len(names)
+    uses = np.array(PRIMARY_USES, dtype=object)
+    primary_use = uses[rng.integers(0, len(uses), count)]
+    for extra_uses in (rng.random(count) < 0.3, rng.random(count) < 0.1):
+        primary_use[extra_uses] = primary_use[extra_uses] + ' | ' + uses[rng.integers(0, len(uses), extra_uses.sum())]
+    min_mrp = rng.lognormal(4.5, 0.9, count).round(2)
+    return pd.DataFrame({
+        'value': names,
+        'manufacturers': zipf_choice(rng, MANUFACTURERS, count),
+        'primary_use': primary_use,
+        'min_mrp': min_mrp,
+        'max_mrp': (min_mrp * rng.uniform(1.0, 2.5, count)).round(2),
+    })
+
+def vital_readings(rng, vital_types):
+    """Free-text readings for the given vital types, in the formats the exports contain."""
+    size = len(vital_types)
+    readings = np.empty(size, dtype=object)
+    readings[:] = ''
+
+    def pick(options, count):
+        return rng.choice(np.array(options, dtype=object), count)
+
+    def number(values, decimals=0):
+        values = np.round(values, decimals)
+        return values.astype(int).astype(str).astype(object) if decimals == 0 else values.astype(str).astype(object)
+
+    bp = vital_types == 'Blood pressure (BP)'
+    systolic = rng.normal(128, 16, bp.sum()).clip(80, 220)
+    diastolic = (systolic * rng.uniform(0.55, 0.7, bp.sum())).clip(50, 130)
+    readings[bp] = number(systolic) + '/' + number(diastolic) + pick([' mmHg', 'mmhg', ' mm/Hg', '', ' mm of Hg'], bp.sum())
+    pulse = vital_types == 'Pulse'
+    readings[pulse] = number(rng.normal(82, 12, pulse.sum()).clip(40, 180)) + pick([' bpm', '', '/min', ' b/m'], pulse.sum())
+    weight = vital_types == 'Weight'
+    readings[weight] = number(rng.normal(64, 14, weight.sum()).clip(3, 180), 1) + pick([' kg', 'kgs', ' Kg', ''], weight.sum())
+    spo2 = vital_types == 'Oxygen saturation (SpO2)'
+    saturation = rng.normal(97, 2, spo2.sum()).clip(70, 100).round().astype(int)
+    ranged = rng.random(spo2.sum()) < 0.1
+    text = saturation.astype(str).astype(object)
+    text[ranged] = (saturation[ranged] - 2).astype(str).astype(object) + '-' + text[ranged]
+    readings[spo2] = text + pick(['%', ' %', '', '% on RA'], spo2.sum())
+    temperature = vital_types == 'Temperature'
+    celsius = rng.random(temperature.sum()) < 0.3
+    degrees = np.where(celsius, rng.normal(37, 0.6, temperature.sum()), rng.normal(98.6, 1.1, temperature.sum()))
+    readings[temperature] = number(degrees, 1) + np.where(celsius, pick([' C', 'C', ' °C'], temperature.sum()),
+                                                           pick([' F', 'F', ' °F', ''], temperature.sum()))
+    height = vital_types == 'Height'
+    feet = rng.random(height.sum()) < 0.25
+    centimetres = rng.normal(160, 10, height.sum()).clip(50, 200)
+    readings[height] = np.where(feet, number(centimetres / 30.48, 1) + ' ft', number(centimetres) + pick([' cm', 'cm', ''], height.sum()))
+    respiratory = vital_types == 'Respiratory Rate'
+    readings[respiratory] = number(rng.normal(18, 3, respiratory.sum()).clip(8, 40)) + pick(['', '/min'], respiratory.sum())
+
+    junk = rng.random(size) < JUNK_VITAL_SHARE
+    readings[junk] = pick(JUNK_VITALS, junk.sum())
+    return readings
+
+def generate_chunk(rng, first_row, size, entities, start, days):
+    """size rows numbered from first_row, grouped into prescriptions of one doctor, patient and day."""
+    doctors, patients, medicines = entities
+    items = 1 + rng.poisson(PRESCRIPTION_ITEMS, size)
+    prescriptions = np.searchsorted(np.cumsum(items), np.arange(size), side='right')
+    count = prescriptions[-1] + 1
+
+    # Doctors and medicines are Zipf-popular; patients keep seeing the same doctor
+    doctor = zipf_choice(rng, np.arange(len(doctors)), count).astype(int)[prescriptions]
+    patient = ((doctor * 7919 + rng.integers(0, 40, count)[prescriptions]) % len(patients))
+    # Later days are busier, as the user base grows
+    day = (days * np.sqrt(rng.random(count))).astype(int)[prescriptions]
+
+    types = rng.choice(np.array(list(TYPE_SHARES), dtype=object), size, p=list(TYPE_SHARES.values()))
+    data = pd.concat([
+        pd.DataFrame({
+            'row_number': np.arange(first_row, first_row + size),
+            'ptp_id': random_uuids(rng, count)[prescriptions],
+            'start_time': (start + pd.to_timedelta(day, unit='D')).strftime('%Y-%m-%d').to_numpy(dtype=object),
+        }),
+        doctors.iloc[doctor].reset_index(drop=True),
+        patients.iloc[patient].reset_index(drop=True),
+    ], axis=1)
+    data['type'] = types
+    value = np.empty(size, dtype=object)
+    is_medicine = types == 'Medicine'
+    medicine = zipf_choice(rng, np.arange(len(medicines)), size).astype(int)
+    value[is_medicine] = medicines['value'].to_numpy()[medicine[is_medicine]]
+    is_observation = types == 'Observation'
+    value[is_observation] = zipf_choice(rng, OBSERVATIONS, is_observation.sum())
+    is_diagnostic = types == 'Diagnostic'
+    value[is_diagnostic] = zipf_choice(rng, DIAGNOSTICS, is_diagnostic.sum())
+    is_vital = types == 'Vital'
+    vital_type = np.full(size, None, dtype=object)
+    vital_type[is_vital] = rng.choice(np.array(list(VITALS), dtype=object), is_vital.sum(), p=list(VITALS.values()))
+    value[is_vital] = vital_readings(rng, vital_type[is_vital])
+    data['value'] = value
+    data['vital_type'] = vital_type
+    for column in ['min_mrp', 'max_mrp', 'primary_use', 'manufacturers']:
+        data[column] = pd.Series(medicines[column].to_numpy()[medicine]).where(is_medicine)
+    return data[COLUMNS]
+
+def generate(rows, seed=0, start='2021-01-01', end='2025-12-31', chunk_rows=GENERATE_CHUNK_ROWS):
+    """Yields the dataset chunk_rows rows at a time; the same arguments always give the same rows."""
+    rng = np.random.default_rng(seed)
+    entities = (
+        make_doctors(rng, max(MIN_DOCTORS, rows // ROWS_PER_DOCTOR)),
+        make_patients(rng, max(MIN_PATIENTS, rows // ROWS_PER_PATIENT)),
+        make_medicines(rng),
+    )
+    start = pd.Timestamp(start)
+    days = (pd.Timestamp(end) - start).days + 1
+    for chunk, first_row in enumerate(range(0, rows, chunk_rows)):
+        chunk_rng = np.random.default_rng([seed, chunk])
+        yield generate_chunk(chunk_rng, first_row + 1, min(chunk_rows, rows - first_row), entities, start, days)
+
+def write_dataset(chunks, output, formats):
+    """Writes the chunks to output.<format> for every format; returns the paths written."""
+    paths = {file_format: f"{output}.{file_format}" for file_format in formats}
+    files = {}
+    writer = None
+    try:
+        for index, chunk in enumerate(chunks):
+            if 'csv' in paths:
+                chunk.to_csv(paths['csv'], mode='w' if index == 0 else 'a', header=index == 0, index=False)
+            if 'json' in paths:
+                if index == 0:
+                    files['json'] = open(paths['json'], 'w')
+                    files['json'].write('[')
+                else:
+                    files['json'].write(',')
+                files['json'].write(chunk.to_json(orient='records')[1:-1])
+            if 'parquet' in paths:
+                if writer is None:
+                    writer = pq.ParquetWriter(paths['parquet'], PARQUET_SCHEMA)
+                writer.write_table(pa.Table.from_pandas(chunk, schema=PARQUET_SCHEMA, preserve_index=False))
+            logging.info("%d rows written", chunk['row_number'].iloc[-1])
+        if 'json' in files:
+            files['json'].write(']')
+    finally:
+        for file in files.values():
+            file.close()
+        if writer is not None:
+            writer.close()
+    return list(paths.values())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('rows', type=parse_rows, help="number of rows, e.g. 100k, 1M, 50M")
+    parser.add_argument('--seed', type=int, default=0, help="random seed (default: 0)")
+    parser.add_argument('--format', nargs='+', choices=FORMATS, default=['csv'], dest='formats',
+                        help="output formats (default: csv)")
+    parser.add_argument('--output', help="output path without extension (default: generated/rx_<rows>)")
+    parser.add_argument('--start', default='2021-01-01', help="first start_time date")
+    parser.add_argument('--end', default='2025-12-31', help="last start_time date")
+    parser.add_argument('--chunk-rows', type=int, default=GENERATE_CHUNK_ROWS, help="rows generated at a time")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    output = args.output or os.path.join('generated', f"rx_{args.rows}")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    started = time.time()
+    chunks = generate(args.rows, args.seed, args.start, args.end, args.chunk_rows)
+    for path in write_dataset(chunks, output, args.formats):
+        logging.info("%s: %.1f MB", path, os.path.getsize(path) / 1e6)
+    logging.info("Generated %d rows in %.1fs", args.rows, time.time() - started)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,28 +3,33 @@ import pandas as pd
 import plotly.express as px
 from datetime import datetime
 
+from data_store import load_frame, normalize_values
+import sql_backend
+
 
 @st.cache_data
 def load_data(file_path):
-    return pd.read_excel(file_path)
+    return load_frame(file_path)
 
 def load_state_coordinates(file_path):
     return pd.read_csv(file_path)
 
 def clean_medical_data(data):
-    data['average_mrp'] = data[['min_mrp', 'max_mrp']].mean(axis=1).round(2)
-    data['value'] = data['value'].str.lower().apply(lambda x: "pain in abdomen" if "pain in abd" in str(x) else x)
-    replacements = {
-        'cbc': 'cbc',
-        'urine': 'urine',
-        'hbsag': 'hbsag',
-    }
-    for key, value in replacements.items():
-        data['value'] = data['value'].str.lower().apply(lambda x: key if value in str(x) else x)
+    data['average_mrp'] = data[['min_mrp', 'max_mrp']].astype('float64').round(2).mean(axis=1).round(2)
+    data['value'] = normalize_values(data['value'])
     return data
 
 def apply_filters(data, state_filter, city_filter, pincode_filter, speciality_filter=None):
-    filtered_data = data.copy()
+    if sql_backend.BACKEND:
+        # The single-valued filters run as one SQL query; pincode values are split here
+        filtered_data = sql_backend.filter_rows(data, {
+            'state_name': state_filter,
+            'city': city_filter,
+            'speciality': speciality_filter,
+        })
+        state_filter = city_filter = speciality_filter = None
+    else:
+        filtered_data = data.copy()
     if state_filter:
         filtered_data = filtered_data[filtered_data['state_name'].isin(state_filter)]
     if city_filter:
@@ -47,7 +52,9 @@ def display_sidebar_totals(filtered_data):
     st.sidebar.metric("Total Patients", total_patients)
 
 def aggregate_geo_data(data, group_by_column, count_column):
-    aggregated_data = data.groupby(group_by_column)[count_column].nunique().reset_index()
+    if sql_backend.BACKEND:
+        return sql_backend.aggregate_geo_data(data, group_by_column, count_column)
+    aggregated_data = data.groupby(group_by_column, observed=True)[count_column].nunique().reset_index()
     aggregated_data.columns = [group_by_column, 'count']
     aggregated_data = aggregated_data.sort_values(by='count', ascending=False)
     return aggregated_data
@@ -90,6 +97,8 @@ def create_pie_chart(data, names_column, values_column, title=None,color_map=Non
     )
 
 def get_top_items(data, value_column, item_type):
+    if sql_backend.BACKEND:
+        return sql_backend.get_top_items(data, value_column, item_type)
     top_items = (
         data[data['type'] == item_type][value_column]
         .str.upper()
@@ -101,6 +110,8 @@ def get_top_items(data, value_column, item_type):
     return top_items
 
 def analyze_observation_by_gender(data):
+    if sql_backend.BACKEND:
+        return sql_backend.count_by_gender(data, 'Observation')
     observation_gender = (
         data[data['type'] == 'Observation']
         .dropna(subset=['value', 'gender'])
@@ -116,6 +127,8 @@ def analyze_observation_by_gender(data):
     return observation_gender
 
 def analyze_diagnostics_by_gender(data):
+    if sql_backend.BACKEND:
+        return sql_backend.count_by_gender(data, 'Diagnostic')
     diagnostics_gender = (
         data[data['type'] == 'Diagnostic']
         .dropna(subset=['value', 'gender'])
@@ -427,7 +440,7 @@ def visualize_market_share_primary_use(tab, data):
 
         # Calculate the market share of each manufacturer
         manufacturer_market_share = (
-            filtered_data.groupby('manufacturers')
+            filtered_data.groupby('manufacturers', observed=True)
             .agg(Medicine_Count=('value', 'count'))
             .reset_index()
         )
@@ -511,15 +524,18 @@ def visualize_value_comparison(tab, data):
         st.subheader("Value-Based Manufacturer Comparison")
 
         # Group data by manufacturers
-        manufacturer_comparison = (
-            data.groupby('manufacturers')
-            .agg(
-                Total_Value=('average_mrp', 'sum'),  # Replace with relevant column
-                Average_Value=('average_mrp', 'mean'),  # Replace with relevant column
-                Patient_Count=('id', 'nunique')
+        if sql_backend.BACKEND:
+            manufacturer_comparison = sql_backend.value_comparison(data)
+        else:
+            manufacturer_comparison = (
+                data.groupby('manufacturers', observed=True)
+                .agg(
+                    Total_Value=('average_mrp', 'sum'),  # Replace with relevant column
+                    Average_Value=('average_mrp', 'mean'),  # Replace with relevant column
+                    Patient_Count=('id', 'nunique')
+                )
+                .reset_index()
             )
-            .reset_index()
-        )
 
         # Get top 20 for charts
         top_20 = manufacturer_comparison.sort_values(by='Total_Value', ascending=False).head(20)
@@ -598,6 +614,7 @@ def doctor_analysis_tab(tab, medical_data):
             manufacturer_distribution = (
             doctor_manufacturers['manufacturers']
             .value_counts()
+            .loc[lambda counts: counts > 0]
             .reset_index()
             )
             manufacturer_distribution.columns = ['Manufacturer', 'Count']
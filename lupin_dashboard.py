@@ -1,60 +1,95 @@
-import json
-import os
-import time
 from datetime import datetime
+import json
 import pandas as pd
 import plotly.express as px
 import requests
 import streamlit as st
 from streamlit import session_state as state
 
-
-@st.cache_data
-def load_data(file_path):
-    file_extension = os.path.splitext(file_path)[1].lower()
-
-    if file_extension == '.csv':
-        return pd.read_csv(file_path)
-    elif file_extension in ['.xls', '.xlsx']:
-        return pd.read_excel(file_path)
-    elif file_extension == '.json':
-        return json_to_dataframe(file_path)
-    else:
-        raise ValueError("Unsupported file format. Please provide a CSV, Excel, or JSON file.")
-    # The file_path parameter can be a URL. No additional code needed.
-
-def json_to_dataframe(file_path):
-    with open(file_path, 'r') as file:
-        json_data = json.load(file)
-    df = pd.json_normalize(json_data)
-    return df
-
-def clean_medical_data(data):
-    data['average_mrp'] = data[['min_mrp', 'max_mrp']].mean(axis=1).round(2)
-    data['gender'] = data['gender'].replace("", "Unknown")
-    data['value'] = data['value'].str.lower().apply(lambda x: "pain in abdomen" if "pain in abd" in str(x) else x)
-    replacements = {
-        'cbc': 'cbc',
-        'urine': 'urine',
-        'hbsag': 'hbsag',
-    }
-    for key, value in replacements.items():
-        data['value'] = data['value'].str.lower().apply(lambda x: key if value in str(x) else x)
-    return data
-
-def apply_filters(data, state_filter=None, city_filter=None, pincode_filter=None, speciality_filter=None, 
+from data_store import (append_records, combine_sources, dataset_revision, distinct_values,
+                        download_dataset, explode_values, load_bridges, load_frame,
+                        load_patient_vitals, load_vital_bounds, load_vital_cells, load_vital_facts, project_columns,
+                        read_manifest, recode_categories, rows_with_values, select_columns, uses_columns)
+import sql_backend
+import streaming
+import vitals
+
+
+@st.cache_data(max_entries=8)
+def load_data(file_path, start_date=None, end_date=None, revision=0, columns=None, cleaned=False):
+    # With a date range only the overlapping month partitions of the snapshot are read,
+    # and with columns only those columns of them. With cleaned, value, gender and
+    # average_mrp come from the cleaned columns stored once per dataset revision.
+    # revision is only part of the cache key, so appended records invalidate it.
+    return load_frame(file_path, start_date, end_date, columns=columns, cleaned=cleaned)
+
+@st.cache_resource(max_entries=4)
+def load_bridge_tables(file_path, revision=0):
+    # Read-only arrays, so every session shares one copy instead of getting its own per rerun
+    return load_bridges(file_path)
+
+@st.cache_resource(max_entries=4)
+def load_vital_fact_table(file_path, revision=0):
+    # Every vital reading of the dataset, parsed and typed once per dataset revision
+    return load_vital_facts(file_path)
+
+@st.cache_resource(max_entries=4)
+def load_vitals_matrix(file_path, revision=0):
+    # One row per patient with the latest reading of each vital and the metrics derived from them
+    return load_patient_vitals(file_path)
+
+@st.cache_resource(max_entries=4)
+def load_vital_bounds_table(file_path, revision=0):
+    # Quartiles and outlier fences of every vital reading, overall and per gender and age group
+    return load_vital_bounds(file_path)
+
+@st.cache_resource(max_entries=4)
+def load_vital_cells_table(file_path, revision=0):
+    # Mergeable statistics of the vital readings per day, state, gender and age group
+    return load_vital_cells(file_path)
+
+@st.cache_data(max_entries=4)
+def load_filter_options(file_path, revision=0):
+    # Streaming mode: every option of the sidebar filters, from one pass over the dataset
+    return streaming.filter_options(file_path)
+
+@st.cache_data(max_entries=8)
+def load_streamed_aggregates(file_path, start_date, end_date, revision=0, state_filter=None, city_filter=None,
+                             pincode_filter=None, speciality_filter=None, client_filter=None, project_filter=None):
+    # Streaming mode: the tab frames, aggregated batch by batch without loading the dataset
+    aggregates = streaming.aggregate(file_path, start_date, end_date, {
+        'state_name': state_filter,
+        'city': city_filter,
+        'speciality': speciality_filter,
+        'client': client_filter,
+        'project': project_filter,
+    }, pincode_filter)
+    return streaming.finalize(aggregates) if aggregates is not None else None
+
+@uses_columns('state_name', 'city', 'speciality', 'client', 'project')
+def apply_filters(data, bridges, state_filter=None, city_filter=None, pincode_filter=None, speciality_filter=None,
                   client_filter=None, project_filter=None):
     """Filters medical data based on multiple criteria including state, city, pincode, speciality, client, and project."""
-    
-    filtered_data = data.copy()
+
+    if sql_backend.BACKEND:
+        # The single-valued filters run as one SQL query; pincode still goes through the bridge table
+        filtered_data = sql_backend.filter_rows(data, {
+            'state_name': state_filter,
+            'city': city_filter,
+            'speciality': speciality_filter,
+            'client': client_filter,
+            'project': project_filter,
+        })
+        state_filter = city_filter = speciality_filter = client_filter = project_filter = None
+    else:
+        filtered_data = data
 
     if state_filter:
         filtered_data = filtered_data[filtered_data['state_name'].isin(state_filter)]
     if city_filter:
         filtered_data = filtered_data[filtered_data['city'].isin(city_filter)]
     if pincode_filter:
-        filtered_data = filtered_data[
-            filtered_data['pincode'].str.split(',').apply(lambda x: any(p.strip() in pincode_filter for p in x))]
+        filtered_data = filtered_data[rows_with_values(filtered_data, bridges, 'pincode', pincode_filter)]
     if speciality_filter:
         filtered_data = filtered_data[filtered_data['speciality'].isin(speciality_filter)]
     if client_filter:
@@ -64,10 +99,9 @@ def apply_filters(data, state_filter=None, city_filter=None, pincode_filter=None
 
     return filtered_data
 
+@uses_columns('start_time')
 def filter_by_date_range(data, start_date, end_date):
-    # Ensure 'start_time' is in datetime format
-    data['start_time'] = pd.to_datetime(data['start_time'], errors='coerce')  # Handle invalid dates
-
+    # start_time is already a datetime column; invalid dates were stored as NaT at ingest
     # Convert 'start_date' and 'end_date' to datetime.datetime for comparison
     start_date = pd.to_datetime(start_date)
     end_date = pd.to_datetime(end_date)
@@ -76,15 +110,19 @@ def filter_by_date_range(data, start_date, end_date):
     return data[(data['start_time'] >= start_date) & (data['start_time'] <= end_date)]
 
 
+@uses_columns('doctor_id', 'id')
 def display_sidebar_totals(filtered_data):
+    render_sidebar_totals(filtered_data['doctor_id'].nunique(), filtered_data['id'].nunique())
+
+def render_sidebar_totals(total_doctors, total_patients):
     st.sidebar.markdown("### Totals in Analytics")
-    total_doctors = filtered_data['doctor_id'].nunique()
-    total_patients = filtered_data['id'].nunique()
     st.sidebar.metric("Total Doctors", total_doctors)
     st.sidebar.metric("Total Patients", total_patients)
 
 def aggregate_geo_data(data, group_by_column, count_column):
-    aggregated_data = data.groupby(group_by_column)[count_column].nunique().reset_index()
+    if sql_backend.BACKEND:
+        return sql_backend.aggregate_geo_data(data, group_by_column, count_column)
+    aggregated_data = data.groupby(group_by_column, observed=True)[count_column].nunique().reset_index()
     aggregated_data.columns = [group_by_column, 'count']
     aggregated_data = aggregated_data.sort_values(by='count', ascending=False)
     return aggregated_data
@@ -109,7 +147,7 @@ def prepare_demographics(data):
 
     age_group_counts = data['age_group'].value_counts().reset_index()
     age_group_counts.columns = ['age_group', 'count']
-    gender_counts = data['gender'].replace({"": "Not Provided"}).str.upper().value_counts().reset_index()
+    gender_counts = recode_categories(data['gender'], {"": "Not Provided"}).str.upper().value_counts().reset_index()
     gender_counts.columns = ['gender', 'count']
 
     return age_group_counts.sort_values(by='count', ascending=False), gender_counts.sort_values(by='count',
@@ -127,6 +165,8 @@ def create_pie_chart(data, names_column, values_column, title=None, color_map=No
     )
 
 def get_top_items(data, item_type):
+    if sql_backend.BACKEND:
+        return sql_backend.get_top_items(data, 'value', item_type)
     top_items = (
         data[data['type'] == item_type]['value']
         .str.upper()
@@ -138,6 +178,8 @@ def get_top_items(data, item_type):
     return top_items
 
 def analyze_observation_by_gender(data):
+    if sql_backend.BACKEND:
+        return sql_backend.count_by_gender(data, 'Observation')
     observation_gender = (
         data[data['type'] == 'Observation']
         .dropna(subset=['value', 'gender'])
@@ -153,6 +195,8 @@ def analyze_observation_by_gender(data):
     return observation_gender
 
 def analyze_diagnostics_by_gender(data):
+    if sql_backend.BACKEND:
+        return sql_backend.count_by_gender(data, 'Diagnostic')
     diagnostics_gender = (
         data[data['type'] == 'Diagnostic']
         .dropna(subset=['value', 'gender'])
@@ -167,14 +211,11 @@ def analyze_diagnostics_by_gender(data):
 
     return diagnostics_gender
 
-def analyze_pharma_data(filtered_data):
+def analyze_pharma_data(filtered_data, bridges):
     """
     Analyze pharma data to extract top manufacturers and primary uses.
     Handles cases where data is missing or invalid.
     """
-    # Fill missing values in primary_use with an empty string for processing
-    filtered_data['primary_use'] = filtered_data['primary_use'].fillna("").astype(str)
-
     # Top manufacturers (always calculated if manufacturers are present)
     if not filtered_data['manufacturers'].dropna().empty:
         top_manufacturers = (
@@ -188,38 +229,32 @@ def analyze_pharma_data(filtered_data):
     else:
         top_manufacturers = pd.DataFrame(columns=['manufacturers', 'count'])
 
-    # Explode primary_use for detailed analysis
-    filtered_primary_use = filtered_data[filtered_data['primary_use'].str.strip() != ""]
-    if not filtered_primary_use.empty:
-        exploded_primary_use = (
-            filtered_primary_use['primary_use']
-            .str.split('|', expand=True)
-            .stack()
-            .str.upper()
-            .str.strip()
+    # One entry per '|'-separated primary use, read from the bridge table
+    exploded_primary_use = explode_values(filtered_data[[]], bridges, 'primary_use')['primary_use']
+    if not exploded_primary_use.empty:
+        top_primary_uses = (
+            exploded_primary_use
+            .astype(str)
+            .value_counts()
+            .reset_index()
         )
-        if not exploded_primary_use.empty:
-            top_primary_uses = (
-                exploded_primary_use
-                .reset_index(level=1, drop=True)
-                .rename("primary_use")
-                .value_counts()
-                .reset_index()
-            )
-            top_primary_uses.columns = ['primary_use', 'count']
-        else:
-            top_primary_uses = pd.DataFrame(columns=['primary_use', 'count'])
+        top_primary_uses.columns = ['primary_use', 'count']
     else:
         top_primary_uses = pd.DataFrame(columns=['primary_use', 'count'])
 
     return top_manufacturers, top_primary_uses
 
+@uses_columns('type', 'speciality', 'doctor_id')
 def visualize_data_types(tab, data):
+    type_counts = data['type'].str.capitalize().value_counts().reset_index()
+    type_counts.columns = ['Type', 'Count']
+    speciality_counts = data.groupby('speciality', observed=True)['doctor_id'].nunique().reset_index()
+    speciality_counts.columns = ['Speciality', 'Count']
+    render_data_types(tab, type_counts, speciality_counts)
+
+def render_data_types(tab, type_counts, speciality_counts):
     with tab:
         with st.expander("Distribution of Data Types within Rx"):
-            type_counts = data['type'].str.capitalize().value_counts().reset_index()
-            type_counts.columns = ['Type', 'Count']
-
             col1, col2 = st.columns([3, 1])
             with col1:
                 st.plotly_chart(create_pie_chart(type_counts, 'Type', 'Count'))
@@ -228,9 +263,6 @@ def visualize_data_types(tab, data):
                 total = type_counts['Count'].sum()
                 st.metric("Total", total)
         with st.expander("Distribution of Speciality Doctors"):
-            speciality_counts = data.groupby('speciality')['doctor_id'].nunique().reset_index()
-            speciality_counts.columns = ['Speciality', 'Count']
-
             col1, col2 = st.columns([2, 1])
             with col1:
                 st.plotly_chart(create_pie_chart(speciality_counts, 'Speciality', 'Count'))
@@ -239,26 +271,32 @@ def visualize_data_types(tab, data):
                 total = speciality_counts['Count'].sum()
                 st.metric("Total", total)
 
-def preprocess_column(data, column_name):
+def preprocess_column(data, bridges, column_name):
     """
     Preprocess a column to handle comma- and slash-separated values and ensure each value is treated as distinct.
     """
     if column_name in data.columns:
-        # Split values on commas or slashes, trim whitespace, and explode into separate rows
-        data = data.assign(
-            **{column_name: data[column_name].str.split(r'[,/]').apply(
-                lambda x: [v.strip() for v in x] if isinstance(x, list) else [])}
-        ).explode(column_name)
+        # One row per comma- or slash-separated value, read from the bridge table
+        data = explode_values(data, bridges, column_name)
     return data
 
-def visualize_geographical_distribution(tab, data):
-    with tab:
-        # Preprocess 'state_name' and 'city' columns to handle comma-separated values
-        data = preprocess_column(data, 'state_name')
-        data = preprocess_column(data, 'city')
+@uses_columns('state_name', 'city', 'id', 'doctor_id')
+def visualize_geographical_distribution(tab, data, bridges):
+    # Preprocess 'state_name' and 'city' columns to handle comma-separated values
+    state_data = preprocess_column(data, bridges, 'state_name')
+    city_data = preprocess_column(data, bridges, 'city')
+    render_geographical_distribution(
+        tab,
+        aggregate_geo_data(state_data, 'state_name', 'id'),
+        aggregate_geo_data(city_data, 'city', 'id'),
+        aggregate_geo_data(state_data, 'state_name', 'doctor_id'),
+        aggregate_geo_data(city_data, 'city', 'doctor_id'),
+    )
 
+def render_geographical_distribution(tab, patient_state_counts, patient_city_counts, doctor_state_counts,
+                                     doctor_city_counts):
+    with tab:
         with st.expander("Patient Distribution by State"):
-            patient_state_counts = aggregate_geo_data(data, 'state_name', 'id')
             col1, col2 = st.columns([3, 1])
             with col1:
                 st.plotly_chart(
@@ -273,7 +311,6 @@ def visualize_geographical_distribution(tab, data):
                 st.metric("Total", total)
 
         with st.expander("Patient Distribution by City"):
-            patient_city_counts = aggregate_geo_data(data, 'city', 'id')
             col3, col4 = st.columns([3, 1])
             with col3:
                 st.plotly_chart(
@@ -288,7 +325,6 @@ def visualize_geographical_distribution(tab, data):
                 st.metric("Total", total)
 
         with st.expander("Doctor Distribution by State"):
-            doctor_state_counts = aggregate_geo_data(data, 'state_name', 'doctor_id')
             col5, col6 = st.columns([3, 1])
             with col5:
                 st.plotly_chart(
@@ -303,7 +339,6 @@ def visualize_geographical_distribution(tab, data):
                 st.metric("Total", total)
 
         with st.expander("Doctor Distribution by City"):
-            doctor_city_counts = aggregate_geo_data(data, 'city', 'doctor_id')
             col7, col8 = st.columns([3, 1])
             with col7:
                 st.plotly_chart(
@@ -317,12 +352,14 @@ def visualize_geographical_distribution(tab, data):
                 total = doctor_city_counts['count'].sum()
                 st.metric("Total", total)
 
+@uses_columns('id', 'age', 'gender')
 def visualize_patient_demographics(tab, data):
-    with tab:
-        data = data.drop_duplicates(subset=['id'])
-        age_group_counts, gender_counts = prepare_demographics(data)
-        age_group_counts = age_group_counts.sort_values('age_group')
+    data = data.drop_duplicates(subset=['id'])
+    age_group_counts, gender_counts = prepare_demographics(data)
+    render_patient_demographics(tab, age_group_counts.sort_values('age_group'), gender_counts)
 
+def render_patient_demographics(tab, age_group_counts, gender_counts):
+    with tab:
         with st.expander("Age Group Distribution of Patients"):
             col1, col2 = st.columns([3, 1])
             with col1:
@@ -342,16 +379,23 @@ def visualize_patient_demographics(tab, data):
                 total = gender_counts['count'].sum()
                 st.metric("Total", total)
 
-def visualize_medicines(tab, data):
+@uses_columns('type', 'value')
+def visualize_medicines(tab, data, bridges):
     data = data[data['type'].str.lower() == 'medicine']
     data['value'] = data['value'].str.strip().str.upper()
     data = data.dropna(subset=['value'])
+    exploded_data = explode_values(data, bridges, 'primary_use', 'exploded_primary_use')
+    medicines_by_primary_use = (
+        exploded_data[exploded_data['type'] == 'Medicine']
+        .groupby(['exploded_primary_use', 'value'], observed=True)
+        .size()
+        .reset_index(name='count')
+    )
+    render_medicines(tab, get_top_items(data, 'Medicine'), medicines_by_primary_use)
 
+def render_medicines(tab, top_medicines, medicines_by_primary_use):
     with tab:
         with st.expander("Top Medicines"):
-            
-            
-            top_medicines = get_top_items(data, 'Medicine')
             col1, col2 = st.columns([3, 1])
             with col1:
                 st.plotly_chart(
@@ -365,32 +409,18 @@ def visualize_medicines(tab, data):
         # Clean and explode primary use data
 
         with st.expander("Top Medicines by Primary Use"):
-            data['primary_use'] = data['primary_use'].fillna("").astype(str)
-            exploded_data = data.copy()
-            exploded_data = exploded_data[exploded_data['primary_use'].str.strip() != ""]
-            exploded_data = exploded_data.assign(
-                exploded_primary_use=exploded_data['primary_use'].str.split('|')
-            ).explode('exploded_primary_use')
-            exploded_data['exploded_primary_use'] = exploded_data['exploded_primary_use'].str.strip().str.upper()
-
             # Get unique primary uses for selection
-            unique_primary_uses = exploded_data['exploded_primary_use'].dropna().unique()
-            unique_primary_uses = sorted(unique_primary_uses)
+            unique_primary_uses = sorted(medicines_by_primary_use['exploded_primary_use'].unique())
             selected_primary_use = st.selectbox("Select Primary Use", unique_primary_uses, key="primary_use_select")
 
             if not selected_primary_use:
                 st.info("Please select a primary use to view top medicines.")
                 return
 
-            # Filter data for the selected primary use
-            filtered_data = exploded_data[exploded_data['exploded_primary_use'] == selected_primary_use]
-
-            # Group by medicine and calculate counts
+            # Medicine counts for the selected primary use
             top_medicines = (
-                filtered_data[filtered_data['type'] == 'Medicine']
-                .groupby('value')
-                .size()
-                .reset_index(name='count')
+                medicines_by_primary_use[medicines_by_primary_use['exploded_primary_use'] == selected_primary_use]
+                [['value', 'count']]
                 .sort_values(by='count', ascending=False)
             )
 
@@ -408,10 +438,12 @@ def visualize_medicines(tab, data):
                 total = top_medicines['count'].sum()
                 st.metric("Total", total)
 
-def visualize_pharma_analytics(tab, filtered_medical_data):
-    with tab:
-        top_15_manufacturers, top_15_primary_uses = analyze_pharma_data(filtered_medical_data)
+@uses_columns('manufacturers')
+def visualize_pharma_analytics(tab, filtered_medical_data, bridges):
+    render_pharma_analytics(tab, *analyze_pharma_data(filtered_medical_data, bridges))
 
+def render_pharma_analytics(tab, top_15_manufacturers, top_15_primary_uses):
+    with tab:
         # Expander for Top Manufacturers
         with st.expander("Top Manufacturers"):
             if top_15_manufacturers is not None and not top_15_manufacturers.empty:
@@ -472,15 +504,18 @@ def visualize_pharma_analytics(tab, filtered_medical_data):
         #     else:
         #         st.warning("No data available for Manufacturers by Primary Use.")
 
+@uses_columns('type', 'value', 'gender')
 def visualize_observations(tab, data):
     data = data[data['type'].str.lower() == 'observation']
     data['value'] = data['value'].str.strip().str.upper()
     data = data.dropna(subset=['value'])
     data = data[~data.value.isna()]
     data = data[data['value'].str.strip() != ""]
+    render_observations(tab, get_top_items(data, 'Observation'), analyze_observation_by_gender(data))
+
+def render_observations(tab, top_observations, observations_gender):
     with tab:
         with st.expander("Top Observations"):
-            top_observations = get_top_items(data, 'Observation')
             col1, col2 = st.columns([3, 1])
             with col1:
                 st.plotly_chart(
@@ -492,7 +527,6 @@ def visualize_observations(tab, data):
                 st.metric("Total", total)
 
         with st.expander("Observations by Gender"):
-            observations_gender = analyze_observation_by_gender(data)
             observations_gender['Total'] = observations_gender.groupby('value')['count'].transform('sum')
             observations_gender = observations_gender.sort_values(by='Total', ascending=False)
             observations_pivot = observations_gender.pivot(index='value', columns='gender', values='count').fillna(0)
@@ -514,15 +548,18 @@ def visualize_observations(tab, data):
             with col2:
                 st.dataframe(observations_pivot)
 
+@uses_columns('type', 'value', 'gender')
 def visualize_diagnostics(tab, data):
     data = data[data['type'].str.lower() == 'diagnostic']
     data['value'] = data['value'].str.strip().str.upper()
     data = data.dropna(subset=['value'])
     data = data[~data.value.isna()]
     data = data[data['value'].str.strip() != ""]
+    render_diagnostics(tab, get_top_items(data, 'Diagnostic'), analyze_diagnostics_by_gender(data))
+
+def render_diagnostics(tab, top_diagnostics, diagnostics_gender):
     with tab:
         with st.expander("Top Diagnostics"):
-            top_diagnostics = get_top_items(data, 'Diagnostic')
             col1, col2 = st.columns([3, 1])
             with col1:
                 st.plotly_chart(
@@ -537,7 +574,6 @@ def visualize_diagnostics(tab, data):
                 st.metric("Total", total)
 
         with st.expander("Diagnostics by Gender"):
-            diagnostics_gender = analyze_diagnostics_by_gender(data)
             diagnostics_gender['Total'] = diagnostics_gender.groupby('value')['count'].transform('sum')
             diagnostics_gender = diagnostics_gender.sort_values(by='Total', ascending=False)
             diagnostics_pivot = diagnostics_gender.pivot(index='value', columns='gender', values='count').fillna(0)
@@ -563,10 +599,11 @@ def visualize_diagnostics(tab, data):
             with col2:
                 st.dataframe(diagnostics_pivot, key="diagnostics_by_gender_table")
 
-def visualize_manufacturer_medicines(tab, data):
+@uses_columns('manufacturers', 'type', 'value')
+def visualize_manufacturer_medicines(tab, data, bridges):
     with tab:
         st.subheader("Medicines by Manufacturer")
-        top_15_manufacturers, _ = analyze_pharma_data(data)
+        top_15_manufacturers, _ = analyze_pharma_data(data, bridges)
 
         if top_15_manufacturers is not None and not top_15_manufacturers.empty:
             # Sort the manufacturers list alphabetically
@@ -616,7 +653,8 @@ def visualize_manufacturer_medicines(tab, data):
         else:
             st.warning("No manufacturer data available.")
 
-def manufacturer_comparison_tab(tab, data):
+@uses_columns('manufacturers', 'id', 'value')
+def manufacturer_comparison_tab(tab, data, bridges):
     with tab:
         st.subheader("Manufacturer Comparison")
 
@@ -630,15 +668,9 @@ def manufacturer_comparison_tab(tab, data):
 
         # Filter data for selected manufacturers
         filtered_data = data[data['manufacturers'].isin(selected_manufacturers)]
-        filtered_data = filtered_data[filtered_data['primary_use'].str.strip() != ""]
 
         # Explode the primary_use column into multiple rows
-        exploded_data = filtered_data.copy()
-        exploded_data = exploded_data.dropna(subset=['primary_use'])
-        exploded_data = exploded_data.assign(
-            exploded_primary_use=exploded_data['primary_use'].str.split('|')
-        ).explode('exploded_primary_use')
-        exploded_data['exploded_primary_use'] = exploded_data['exploded_primary_use'].str.strip().str.upper()
+        exploded_data = explode_values(filtered_data, bridges, 'primary_use', 'exploded_primary_use')
 
         # Get unique primary uses for selection
         unique_primary_uses = sorted(exploded_data['exploded_primary_use'].dropna().unique())
@@ -652,7 +684,7 @@ def manufacturer_comparison_tab(tab, data):
         filtered_data = exploded_data[exploded_data['exploded_primary_use'].isin(selected_primary_uses)]
 
         # **Bar Chart - Total Medicines per Manufacturer**
-        manufacturer_counts = filtered_data.groupby('manufacturers')['id'].count().reset_index()
+        manufacturer_counts = filtered_data.groupby('manufacturers', observed=True)['id'].count().reset_index()
         manufacturer_counts.columns = ['Manufacturer', 'Total Medicines']
 
         fig_pie = px.pie(
@@ -664,7 +696,7 @@ def manufacturer_comparison_tab(tab, data):
         )
         st.plotly_chart(fig_pie, use_container_width=True)
         # Create separate pie charts for each primary use
-        primary_use_data = filtered_data.groupby(['exploded_primary_use', 'manufacturers'])['id'].count().reset_index()
+        primary_use_data = filtered_data.groupby(['exploded_primary_use', 'manufacturers'], observed=True)['id'].count().reset_index()
         primary_use_data.columns = ['Primary Use', 'Manufacturer', 'Count']
 
         # Get unique primary uses
@@ -732,21 +764,16 @@ def manufacturer_comparison_tab(tab, data):
                     st.write("No data available for this primary use.")
 
 
-def visualize_market_share_primary_use(tab, data):
+@uses_columns('manufacturers', 'value')
+def visualize_market_share_primary_use(tab, data, bridges):
     with tab:
         st.subheader("Market Share Comparison by Manufacturers for a Primary Use")
 
-        # Explode the primary_use column into multiple rows
-        exploded_data = data.copy()
-        exploded_data = exploded_data.dropna(subset=['primary_use'])
-        exploded_data = exploded_data.assign(
-            exploded_primary_use=exploded_data['primary_use'].str.split('|')
-        ).explode('exploded_primary_use')
-        exploded_data['exploded_primary_use'] = exploded_data['exploded_primary_use'].str.strip().str.upper()
+        # Explode the primary_use column into multiple rows; blank entries have none
+        exploded_data = explode_values(data, bridges, 'primary_use', 'exploded_primary_use')
 
-        # Get unique primary uses for selection and remove blanks
-        unique_primary_uses = exploded_data['exploded_primary_use']
-        unique_primary_uses = unique_primary_uses[unique_primary_uses != ""].unique()
+        # Get unique primary uses for selection
+        unique_primary_uses = exploded_data['exploded_primary_use'].unique()
 
         selected_primary_uses = st.multiselect("Select Primary Uses", sorted(unique_primary_uses))
 
@@ -759,7 +786,7 @@ def visualize_market_share_primary_use(tab, data):
 
         # Calculate the market share of each manufacturer
         manufacturer_market_share = (
-            filtered_data.groupby('manufacturers')
+            filtered_data.groupby('manufacturers', observed=True)
             .agg(Count=('value', 'count'))
             .reset_index()
         )
@@ -790,16 +817,17 @@ def visualize_market_share_primary_use(tab, data):
         else:
             st.warning("No data available for the selected primary uses.")
 
+@uses_columns('manufacturers', 'average_mrp', 'id')
 def visualize_value_comparison(tab, data):
     """
     Creates a tab for value-based comparison of manufacturers.
     """
-    with tab:
-        st.subheader("Value-Based Manufacturer Comparison")
-
-        # Group data by manufacturers
+    # Group data by manufacturers
+    if sql_backend.BACKEND:
+        manufacturer_comparison = sql_backend.value_comparison(data)
+    else:
         manufacturer_comparison = (
-            data.groupby('manufacturers')
+            data.groupby('manufacturers', observed=True)
             .agg(
                 Total_Value=('average_mrp', 'sum'),  # Replace with relevant column
                 Average_Value=('average_mrp', 'mean'),  # Replace with relevant column
@@ -807,6 +835,11 @@ def visualize_value_comparison(tab, data):
             )
             .reset_index()
         )
+    render_value_comparison(tab, manufacturer_comparison)
+
+def render_value_comparison(tab, manufacturer_comparison):
+    with tab:
+        st.subheader("Value-Based Manufacturer Comparison")
 
         # Get top 20 for charts
         top_20 = manufacturer_comparison.sort_values(by='Total_Value', ascending=False).head(20)
@@ -866,12 +899,79 @@ def visualize_value_comparison(tab, data):
                 Patient_Count_Percentage=lambda df: (df['Patient_Count'] / df['Patient_Count'].sum() * 100).round(2))
         )
 
-def visualize_vitals(tab, data):
+def render_derived_vital(metric, patient_data, median):
+    st.subheader(f"{metric} Distribution")
+    st.write(f"**Total Patients Available:** {len(patient_data)}")
+
+    with st.expander(f"Overall {metric} Distribution"):
+        overall_summary = patient_data[metric].agg(['count', 'mean', 'median', 'std', 'min', 'max'])
+        overall_summary['median'] = median
+        overall_summary = overall_summary.round(2)
+        st.write("Summary Statistics:")
+        st.dataframe(overall_summary.rename_axis('Metric').reset_index())
+        st.plotly_chart(px.box(patient_data, x=metric, title=f"{metric} Distribution"), use_container_width=True)
+
+    with st.expander(f"{metric} Distribution by Gender"):
+        gender_summary = patient_data.groupby('gender', observed=True).agg({
+            metric: ['count', 'mean', 'median', 'std', 'min', 'max']
+        }).round(2)
+        st.write("Gender-wise Summary Statistics:")
+        st.dataframe(gender_summary)
+        st.plotly_chart(px.box(patient_data, x='gender', y=metric, color='gender', title=f"{metric} by Gender"),
+                        use_container_width=True)
+
+    with st.expander(f"{metric} Distribution by Age Groups"):
+        patient_data = patient_data.sort_values(by='age_group').reset_index(drop=True)
+        age_summary = patient_data.groupby('age_group').agg({
+            metric: ['count', 'mean', 'median', 'std', 'min', 'max']
+        }).round(2).reset_index()
+        st.write("Age-wise Summary Statistics:")
+        st.dataframe(age_summary)
+        st.plotly_chart(px.box(patient_data, x='age_group', y=metric, color='age_group',
+                               title=f"{metric} by Age Group"), use_container_width=True)
+
+def render_vital_readings(vital, vital_data, median, summarize):
+    st.subheader(f"{vital} Distribution")
+    st.write(f"**Total Data Points Available:** {len(vital_data)}")
+
+    with st.expander(f"Overall {vital} Distribution"):
+        overall_summary = vital_data['value'].agg(['count', 'mean', 'median', 'std', 'min', 'max'])
+        overall_summary['median'] = median
+        overall_summary = overall_summary.round(2).rename(vital)
+        st.write("Summary Statistics:")
+        st.dataframe(overall_summary.rename_axis('Metric').reset_index())
+        st.plotly_chart(px.box(vital_data, x='value', labels={'value': vital}, title=f"{vital} Distribution"),
+                        use_container_width=True)
+
+    with st.expander(f"{vital} Distribution by Gender"):
+        gender_summary = summarize(vital_data, 'gender', ['value']).round(2).rename(columns={'value': vital})
+        st.write("Gender-wise Summary Statistics:")
+        st.dataframe(gender_summary)
+        st.plotly_chart(px.box(vital_data, x='gender', y='value', color='gender',
+                               labels={'value': vital, 'gender': 'Gender'}, title=f"{vital} by Gender"),
+                        use_container_width=True)
+
+    with st.expander(f"{vital} Distribution by Age Groups"):
+        vital_data = vital_data.sort_values(by='age_group').reset_index(drop=True)
+        age_summary = summarize(vital_data, 'age_group', ['value']).round(2).rename(columns={'value': vital})
+        st.write("Age-wise Summary Statistics:")
+        st.dataframe(age_summary.reset_index())
+        st.plotly_chart(px.box(vital_data, x='age_group', y='value', color='age_group',
+                               labels={'value': vital, 'age_group': 'Age Group'}, title=f"{vital} by Age Group"),
+                        use_container_width=True)
+
+@uses_columns('id')
+def visualize_vitals(tab, data, vital_facts, vitals_matrix, vital_bounds, vital_cells=None):
     with tab:
         st.subheader("Vital Sign Analysis")
 
-        # Get unique vitals
-        available_vitals = sorted(data['vital_type'].dropna().unique())
+        # The parsed readings of the filtered rows, and the latest vitals of their patients
+        vital_facts = vital_facts[vital_facts['row'].isin(data.index)]
+        patients = vitals_matrix[vitals_matrix['id'].isin(data['id'])]
+
+        # Get unique vitals, followed by the metrics derived per patient
+        available_vitals = sorted(vital_facts['vital_type'].unique())
+        available_vitals += [metric for metric in vitals.DERIVED_COLUMNS if patients[metric].notna().any()]
 
         # User selects which vital to visualize
         selected_vital = st.selectbox("Select a Vital to View", available_vitals)
@@ -880,57 +980,59 @@ def visualize_vitals(tab, data):
             st.warning("Please select a vital sign to view.")
             return
 
-        vital_data = data[data['vital_type'] == selected_vital].copy()
+        # Outliers are clipped to the IQR fences stored per dataset revision for each gender and
+        # age group, and medians of every reading of a vital come from the same table
+        def clip_outliers(df, column, reading=None):
+            return df.assign(**{column: vitals.clip_outliers(df, selected_vital, column, vital_bounds, reading)})
+
+        def median(df, column, reading='value'):
+            return vitals.stored_median(df[column], selected_vital, vital_bounds, reading)
+
+        # Gender and age group summaries merge the stored cells of the selected days and states
+        # when given them, and are computed over the readings otherwise
+        def summarize(df, by, columns):
+            if vital_cells is not None:
+                # Minimum and maximum are readings, in the dtype of the readings
+                return vitals.summarize_cells(vital_cells, selected_vital, by, columns).astype(
+                    {(column, statistic): df[column].dtype for column in columns for statistic in ['min', 'max']})
+            return df.groupby(by, observed=True).agg({column: vitals.SUMMARY_STATISTICS for column in columns})
+
+        if selected_vital in vitals.DERIVED_COLUMNS:
+            patient_data = patients[patients[selected_vital].notna()]
+            if patient_data['gender'].isnull().all():
+                patient_data = patient_data.assign(gender='Unknown')
+            patient_data = clip_outliers(patient_data, selected_vital, reading='value')
+            render_derived_vital(selected_vital, patient_data, median(patient_data, selected_vital))
+            return
+
+        vital_data = vital_facts[vital_facts['vital_type'] == selected_vital]
 
         if vital_data.empty:
             st.warning(f"No valid data available for {selected_vital} visualization.")
             return
 
-        # Function to remove outliers using IQR
-        def remove_outliers(df, column):
-            Q1 = df[column].quantile(0.25)
-            Q3 = df[column].quantile(0.75)
-            IQR = Q3 - Q1
-            lower_bound = Q1 - 10 * IQR
-            upper_bound = Q3 + 10 * IQR
-            df[column] = df[column].clip(lower=lower_bound, upper=upper_bound)
+        if vital_data['gender'].isnull().all():
+            vital_data = vital_data.assign(gender='Unknown')
 
-        vital_data['age'] = pd.to_numeric(vital_data['age'], errors='coerce')
-        age_bins = [0, 18, 25, 40, 60, 200]
-        age_labels = ["0-18", "19-25", "26-40", "41-60", "60+"]
-        vital_data['age_group'] = pd.cut(vital_data['age'], bins=age_bins, labels=age_labels, include_lowest=True)
-        vital_data['age_group'] = vital_data['age_group'].cat.add_categories("Unknown").fillna("Unknown")
+        # Each vital is shown by the parser registered for its label, under any of its aliases
+        parser = vitals.parser_for(selected_vital)
+        if parser is None:
+            st.warning(f"{selected_vital} sparse data")
+            return
 
-        if 'gender' not in vital_data.columns or vital_data['gender'].isnull().all():
-            vital_data['gender'] = 'Unknown'
+        # Only the readings its parser could read (blood pressure with both values, weight in
+        # kg, SpO2 within 0-100 with ranges counting as their mean)
+        vital_data = vital_data[vital_data['valid']]
+        if vital_data.empty:
+            st.warning(f"No valid {selected_vital} readings found.")
+            return
 
         # **Special Handling for Blood Pressure (BP)**
-        if selected_vital == "Blood pressure (BP)":
-            vital_data = vital_data[vital_data['vital_type'] == 'Blood pressure (BP)'].copy()
-            vital_data['value'] = vital_data['value'].astype(str)
-
-            # Clean BP values
-            vital_data['value'] = (
-                vital_data['value'].str.lower()
-                .str.replace('mmhg', '', regex=True)
-                .str.replace('mm/hg', '', regex=True)
-                .str.strip()
-            )
-
-            # Ensure all BP values contain both systolic and diastolic readings
-            valid_bp_rows = vital_data['value'].str.fullmatch(r'\d{2,3}/\d{2,3}')
-            vital_data = vital_data[valid_bp_rows].copy()
-
-            if vital_data.empty:
-                st.warning("No valid blood pressure readings found.")
-                return
-
-            # Split into systolic and diastolic
-            vital_data[['systolic', 'diastolic']] = vital_data['value'].str.split('/', expand=True).astype(int)
+        if parser is vitals.parse_blood_pressure:
+            vital_data = vital_data.astype({'systolic': int, 'diastolic': int})
 
             # Remove outliers
-            remove_outliers(vital_data, 'systolic')
-            remove_outliers(vital_data, 'diastolic')
+            vital_data = clip_outliers(clip_outliers(vital_data, 'systolic'), 'diastolic')
 
             # **Visualization for Blood Pressure**
             st.subheader("Blood Pressure Distribution")
@@ -945,7 +1047,7 @@ def visualize_vitals(tab, data):
                     'Systolic': [
                         f"{vital_data['systolic'].count()}",
                         f"{vital_data['systolic'].mean():.1f}",
-                        f"{vital_data['systolic'].median():.1f}",
+                        f"{median(vital_data, 'systolic', 'systolic'):.1f}",
                         f"{vital_data['systolic'].std():.1f}",
                         f"{vital_data['systolic'].min():.1f}",
                         f"{vital_data['systolic'].max():.1f}"
@@ -953,7 +1055,7 @@ def visualize_vitals(tab, data):
                     'Diastolic': [
                         f"{vital_data['diastolic'].count()}",
                         f"{vital_data['diastolic'].mean():.1f}",
-                        f"{vital_data['diastolic'].median():.1f}",
+                        f"{median(vital_data, 'diastolic', 'diastolic'):.1f}",
                         f"{vital_data['diastolic'].std():.1f}",
                         f"{vital_data['diastolic'].min():.1f}",
                         f"{vital_data['diastolic'].max():.1f}"
@@ -974,10 +1076,7 @@ def visualize_vitals(tab, data):
 
             with st.expander("Blood Pressure Distribution by Gender"):
                 # Add gender-wise summary
-                gender_summary = vital_data.groupby('gender').agg({
-                    'systolic': ['count', 'mean', 'median', 'std', 'min', 'max'],
-                    'diastolic': ['count', 'mean', 'median', 'std', 'min', 'max']
-                }).round(2)
+                gender_summary = summarize(vital_data, 'gender', ['systolic', 'diastolic']).round(2)
                 
                 st.write("Gender-wise Summary Statistics:")
                 st.dataframe(gender_summary)
@@ -998,10 +1097,7 @@ def visualize_vitals(tab, data):
 
             with st.expander("Blood Pressure Distribution by Age Groups"):
                 # Add age-wise summary
-                age_summary = vital_data.groupby('age_group').agg({
-                    'systolic': ['count','mean', 'median', 'std', 'min', 'max'],
-                    'diastolic': ['count','mean', 'median', 'std', 'min', 'max']
-                }).round(1)
+                age_summary = summarize(vital_data, 'age_group', ['systolic', 'diastolic']).round(1)
                 age_summary = pd.DataFrame(age_summary).sort_values(by='age_group').reset_index()
                 st.write("Age-wise Summary Statistics:")
                 st.dataframe(age_summary)
@@ -1020,13 +1116,9 @@ def visualize_vitals(tab, data):
                 )
                 st.plotly_chart(fig_age, use_container_width=True)
         
-        elif selected_vital == "Pulse":
-            vital_data['value'] = vital_data['value'].astype(str)
-            vital_data['value'] = vital_data['value'].str.extract(r'(\d+\.?\d*)')  # Extract numeric values
-            vital_data['value'] = pd.to_numeric(vital_data['value'], errors='coerce')
-
+        elif parser is vitals.parse_pulse:
             # Remove outliers for Pulse
-            remove_outliers(vital_data, 'value')
+            vital_data = clip_outliers(vital_data, 'value')
 
             st.subheader("Pulse Rate Distribution")
             total_data_points = len(vital_data)
@@ -1039,7 +1131,7 @@ def visualize_vitals(tab, data):
                     'Pulse Rate': [
                         f"{vital_data['value'].count()}",
                         f"{vital_data['value'].mean():.1f}",
-                        f"{vital_data['value'].median():.1f}",
+                        f"{median(vital_data, 'value'):.1f}",
                         f"{vital_data['value'].std():.1f}",
                         f"{vital_data['value'].min():.1f}",
                         f"{vital_data['value'].max():.1f}"
@@ -1058,9 +1150,7 @@ def visualize_vitals(tab, data):
 
             # **Pulse Distribution by Gender**
             with st.expander("Pulse Rate Distribution by Gender"):
-                gender_summary = vital_data.groupby('gender').agg({
-                    'value': ['count', 'mean', 'median', 'std', 'min', 'max']
-                }).round(2)
+                gender_summary = summarize(vital_data, 'gender', ['value']).round(2)
                 
                 st.write("Gender-wise Summary Statistics:")
                 st.dataframe(gender_summary)
@@ -1078,9 +1168,7 @@ def visualize_vitals(tab, data):
             # **Pulse Distribution by Age Groups**
             with st.expander("Pulse Rate Distribution by Age Groups"):
                 vital_data = vital_data.sort_values(by='age_group').reset_index(drop=True)
-                age_summary = vital_data.groupby('age_group').agg({
-                    'value': ['count','mean', 'median', 'std', 'min', 'max']
-                }).round(1)
+                age_summary = summarize(vital_data, 'age_group', ['value']).round(1)
                 age_summary = pd.DataFrame(age_summary).reset_index()
                 st.write("Age-wise Summary Statistics:")
                 st.dataframe(age_summary)
@@ -1095,15 +1183,8 @@ def visualize_vitals(tab, data):
                 )
                 st.plotly_chart(fig_pulse_age, use_container_width=True)
 
-        elif selected_vital == "Weight":
-            vital_data['value'] = vital_data['value'].astype(str)
-            # Clean weight values to include only kg or kgs units
-            weight_mask = vital_data['value'].str.contains('kg|kgs', case=False, na=True)
-            vital_data = vital_data[weight_mask]
-            vital_data['value'] = vital_data['value'].str.extract(r'(\d+\.?\d*)')  # Extract numeric values
-            vital_data['value'] = pd.to_numeric(vital_data['value'], errors='coerce')
-
-            remove_outliers(vital_data, 'value')
+        elif parser is vitals.parse_weight:
+            vital_data = clip_outliers(vital_data, 'value')
 
             st.subheader("Weight Distribution")
             total_data_points = len(vital_data)
@@ -1113,7 +1194,10 @@ def visualize_vitals(tab, data):
             with st.expander("Overall Weight Distribution"):
                 overall_summary = vital_data.agg({
                     'value': ['count', 'mean', 'median', 'std', 'min', 'max']
-                }).round(2).rename(columns={'value': 'Weight (kg)'}).reset_index().rename(columns={'index': 'Metric'})
+                })
+                overall_summary.loc['median', 'value'] = median(vital_data, 'value')
+                overall_summary = overall_summary.round(2).rename(
+                    columns={'value': 'Weight (kg)'}).reset_index().rename(columns={'index': 'Metric'})
 
                 st.write("Summary Statistics:")
                 st.dataframe(overall_summary)
@@ -1128,9 +1212,7 @@ def visualize_vitals(tab, data):
 
             # **Weight Distribution by Gender**
             with st.expander("Weight Distribution by Gender"):
-                gender_summary = vital_data.groupby('gender').agg({
-                    'value': ['count', 'mean', 'median', 'std', 'min', 'max']
-                }).round(2).rename(columns={'value': 'Weight (kg)'})
+                gender_summary = summarize(vital_data, 'gender', ['value']).round(2).rename(columns={'value': 'Weight (kg)'})
 
                 st.write("Gender-wise Summary Statistics:")
                 st.dataframe(gender_summary)
@@ -1148,9 +1230,7 @@ def visualize_vitals(tab, data):
             # **Weight Distribution by Age Groups**
             with st.expander("Weight Distribution by Age Groups"):
                 vital_data = vital_data.sort_values(by='age_group').reset_index()
-                age_summary = vital_data.groupby('age_group').agg({
-                    'value': ['count', 'mean', 'median', 'std', 'min', 'max']
-                }).round(2).rename(columns={'value': 'Weight (kg)'})
+                age_summary = summarize(vital_data, 'age_group', ['value']).round(2).rename(columns={'value': 'Weight (kg)'})
                 age_summary = pd.DataFrame(age_summary).reset_index()
                 st.write("Age-wise Summary Statistics:")
                 st.dataframe(age_summary)
@@ -1165,27 +1245,9 @@ def visualize_vitals(tab, data):
                 )
                 st.plotly_chart(fig_weight_age, use_container_width=True)
         
-        elif selected_vital == 'Oxygen saturation (SpO2)':
-            vital_data['value'] = vital_data['value'].astype(str)
-            # Clean SpO2 values to include only percentage values
-            spo2_mask = vital_data['value'].str.contains('%', case=False, na=True)
-            vital_data = vital_data[spo2_mask]
-            
-            # Extract numeric values and handle ranges
-            vital_data['value'] = vital_data['value'].str.split('%').str[0].str.strip()
-            vital_data['value'] = vital_data['value'].apply(lambda x: 
-                str((int(x.split('-')[0].strip()) + int(x.split('-')[1].strip())) // 2) 
-                if '-' in str(x) else x)
-            
-            # Limit to realistic SpO2 values (2-3 digits)
-            vital_data['value'] = vital_data['value'].apply(lambda x: 
-                x[:3] if str(x)[0] == '1' else x[:2])
-            
-            vital_data['value'] = pd.to_numeric(vital_data['value'], errors='coerce')
-            
+        elif parser is vitals.parse_oxygen_saturation:
             # Remove outliers for SpO2
-            vital_data = vital_data[(vital_data['value'] >= 0) & (vital_data['value'] <= 100)]
-            remove_outliers(vital_data, 'value')
+            vital_data = clip_outliers(vital_data, 'value')
 
             st.subheader("Oxygen Saturation (SpO2) Distribution")
             total_data_points = len(vital_data)
@@ -1198,7 +1260,7 @@ def visualize_vitals(tab, data):
                     'SpO2 (%)': [
                         f"{vital_data['value'].count()}",
                         f"{vital_data['value'].mean():.1f}",
-                        f"{vital_data['value'].median():.1f}",
+                        f"{median(vital_data, 'value'):.1f}",
                         f"{vital_data['value'].std():.1f}",
                         f"{vital_data['value'].min():.1f}",
                         f"{vital_data['value'].max():.1f}"
@@ -1217,9 +1279,7 @@ def visualize_vitals(tab, data):
 
             # **SpO2 Distribution by Gender**
             with st.expander("SpO2 Distribution by Gender"):
-                gender_summary = vital_data.groupby('gender').agg({
-                    'value': ['count', 'mean', 'median', 'std', 'min', 'max']
-                }).round(2)
+                gender_summary = summarize(vital_data, 'gender', ['value']).round(2)
                 
                 st.write("Gender-wise Summary Statistics:")
                 st.dataframe(gender_summary)
@@ -1237,9 +1297,7 @@ def visualize_vitals(tab, data):
             # **SpO2 Distribution by Age Groups**
             with st.expander("SpO2 Distribution by Age Groups"):
                 vital_data = vital_data.sort_values(by='age_group').reset_index(drop=True)
-                age_summary = vital_data.groupby('age_group').agg({
-                    'value': ['count','mean', 'median', 'std', 'min', 'max']
-                }).round(1)
+                age_summary = summarize(vital_data, 'age_group', ['value']).round(1)
                 age_summary = pd.DataFrame(age_summary).reset_index()
                 st.write("Age-wise Summary Statistics:")
                 st.dataframe(age_summary)
@@ -1255,13 +1313,12 @@ def visualize_vitals(tab, data):
                 st.plotly_chart(fig_spo2_age, use_container_width=True)
 
         else:
-            st.warning(f"{selected_vital} sparse data")
+            vital_data = clip_outliers(vital_data, 'value')
+            render_vital_readings(selected_vital, vital_data, median(vital_data, 'value'), summarize)
 
-def get_state_filter(medical_data):
+def get_state_filter(medical_data, bridges):
     # Split and normalize state_name values if they are combined
-    medical_data['state_name'] = medical_data['state_name'].fillna("").astype(str)
-    exploded_states = medical_data['state_name'].str.split(r'[,/]').explode().str.strip()
-    unique_states = exploded_states.dropna().unique()
+    unique_states = distinct_values(medical_data, bridges, 'state_name')
 
     return st.sidebar.multiselect(
         "Select State",
@@ -1270,18 +1327,14 @@ def get_state_filter(medical_data):
         key="state_filter"
     )
 
-def get_city_filter(medical_data, state_filter):
+def get_city_filter(medical_data, bridges, state_filter):
     # Filter data for the selected states
-    filtered_data = medical_data.copy()
+    filtered_data = medical_data
     if state_filter:
-        filtered_data['state_name'] = filtered_data['state_name'].fillna("").astype(str)
-        filtered_data = filtered_data[filtered_data['state_name'].str.split(r'[,/]').apply(
-            lambda x: any(state.strip() in state_filter for state in x))]
+        filtered_data = filtered_data[rows_with_values(filtered_data, bridges, 'state_name', state_filter)]
 
     # Split and normalize city values if they are combined
-    filtered_data['city'] = filtered_data['city'].fillna("").astype(str)
-    exploded_cities = filtered_data['city'].str.split(r'[,/]').explode().str.strip()
-    unique_cities = exploded_cities.dropna().unique()
+    unique_cities = distinct_values(filtered_data, bridges, 'city')
 
     return st.sidebar.multiselect(
         "Select City",
@@ -1291,22 +1344,16 @@ def get_city_filter(medical_data, state_filter):
     )
 
 
-def get_pincode_filter(medical_data, state_filter, city_filter):
+def get_pincode_filter(medical_data, bridges, state_filter, city_filter):
     # Filter data for the selected states and cities
-    filtered_data = medical_data.copy()
+    filtered_data = medical_data
     if state_filter:
-        filtered_data['state_name'] = filtered_data['state_name'].fillna("").astype(str)
-        filtered_data = filtered_data[filtered_data['state_name'].str.split(r'[,/]').apply(
-            lambda x: any(state.strip() in state_filter for state in x))]
+        filtered_data = filtered_data[rows_with_values(filtered_data, bridges, 'state_name', state_filter)]
     if city_filter:
-        filtered_data['city'] = filtered_data['city'].fillna("").astype(str)
-        filtered_data = filtered_data[
-            filtered_data['city'].str.split(r'[,/]').apply(lambda x: any(city.strip() in city_filter for city in x))]
+        filtered_data = filtered_data[rows_with_values(filtered_data, bridges, 'city', city_filter)]
 
     # Split and normalize pincode values if they are combined
-    filtered_data['pincode'] = filtered_data['pincode'].fillna("").astype(str)
-    exploded_pincodes = filtered_data['pincode'].str.split(r'[,/]').explode().str.strip()
-    unique_pincodes = exploded_pincodes.dropna().unique()
+    unique_pincodes = distinct_values(filtered_data, bridges, 'pincode')
 
     return st.sidebar.multiselect(
         "Select Pincode",
@@ -1316,13 +1363,12 @@ def get_pincode_filter(medical_data, state_filter, city_filter):
     )
 
 
-def get_speciality_filter(medical_data, pincode_filter):
-    filtered_speciality_data = medical_data.copy()
+@uses_columns('speciality')
+def get_speciality_filter(medical_data, bridges, pincode_filter):
+    filtered_speciality_data = medical_data
     if pincode_filter:
         filtered_speciality_data = filtered_speciality_data[
-            filtered_speciality_data['pincode'].str.split(',').apply(
-                lambda x: any(p in pincode_filter for p in x)
-            )
+            rows_with_values(filtered_speciality_data, bridges, 'pincode', pincode_filter)
         ]
     unique_specialities = filtered_speciality_data['speciality'].dropna().unique()
     return st.sidebar.multiselect(
@@ -1333,6 +1379,7 @@ def get_speciality_filter(medical_data, pincode_filter):
     )
 
 
+@uses_columns('client')
 def get_client_filter(data):
     """Extracts unique client names and provides a multi-select filter in Streamlit."""
     if 'client' not in data.columns:
@@ -1341,6 +1388,7 @@ def get_client_filter(data):
     selected_clients = st.sidebar.multiselect("Select Client(s)", unique_clients)
     return selected_clients
 
+@uses_columns('client', 'project')
 def get_project_filter(data, client_filter):
     """Extracts unique project names and provides a multi-select filter in Streamlit."""
     if 'project' not in data.columns:
@@ -1351,39 +1399,88 @@ def get_project_filter(data, client_filter):
     selected_projects = st.sidebar.multiselect("Select Project(s)", unique_projects)
     return selected_projects
 
+def get_streamed_filters(options):
+    """The sidebar filters of streaming mode; their options do not narrow down on the filters above them."""
+    state_filter = st.sidebar.multiselect("Select State", options=options.get('state_name', []),
+                                          default=state.get("state_filter", []), key="state_filter")
+    city_filter = st.sidebar.multiselect("Select City", options=options.get('city', []),
+                                         default=state.get("city_filter", []), key="city_filter")
+    pincode_filter = st.sidebar.multiselect("Select Pincode", options=options.get('pincode', []),
+                                            default=state.get("pincode_filter", []), key="pincode_filter")
+    speciality_filter = st.sidebar.multiselect("Select Speciality", options=options.get('speciality', []),
+                                               default=state.get("speciality_filter", []), key="speciality_filter")
+    client_filter = st.sidebar.multiselect("Select Client(s)", options['client']) if 'client' in options else []
+    project_filter = st.sidebar.multiselect("Select Project(s)", options['project']) if 'project' in options else []
+    return state_filter, city_filter, pincode_filter, speciality_filter, client_filter, project_filter
+
+def visualize_streamed_aggregates(source_path, start_date, end_date, revision, filters):
+    """The tabs that streaming mode can aggregate without loading the dataset into memory."""
+    frames = load_streamed_aggregates(source_path, start_date, end_date, revision, *filters)
+    if frames is None:
+        st.warning("No data available.")
+        return
+
+    tab2, tab3, tab4, tab5, tab6, tab7, tab8, tab10 = st.tabs([
+        "📂 Data Types within Rx",
+        "📍 Geographical Distribution",
+        "📊 Demographic Distribution",
+        "💊 Medicines",
+        "🏭 Pharma Analytics",
+        "🩺 Observations",
+        "🧪 Diagnostics",
+        "💰 Value-Based Comparison",
+    ])
+    render_sidebar_totals(frames['total_doctors'], frames['total_patients'])
+    st.caption("Large dataset: patient and doctor counts are estimates and long tails are truncated.")
+
+    render_data_types(tab2, frames['type_counts'], frames['speciality_counts'])
+    render_geographical_distribution(tab3, frames['patient_state_counts'], frames['patient_city_counts'],
+                                     frames['doctor_state_counts'], frames['doctor_city_counts'])
+    render_patient_demographics(tab4, frames['age_group_counts'], frames['gender_counts'])
+    render_medicines(tab5, frames['top_medicines'], frames['medicines_by_primary_use'])
+    render_pharma_analytics(tab6, frames['top_manufacturers'], frames['top_primary_uses'])
+    render_observations(tab7, frames['top_observations'], frames['observations_gender'])
+    render_diagnostics(tab8, frames['top_diagnostics'], frames['diagnostics_gender'])
+    render_value_comparison(tab10, frames['manufacturer_comparison'])
+
 def data_source():
     # Load datasets
     # medical_file = st.secrets["public_url"]
 
-    # Extract the file URL from query parameters
-    file_url = st.query_params.get("file_url", None)
-
-    if not file_url:
-        # st.error("No File Found")
-        # raise Exception("No File Found")
-        file_url = st.secrets['file_url']
+    # Extract the file URLs from query parameters; file_url may be repeated, one per export
+    sources = st.query_params.get_all("file_url")
+    manifest_url = st.query_params.get("manifest_url", None) or st.secrets.get('manifest_url')
 
     try:
-        # Extract the filename from the URL or set a default name
-        filename = os.path.basename(file_url) or f"downloaded_file_{time.time()}"
-
-        # Save the file locally
-        local_file_path = os.path.join("downloads", filename)
-        os.makedirs(os.path.dirname(local_file_path), exist_ok=True)  # Ensure the directory exists
-
-        if os.path.exists(local_file_path):
-            medical_data = load_data(local_file_path)
-            return medical_data
+        if not sources and manifest_url:
+            # A JSON list of URLs or {"url", "client", "project"} entries
+            with open(download_dataset(manifest_url)) as manifest:
+                sources = json.load(manifest)
+        if not sources:
+            # st.error("No File Found")
+            # raise Exception("No File Found")
+            sources = st.secrets.get('sources') or st.secrets['file_url']
+            sources = [sources] if isinstance(sources, str) else list(sources)
+
+        # Downloads are cached per URL and content hash, and revalidated with the server.
+        # Several exports are fetched and parsed concurrently and combined into one dataset.
+        if len(sources) == 1 and isinstance(sources[0], str):
+            local_file_path = download_dataset(sources[0])
         else:
-            # Fetch the file from the URL
-            response = requests.get(file_url)
-            response.raise_for_status()  # Raise an error for HTTP issues
-
-            with open(local_file_path, "wb") as f:
-                f.write(response.content)
-
-            medical_data = load_data(local_file_path)
-            return medical_data
+            local_file_path = combine_sources([
+                source if isinstance(source, str) else dict(source) for source in sources
+            ])
+
+        # New records published separately are merged into the cached dataset
+        delta_url = st.query_params.get("delta_url", None) or st.secrets.get('delta_url')
+        if delta_url:
+            if streaming.enabled(local_file_path) and read_manifest(local_file_path) is None:
+                # Streaming mode reads the raw file, and building a snapshot to merge into would
+                # load all of it into memory
+                st.warning("New records are not merged: the dataset is streamed and has no snapshot.")
+            else:
+                append_records(local_file_path, download_dataset(delta_url))
+        return local_file_path
     except requests.exceptions.RequestException as e:
         st.error(f"Error fetching file: {e}")
 
@@ -1400,24 +1497,39 @@ def main():
 
     # Load datasets
 
-    medical_data = data_source()
-    medical_data['min_mrp'] = pd.to_numeric(medical_data['min_mrp'], errors='coerce')
-    medical_data['max_mrp'] = pd.to_numeric(medical_data['max_mrp'], errors='coerce')
+    source_path = data_source()
+    if source_path is None:
+        return
+    revision = dataset_revision(source_path)
+    # Datasets too large for memory are aggregated batch by batch instead of being loaded
+    streamed = streaming.enabled(source_path)
 
     # Sidebar filters for patient data
     # Sidebar filters for patient data
     st.sidebar.title("Rx Analytics Filters")
 
- 
-    # Existing filters
-    state_filter = get_state_filter(medical_data)
-    city_filter = get_city_filter(medical_data, state_filter)
-    pincode_filter = get_pincode_filter(medical_data, state_filter, city_filter)
-    speciality_filter = get_speciality_filter(medical_data, pincode_filter)
-
-    # New filters for Client and Project
-    client_filter = get_client_filter(medical_data)  # Implement this function to get client options
-    project_filter = get_project_filter(medical_data,client_filter)  # Implement this function to get project options
+    if streamed:
+        filters = get_streamed_filters(load_filter_options(source_path, revision))
+    else:
+        # The full dataset only feeds the filter options; analysis loads the selected date range.
+        # Both load only the columns their filters and views declared with uses_columns.
+        medical_data = load_data(source_path, revision=revision,
+                                 columns=project_columns(get_speciality_filter, get_client_filter, get_project_filter))
+        bridges = load_bridge_tables(source_path, revision)
+        vital_facts = load_vital_fact_table(source_path, revision)
+        vitals_matrix = load_vitals_matrix(source_path, revision)
+        vital_bounds = load_vital_bounds_table(source_path, revision)
+        vital_cells = load_vital_cells_table(source_path, revision)
+
+        # Existing filters
+        state_filter = get_state_filter(medical_data, bridges)
+        city_filter = get_city_filter(medical_data, bridges, state_filter)
+        pincode_filter = get_pincode_filter(medical_data, bridges, state_filter, city_filter)
+        speciality_filter = get_speciality_filter(medical_data, bridges, pincode_filter)
+
+        # New filters for Client and Project
+        client_filter = get_client_filter(medical_data)  # Implement this function to get client options
+        project_filter = get_project_filter(medical_data,client_filter)  # Implement this function to get project options
 
 
     st.sidebar.header("Analytics Time Period")
@@ -1489,17 +1601,27 @@ def main():
 
     title_placeholder.title(f"From: {start_date.strftime('%d-%m-%Y')} to {end_date.strftime('%d-%m-%Y')}")
 
+    if streamed:
+        visualize_streamed_aggregates(source_path, start_date, end_date, revision, filters)
+        return
+
+    # The loaded data is already clean, so filtering only ever slices it
     filtered_medical_data = filter_by_date_range(
-        clean_medical_data(
-            apply_filters(
-                medical_data,
-                state_filter,
-                city_filter,
-                pincode_filter,
-                speciality_filter,
-                client_filter,
-                project_filter
-            )
+        apply_filters(
+            load_data(source_path, start_date, end_date, revision, project_columns(
+                apply_filters, filter_by_date_range, display_sidebar_totals,
+                visualize_manufacturer_medicines, visualize_data_types, visualize_geographical_distribution,
+                visualize_patient_demographics, visualize_medicines, visualize_pharma_analytics,
+                visualize_observations, visualize_diagnostics, manufacturer_comparison_tab,
+                visualize_value_comparison, visualize_market_share_primary_use, visualize_vitals,
+            ), cleaned=True),
+            bridges,
+            state_filter,
+            city_filter,
+            pincode_filter,
+            speciality_filter,
+            client_filter,
+            project_filter
         ),
         start_date,
         end_date
@@ -1526,19 +1648,27 @@ def main():
     ])
     display_sidebar_totals(filtered_medical_data)
 
-    # Visualizations for each tab
-    visualize_manufacturer_medicines(tab1, filtered_medical_data)
-    visualize_data_types(tab2, filtered_medical_data)
-    visualize_geographical_distribution(tab3, filtered_medical_data)
-    visualize_patient_demographics(tab4, filtered_medical_data)
-    visualize_medicines(tab5, filtered_medical_data)
-    visualize_pharma_analytics(tab6, filtered_medical_data)
-    visualize_observations(tab7, filtered_medical_data)
-    visualize_diagnostics(tab8, filtered_medical_data)
-    manufacturer_comparison_tab(tab9, filtered_medical_data)
-    visualize_value_comparison(tab10, filtered_medical_data)
-    visualize_market_share_primary_use(tab11, filtered_medical_data)
-    visualize_vitals(tab12, filtered_medical_data)
+    # Visualizations for each tab, each given only the columns it declared
+    def view_data(view):
+        return select_columns(filtered_medical_data, view.columns)
+
+    visualize_manufacturer_medicines(tab1, view_data(visualize_manufacturer_medicines), bridges)
+    visualize_data_types(tab2, view_data(visualize_data_types))
+    visualize_geographical_distribution(tab3, view_data(visualize_geographical_distribution), bridges)
+    visualize_patient_demographics(tab4, view_data(visualize_patient_demographics))
+    visualize_medicines(tab5, view_data(visualize_medicines), bridges)
+    visualize_pharma_analytics(tab6, view_data(visualize_pharma_analytics), bridges)
+    visualize_observations(tab7, view_data(visualize_observations))
+    visualize_diagnostics(tab8, view_data(visualize_diagnostics))
+    manufacturer_comparison_tab(tab9, view_data(manufacturer_comparison_tab), bridges)
+    visualize_value_comparison(tab10, view_data(visualize_value_comparison))
+    visualize_market_share_primary_use(tab11, view_data(visualize_market_share_primary_use), bridges)
+    # The stored vitals cells only know the day and state of each reading
+    if not (city_filter or pincode_filter or speciality_filter or client_filter or project_filter):
+        vital_cells = vitals.select_cells(vital_cells, start_date, end_date, state_filter)
+    else:
+        vital_cells = None
+    visualize_vitals(tab12, view_data(visualize_vitals), vital_facts, vitals_matrix, vital_bounds, vital_cells)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,114 @@
+"""
+Optional SQL execution of the dashboard filters and aggregations.
+
+Set DASHBOARD_SQL_BACKEND=duckdb to run them in DuckDB, which queries the pandas frames in
+place through Arrow with multi-threaded execution. Unset, set to anything else, or without
+duckdb installed, the dashboards keep their pandas code paths. Every function returns the
+same columns as the pandas code it replaces.
+
+DuckDB only sees frames the dashboard has already loaded (load_frame and the exploded
+multi-value columns), not the Parquet snapshot, so this does not lift the memory limit:
+a dataset must still fit in RAM, and larger ones go through streaming.py instead.
+"""
+import logging
+import os
+
+import numpy as np
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+BACKEND = os.environ.get('DASHBOARD_SQL_BACKEND', '').strip().lower()
+if BACKEND and BACKEND != 'duckdb':
+    logger.warning("Unknown DASHBOARD_SQL_BACKEND=%s; using pandas", BACKEND)
+    BACKEND = ''
+elif BACKEND and duckdb is None:
+    logger.warning("DASHBOARD_SQL_BACKEND=duckdb but duckdb is not installed; using pandas")
+    BACKEND = ''
+
+
+def query(sql, params=(), **tables):
+    """Runs sql in DuckDB with every keyword frame available as a table of that name."""
+    with duckdb.connect() as con:
+        for name, frame in tables.items():
+            con.register(name, frame)
+        return con.execute(sql, list(params)).df()
+
+def filter_rows(data, filters):
+    """
+    The rows of data whose column is one of the given values, for every non-empty
+    {column: values} entry of filters (the apply_filters isin filters).
+    """
+    filters = {column: list(values) for column, values in filters.items() if values}
+    if not filters:
+        return data
+    table = data[list(filters)].reset_index(drop=True).assign(_position=np.arange(len(data)))
+    where = " AND ".join(f'"{column}" IN ({", ".join(["?"] * len(values))})' for column, values in filters.items())
+    params = [value for values in filters.values() for value in values]
+    positions = query(f"SELECT _position FROM data WHERE {where} ORDER BY _position", params, data=table)
+    return data.iloc[positions['_position'].to_numpy()]
+
+def aggregate_geo_data(data, group_by_column, count_column):
+    return query(
+        f"""
+        SELECT "{group_by_column}", COUNT(DISTINCT "{count_column}") AS count
+        FROM data
+        WHERE "{group_by_column}" IS NOT NULL
+        GROUP BY "{group_by_column}"
+        ORDER BY count DESC, "{group_by_column}"
+        """,
+        data=data[[group_by_column, count_column]],
+    )
+
+def get_top_items(data, value_column, item_type):
+    return query(
+        f"""
+        SELECT UPPER("{value_column}") AS "{item_type}", COUNT(*) AS count
+        FROM data
+        WHERE type = ? AND "{value_column}" IS NOT NULL
+        GROUP BY 1
+        ORDER BY count DESC, 1
+        """,
+        [item_type],
+        data=data[['type', value_column]],
+    )
+
+def count_by_gender(data, item_type):
+    """Rows of item_type per (value, gender), ordered by the total of each value (analyze_*_by_gender)."""
+    return query(
+        """
+        SELECT value, gender, count
+        FROM (
+            SELECT value, gender, count, SUM(count) OVER (PARTITION BY value) AS total
+            FROM (
+                SELECT UPPER(value) AS value, UPPER(gender) AS gender, COUNT(*) AS count
+                FROM data
+                WHERE type = ? AND value IS NOT NULL AND gender IS NOT NULL
+                GROUP BY 1, 2
+            ) AS grouped
+        ) AS totals
+        ORDER BY total DESC, value, gender
+        """,
+        [item_type],
+        data=data[['type', 'value', 'gender']],
+    )
+
+def value_comparison(data):
+    """Total and average MRP value and distinct patients per manufacturer."""
+    return query(
+        """
+        SELECT manufacturers,
+               COALESCE(SUM(average_mrp), 0) AS Total_Value,
+               AVG(average_mrp) AS Average_Value,
+               COUNT(DISTINCT id) AS Patient_Count
+        FROM data
+        WHERE manufacturers IS NOT NULL
+        GROUP BY manufacturers
+        ORDER BY manufacturers
+        """,
+        data=data[['manufacturers', 'average_mrp', 'id']],
+    )
@@ -0,0 +1,291 @@
+"""
+Out-of-core aggregation for datasets too large to load into memory at once.
+
+The dataset is read STREAM_BATCH_ROWS rows at a time (from its snapshot when there is a
+fresh one, otherwise straight from the raw file), and every batch is filtered and reduced
+to partial aggregates that merge with those of the batches before it: counts and sums,
+HyperLogLog sketches for distinct patients and doctors, and top-k counters capped at
+TOP_K_CAPACITY entries. Memory is bounded by the batch size and the number of groups,
+not by the number of rows. finalize() turns the merged partials into the frames the
+dashboard tabs render.
+
+Set DASHBOARD_STREAMING=1 to use it for every dataset; datasets larger than
+STREAMING_THRESHOLD_BYTES use it automatically.
+"""
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as pads
+
+from data_store import (PARTITION_COLUMN, apply_schema, build_bridges, clean_columns, explode_values, iter_source,
+                        month_bounds, read_manifest, recode_categories, rows_with_values, select_months,
+                        snapshot_path, with_cleaned)
+
+logger = logging.getLogger(__name__)
+
+# Stream every dataset, or only those larger than STREAMING_THRESHOLD_BYTES
+STREAMING = os.environ.get('DASHBOARD_STREAMING', '').strip().lower() in ('1', 'true', 'yes')
+STREAMING_THRESHOLD_BYTES = int(os.environ.get('DASHBOARD_STREAMING_THRESHOLD_BYTES', 2 << 30))
+STREAM_BATCH_ROWS = 250_000
+# 2 ** HLL_PRECISION one-byte registers per sketch; the standard error is 1.04 / sqrt(registers)
+HLL_PRECISION = 12
+# Top-k counters keep the TOP_K_CAPACITY largest counts after every merge
+TOP_K_CAPACITY = 5_000
+# Columns the streamed tabs and filters read
+STREAM_COLUMNS = [
+    'start_time', 'doctor_id', 'id', 'speciality', 'state_name', 'city', 'pincode', 'client', 'project',
+    'age', 'gender', 'type', 'value', 'min_mrp', 'max_mrp', 'primary_use', 'manufacturers',
+]
+# Aggregates that are HyperLogLog sketches, and the counters capped at TOP_K_CAPACITY
+SKETCHES = ['doctors', 'patients', 'patient_state', 'doctor_state', 'patient_city', 'doctor_city', 'age_group',
+            'gender', 'speciality', 'value_patients']
+TOP_K = ['medicine', 'medicine_primary_use', 'observation', 'observation_gender', 'diagnostic',
+         'diagnostic_gender', 'manufacturers', 'primary_use']
+# The age groups of prepare_demographics in the dashboards
+AGE_BINS = [0, 18, 25, 30, 40, 50, 60, 70, 100]
+AGE_LABELS = ['<18', '18-25', '25-30', '30-40', '40-50', '50-60', '60-70', '70+']
+
+
+def enabled(file_path):
+    """Whether file_path is aggregated in streaming mode instead of being loaded whole."""
+    return STREAMING or os.path.getsize(file_path) > STREAMING_THRESHOLD_BYTES
+
+def iter_batches(file_path, columns=STREAM_COLUMNS, start_date=None, end_date=None, batch_rows=STREAM_BATCH_ROWS):
+    """
+    Yields the rows of file_path in the months overlapping [start_date, end_date] as frames
+    of at most batch_rows rows, with a fresh RangeIndex each.
+    """
+    first_month, last_month = month_bounds(start_date, end_date)
+    if read_manifest(file_path) is not None:
+        dataset = pads.dataset(snapshot_path(file_path), format='parquet', partitioning='hive')
+        months = pc.field(PARTITION_COLUMN)
+        batches = dataset.to_batches(
+            columns=[column for column in columns if column in dataset.schema.names],
+            filter=(months >= first_month) & (months <= last_month),
+            batch_size=batch_rows,
+        )
+        # Every month partition is its own file, so small batches are gathered up to batch_rows
+        pending = []
+        pending_rows = 0
+        for batch in batches:
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            if pending_rows >= batch_rows:
+                yield pa.Table.from_batches(pending).to_pandas()
+                pending = []
+                pending_rows = 0
+        if pending_rows:
+            yield pa.Table.from_batches(pending).to_pandas()
+        return
+
+    for chunk in iter_source(file_path, batch_rows):
+        chunk = chunk[[column for column in chunk.columns if column in columns]]
+        chunk = select_months(apply_schema(chunk), start_date, end_date)
+        if len(chunk):
+            yield chunk.reset_index(drop=True)
+
+def sketch(groups, values):
+    """HyperLogLog sketches of the distinct values per group: {group: uint8 registers}."""
+    keep = groups.notna().to_numpy() & values.notna().to_numpy()
+    groups = groups[keep]
+    if groups.empty:
+        return {}
+    hashes = pd.util.hash_pandas_object(values[keep].astype(str), index=False).to_numpy()
+    registers = (hashes >> np.uint64(64 - HLL_PRECISION)).astype(np.int64)
+    rest = hashes & np.uint64((1 << (64 - HLL_PRECISION)) - 1)
+    # Rank = leading zeros of the remaining bits + 1; the bit length is exact through the two 32-bit halves
+    high = (rest >> np.uint64(32)).astype(np.float64)
+    low = (rest & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    bit_length = np.where(high > 0, 32 + np.frexp(high)[1], np.frexp(low)[1])
+    ranks = (64 - HLL_PRECISION + 1 - bit_length).astype(np.uint8)
+
+    group_codes, group_values = pd.factorize(groups.to_numpy())
+    cells = pd.Series(ranks).groupby(group_codes * (1 << HLL_PRECISION) + registers).max()
+    sketches = np.zeros((len(group_values), 1 << HLL_PRECISION), dtype=np.uint8)
+    sketches.reshape(-1)[cells.index.to_numpy()] = cells.to_numpy()
+    return dict(zip(group_values, sketches))
+
+def merge_sketches(sketches, new_sketches):
+    merged = dict(sketches)
+    for group, registers in new_sketches.items():
+        merged[group] = np.maximum(merged[group], registers) if group in merged else registers
+    return merged
+
+def estimate(registers):
+    """The HyperLogLog estimate of the number of distinct values in a sketch."""
+    size = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / size)
+    raw = alpha * size * size / np.sum(np.exp2(-registers.astype(np.float64)))
+    empty = np.count_nonzero(registers == 0)
+    if raw <= 2.5 * size and empty:
+        # Linear counting is more accurate for small cardinalities
+        return int(round(size * np.log(size / empty)))
+    return int(round(raw))
+
+def distinct_counts(sketches, name, count_name='count'):
+    """Estimated distinct count per group, largest first, as a [name, count_name] frame."""
+    counts = pd.DataFrame({
+        name: list(sketches),
+        count_name: [estimate(registers) for registers in sketches.values()],
+    })
+    return counts.sort_values(by=[count_name, name], ascending=[False, True]).reset_index(drop=True)
+
+def merge_counts(counts, new_counts, capacity=None):
+    """Sum of two count Series; with a capacity, only the capacity largest are kept."""
+    merged = counts.add(new_counts, fill_value=0) if counts is not None else new_counts
+    if capacity is not None and len(merged) > capacity:
+        merged = merged.nlargest(capacity)
+    return merged
+
+def batch_aggregates(data):
+    """The partial aggregates of one filtered batch, keyed by name."""
+    # Batches are cleaned as they come; there is no cleaned dataset to read them from
+    data = with_cleaned(data, clean_columns(data))
+    bridges = build_bridges(data)
+    states = explode_values(data[['id', 'doctor_id']], bridges, 'state_name')
+    cities = explode_values(data[['id', 'doctor_id']], bridges, 'city')
+    everyone = pd.Series('all', index=data.index)
+
+    # Keys are plain strings, so partials of batches with different categories add up
+    types = data['type'].astype(object)
+    values = data['value'].astype(object).where(data['value'].notna())
+    values = values.str.strip().str.upper()
+    genders = data['gender'].astype(object).str.upper()
+    manufacturers = data['manufacturers'].astype(object)
+    age_groups = pd.cut(data['age'], bins=AGE_BINS, labels=AGE_LABELS).astype(object)
+    patient_genders = recode_categories(data['gender'], {"": "Not Provided"}).astype(object).str.upper()
+
+    medicines = pd.DataFrame({'value': values})[types == 'Medicine']
+    medicines = medicines.dropna(subset=['value'])
+    medicine_uses = explode_values(medicines, bridges, 'primary_use')
+    medicine_uses['primary_use'] = medicine_uses['primary_use'].astype(str)
+    primary_uses = explode_values(data[[]], bridges, 'primary_use')['primary_use'].astype(str)
+
+    aggregates = {
+        'doctors': sketch(everyone, data['doctor_id']),
+        'patients': sketch(everyone, data['id']),
+        'patient_state': sketch(states['state_name'].astype(object), states['id']),
+        'doctor_state': sketch(states['state_name'].astype(object), states['doctor_id']),
+        'patient_city': sketch(cities['city'].astype(object), cities['id']),
+        'doctor_city': sketch(cities['city'].astype(object), cities['doctor_id']),
+        'age_group': sketch(age_groups, data['id']),
+        'gender': sketch(patient_genders, data['id']),
+        'speciality': sketch(data['speciality'].astype(object), data['doctor_id']),
+        'type': types.str.capitalize().value_counts(),
+        'medicine': medicines['value'].value_counts(),
+        'medicine_primary_use': medicine_uses.groupby(['primary_use', 'value']).size(),
+        'manufacturers': manufacturers.str.upper().value_counts(),
+        'primary_use': primary_uses.value_counts(),
+        'value_total': data['average_mrp'].groupby(manufacturers).sum(),
+        'value_count': data['average_mrp'].groupby(manufacturers).count(),
+        'value_patients': sketch(manufacturers, data['id']),
+    }
+    for item_type in ['Observation', 'Diagnostic']:
+        items = pd.DataFrame({'value': values, 'gender': genders})[types == item_type]
+        items = items[items['value'].notna() & (items['value'] != '')]
+        name = item_type.lower()
+        aggregates[name] = items['value'].value_counts()
+        aggregates[f'{name}_gender'] = items.dropna(subset=['gender']).groupby(['value', 'gender']).size()
+    return aggregates
+
+def merge_aggregates(aggregates, new_aggregates):
+    """Combines the partial aggregates of two sets of batches."""
+    if aggregates is None:
+        return new_aggregates
+    merged = {}
+    for name, new in new_aggregates.items():
+        if name in SKETCHES:
+            merged[name] = merge_sketches(aggregates[name], new)
+        else:
+            merged[name] = merge_counts(aggregates[name], new, TOP_K_CAPACITY if name in TOP_K else None)
+    return merged
+
+def filter_batch(data, start_date, end_date, filters, pincode_filter=None):
+    """
+    The rows of a batch inside [start_date, end_date] whose column is one of the given values
+    for every non-empty {column: values} entry of filters, and that hold one of pincode_filter.
+    """
+    keep = np.ones(len(data), dtype=bool)
+    if 'start_time' in data.columns:
+        start_time = pd.to_datetime(data['start_time'], errors='coerce')
+        keep &= ((start_time >= pd.to_datetime(start_date)) & (start_time <= pd.to_datetime(end_date))).to_numpy()
+    for column, values in filters.items():
+        if values and column in data.columns:
+            keep &= data[column].isin(values).to_numpy()
+    if pincode_filter:
+        keep &= rows_with_values(data, build_bridges(data[['pincode']]), 'pincode', pincode_filter)
+    return data[keep].reset_index(drop=True)
+
+def aggregate(file_path, start_date, end_date, filters, pincode_filter=None):
+    """
+    Streams file_path and returns the merged aggregates of the rows filter_batch keeps, or None
+    when there are none.
+    """
+    aggregates = None
+    rows = 0
+    for batch in iter_batches(file_path, start_date=start_date, end_date=end_date):
+        batch = filter_batch(batch, start_date, end_date, filters, pincode_filter)
+        if batch.empty:
+            continue
+        rows += len(batch)
+        aggregates = merge_aggregates(aggregates, batch_aggregates(batch))
+    logger.info("Aggregated %d rows of %s in streaming mode", rows, file_path)
+    return aggregates
+
+def filter_options(file_path):
+    """Every value each sidebar filter can offer, split like the bridge tables split them."""
+    options = {}
+    for batch in iter_batches(file_path, columns=['state_name', 'city', 'pincode', 'speciality', 'client', 'project']):
+        bridges = build_bridges(batch)
+        for column in ['state_name', 'city', 'pincode']:
+            if column in bridges:
+                options.setdefault(column, set()).update(bridges[column]['values'])
+        for column in ['speciality', 'client', 'project']:
+            if column in batch.columns:
+                options.setdefault(column, set()).update(batch[column].dropna().astype(str))
+    return {column: sorted(values) for column, values in options.items()}
+
+def finalize(aggregates):
+    """The frames the streamed tabs render, from merged aggregates."""
+    def counts_frame(counts, name, count_name='count'):
+        return counts.astype(int).sort_values(ascending=False).rename_axis(name).reset_index(name=count_name)
+
+    def by_gender(counts):
+        frame = counts.astype(int).rename_axis(['value', 'gender']).reset_index(name='count')
+        frame['total'] = frame.groupby('value')['count'].transform('sum')
+        return frame.sort_values(by=['total', 'value', 'gender'], ascending=[False, True, True]).drop(columns='total')
+
+    age_group_counts = distinct_counts(aggregates['age_group'], 'age_group')
+    age_group_counts['age_group'] = pd.Categorical(age_group_counts['age_group'], categories=AGE_LABELS, ordered=True)
+    value_patients = distinct_counts(aggregates['value_patients'], 'manufacturers', 'Patient_Count')
+    manufacturer_comparison = pd.DataFrame({
+        'Total_Value': aggregates['value_total'],
+        'Average_Value': aggregates['value_total'] / aggregates['value_count'],
+    }).rename_axis('manufacturers').reset_index().merge(value_patients, on='manufacturers', how='left')
+    speciality_counts = distinct_counts(aggregates['speciality'], 'Speciality', 'Count')
+    return {
+        'total_doctors': estimate(aggregates['doctors']['all']) if aggregates['doctors'] else 0,
+        'total_patients': estimate(aggregates['patients']['all']) if aggregates['patients'] else 0,
+        'type_counts': counts_frame(aggregates['type'], 'Type', 'Count'),
+        'speciality_counts': speciality_counts.sort_values(by='Speciality').reset_index(drop=True),
+        'patient_state_counts': distinct_counts(aggregates['patient_state'], 'state_name'),
+        'patient_city_counts': distinct_counts(aggregates['patient_city'], 'city'),
+        'doctor_state_counts': distinct_counts(aggregates['doctor_state'], 'state_name'),
+        'doctor_city_counts': distinct_counts(aggregates['doctor_city'], 'city'),
+        'age_group_counts': age_group_counts,
+        'gender_counts': distinct_counts(aggregates['gender'], 'gender'),
+        'top_medicines': counts_frame(aggregates['medicine'], 'Medicine'),
+        'medicines_by_primary_use': aggregates['medicine_primary_use'].astype(int).rename_axis(
+            ['exploded_primary_use', 'value']).reset_index(name='count'),
+        'top_manufacturers': counts_frame(aggregates['manufacturers'], 'manufacturers'),
+        'top_primary_uses': counts_frame(aggregates['primary_use'], 'primary_use'),
+        'top_observations': counts_frame(aggregates['observation'], 'Observation'),
+        'observations_gender': by_gender(aggregates['observation_gender']),
+        'top_diagnostics': counts_frame(aggregates['diagnostic'], 'Diagnostic'),
+        'diagnostics_gender': by_gender(aggregates['diagnostic_gender']),
+        'manufacturer_comparison': manufacturer_comparison,
+    }
@@ -0,0 +1,135 @@
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+import data_store
+import generate_dataset
+import vitals
+
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Generated_Random_Dataset.csv')
+
+
+def sample():
+    """The bundled sample dataset, oldest records first."""
+    data = pd.read_csv(SAMPLE)
+    return data.sort_values('start_time', kind='stable', ignore_index=True)
+
+def test_append_records_takes_late_records_once(tmp_path):
+    data = sample()
+    base_path, delta_path = str(tmp_path / 'base.csv'), str(tmp_path / 'delta.csv')
+    # The 20 oldest records arrive late, along with 30 that are stored already
+    late, base = data.iloc[:20], data.iloc[20:]
+    base.to_csv(base_path, index=False)
+    pd.concat([late, base.iloc[-30:]]).to_csv(delta_path, index=False)
+
+    assert data_store.append_records(base_path, delta_path) == 20
+    assert data_store.append_records(base_path, delta_path) == 0
+    stored = data_store.load_frame(base_path)
+    assert len(stored) == len(data)
+    assert sorted(stored['row_number']) == sorted(data['row_number'])
+
+def comparable(table, keys):
+    """table in a canonical row order, with categoricals and arrays as plain values."""
+    table = table.astype({column: object for column in table.columns if table[column].dtype != 'float32'})
+    table = table.apply(lambda column: column.map(lambda value: tuple(value) if isinstance(value, np.ndarray) else value))
+    return table.sort_values(keys).reset_index(drop=True) if keys else table.reset_index(drop=True)
+
+def test_appended_rows_extend_derived_tables(tmp_path):
+    data = pd.concat(generate_dataset.generate(20_000, seed=3), ignore_index=True)
+    base_path, delta_path = str(tmp_path / 'base.csv'), str(tmp_path / 'delta.csv')
+    data.iloc[:-300].to_csv(base_path, index=False)
+    data.iloc[-300:].to_csv(delta_path, index=False)
+    loaders = [data_store.load_cleaned, data_store.load_vital_facts, data_store.load_patient_vitals,
+               data_store.load_vital_bounds, data_store.load_vital_cells]
+    for load in loaders:
+        load(base_path)
+    assert data_store.append_records(base_path, delta_path) == 300
+    extended = [load(base_path) for load in loaders]
+
+    cleaned = data_store.clean_columns(data_store.load_frame(base_path, columns=data_store.CLEANING_SOURCE_COLUMNS))
+    facts = vitals.build_facts(data_store.load_frame(base_path, columns=vitals.FACT_SOURCE_COLUMNS, cleaned=True))
+    matrix = vitals.patient_matrix(facts)
+    bounds = vitals.robust_bounds(facts, matrix)
+    cells = vitals.build_cells(facts, bounds)
+    keys = [None, ['row'], ['id'], ['vital', 'reading', *vitals.STRATA], vitals.CELL_KEYS]
+    for table, rebuilt, table_keys in zip(extended, [cleaned, facts, matrix, bounds, cells], keys):
+        pd.testing.assert_frame_equal(comparable(table, table_keys), comparable(rebuilt, table_keys),
+                                      check_dtype=False, check_exact=False, rtol=1e-9)
+
+def test_snapshot_round_trip_keeps_schema_and_row_positions(tmp_path):
+    path = str(tmp_path / 'data.csv')
+    sample().to_csv(path, index=False)
+    fresh = data_store.ingest(data_store.read_source(path))
+    for column, dtype in data_store.SCHEMA.items():
+        if dtype.startswith('datetime64'):
+            # pandas may pick a coarser unit than the declared one
+            assert pd.api.types.is_datetime64_dtype(fresh[column])
+        else:
+            assert fresh[column].dtype == dtype
+    data = data_store.load_frame(path)
+    pd.testing.assert_frame_equal(data, fresh)
+    # A month range reads only its partitions, and each row keeps its position in the dataset
+    months = data['start_time'].dt.strftime('%Y-%m')
+    expected = data[months.between('2023-03', '2023-05')]
+    spring = data_store.load_frame(path, '2023-03-10', '2023-05-02')
+    assert spring.index.tolist() == expected.index.tolist()
+    pd.testing.assert_frame_equal(spring.astype(object), expected.astype(object))
+
+def naive_split(entry, column):
+    separator, normalize = data_store.MULTI_VALUE_FIELDS[column]
+    if pd.isna(entry):
+        return []
+    return [value for value in map(normalize, re.split(separator, str(entry))) if value]
+
+def test_bridge_tables_match_naive_splitting():
+    rng = np.random.default_rng(11)
+    pieces = ['Pain ', ' fever', 'cough', 'pain', '', ' ']
+    separators = [',', '/', '|']
+    entries = [
+        np.nan if rng.random() < 0.1 else ''.join(
+            piece + separators[rng.integers(len(separators))] for piece in rng.choice(pieces, rng.integers(1, 4)))
+        for _ in range(500)
+    ]
+    data = pd.DataFrame({'primary_use': entries, 'city': entries[::-1]})
+    bridges = data_store.build_bridges(data)
+    subset = data.iloc[np.sort(rng.choice(len(data), 200, replace=False))]
+    for column in ['primary_use', 'city']:
+        exploded = data_store.explode_values(subset, bridges, column, 'item')
+        expected = [(row, value) for row, entry in subset[column].items() for value in naive_split(entry, column)]
+        assert list(zip(exploded.index, exploded['item'])) == expected
+        wanted = ['PAIN', 'fever']
+        mask = data_store.rows_with_values(subset, bridges, column, wanted)
+        assert mask.tolist() == [any(value in wanted for value in naive_split(entry, column)) for entry in subset[column]]
+
+def brute_force_rule(value, rules):
+    for index, (kind, pattern, _) in enumerate(rules):
+        if (kind == 'substring' and pattern.lower() in value or kind == 'exact' and pattern.lower() == value
+                or kind == 'regex' and re.search(pattern, value)):
+            return index
+    return len(rules)
+
+def test_value_rules_match_by_priority(tmp_path):
+    rng = np.random.default_rng(5)
+    patterns = {
+        'substring': ['a', 'ab', 'ba', 'Abc', 'bb', 'cab'],
+        'exact': ['a', 'abc', 'BA', 'c c'],
+        'regex': ['a+c', '^b', 'ca$', r'\bc'],
+    }
+    rules = []
+    for index in range(30):
+        kind = data_store.VALUE_RULE_KINDS[rng.integers(3)]
+        rules.append((kind, rng.choice(patterns[kind]), f'name{index}'))
+    rules_path = tmp_path / 'rules.csv'
+    pd.DataFrame(rules, columns=['kind', 'pattern', 'name']).to_csv(rules_path, index=False)
+    compiled = data_store.compile_value_rules(str(rules_path))
+    for _ in range(2000):
+        value = ''.join(rng.choice(list('abc '), rng.integers(0, 8)))
+        assert data_store.match_rule(value, compiled) == brute_force_rule(value, rules)
+
+    normalized = data_store.normalize_values(pd.Series(['CAB', 'Zz', np.nan, 'c c']), str(rules_path))
+    expected = [rules[rule][2] if rule < len(rules) else value
+                for value, rule in ((value, brute_force_rule(value, rules)) for value in ['cab', 'zz', 'c c'])]
+    assert normalized.drop(2).tolist() == expected and pd.isna(normalized[2])
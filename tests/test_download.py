@@ -0,0 +1,115 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import data_store
+
+
+class ExportHandler(BaseHTTPRequestHandler):
+    """Serves the server's body under its ETag, answering conditional and Range requests."""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == server.etag:
+            self.send_response(304)
+            self.send_header('ETag', server.etag)
+            self.end_headers()
+            server.statuses.append(304)
+            return
+        start = 0
+        if self.headers.get('Range') and self.headers.get('If-Range') == server.etag:
+            start = int(self.headers['Range'].removeprefix('bytes=').rstrip('-'))
+        body = server.body[start:]
+        self.send_response(206 if start else 200)
+        self.send_header('ETag', server.etag)
+        self.send_header('Content-Length', str(len(body)))
+        if start:
+            self.send_header('Content-Range', f'bytes {start}-{len(server.body) - 1}/{len(server.body)}')
+        self.end_headers()
+        server.statuses.append(206 if start else 200)
+        if server.truncate_at is not None:
+            # Drop the connection part way through the body
+            self.wfile.write(body[:server.truncate_at])
+            server.truncate_at = None
+            self.close_connection = True
+            if server.next_version:
+                # The export changes upstream before the download is resumed
+                (server.body, server.etag), server.next_version = server.next_version, None
+            return
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ExportHandler)
+    server.body, server.etag, server.truncate_at = b'id,value\n1,CBC\n', '"v1"', None
+    server.next_version = None
+    server.requests, server.statuses = [], []
+    server.url = f"http://127.0.0.1:{server.server_port}/export.csv"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def revalidate_every_time(monkeypatch):
+    monkeypatch.setattr(data_store, 'REVALIDATE_SECONDS', 0)
+    monkeypatch.setattr(data_store, 'DOWNLOAD_RETRY_DELAY', 0)
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    # Chunks are written as they arrive, so a dropped connection keeps those before it
+    monkeypatch.setattr(data_store, 'DOWNLOAD_CHUNK_BYTES', 100)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def test_unchanged_file_is_revalidated_with_a_304(server, tmp_path):
+    first = data_store.download_dataset(server.url, str(tmp_path))
+    second = data_store.download_dataset(server.url, str(tmp_path))
+    assert second == first and read(second) == server.body
+    assert server.statuses == [200, 304]
+    assert server.requests[-1]['If-None-Match'] == '"v1"'
+
+def test_changed_file_gets_a_new_content_hash_path(server, tmp_path):
+    first = data_store.download_dataset(server.url, str(tmp_path))
+    server.body, server.etag = b'id,value\n1,CBC\n2,ESR\n', '"v2"'
+    second = data_store.download_dataset(server.url, str(tmp_path))
+    assert second != first and read(second) == server.body
+    assert not os.path.exists(first)
+
+def test_cached_copy_is_used_when_offline(server, tmp_path):
+    first = data_store.download_dataset(server.url, str(tmp_path))
+    server.shutdown()
+    server.server_close()
+    assert data_store.download_dataset(server.url, str(tmp_path)) == first
+    assert read(first) == b'id,value\n1,CBC\n'
+
+def test_truncated_download_is_resumed_with_a_range_request(server, tmp_path, small_chunks):
+    server.body = b'id,value\n' + b''.join(b'%d,CBC\n' % row for row in range(10_000))
+    server.truncate_at = 1000
+    path = data_store.download_dataset(server.url, str(tmp_path))
+    assert read(path) == server.body
+    assert server.statuses == [200, 206]
+    assert server.requests[-1]['Range'] == 'bytes=1000-'
+    assert server.requests[-1]['If-Range'] == '"v1"'
+
+def test_resume_refetches_the_whole_file_when_it_changed(server, tmp_path, small_chunks):
+    server.body = b'id,value\n' + b''.join(b'%d,CBC\n' % row for row in range(10_000))
+    server.truncate_at = 1000
+    server.next_version = (b'id,value\n' + b''.join(b'%d,ESR\n' % row for row in range(10_000)), '"v2"')
+    path = data_store.download_dataset(server.url, str(tmp_path))
+    assert read(path) == server.body and server.etag == '"v2"'
+    assert server.statuses == [200, 200]
+    assert server.requests[-1]['If-Range'] == '"v1"'
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import vitals
+
+
+SPO2 = 'Oxygen saturation (SpO2)'
+# One reading per registered vital type, with what its parser makes of it (None: invalid)
+PARSER_CASES = {
+    'blood pressure (bp)': ('120/80 mmHg', {'systolic': 120, 'diastolic': 80}),
+    'blood pressure': ('130/85', {'systolic': 130, 'diastolic': 85}),
+    'bp': ('120 mmHg', None),
+    'pulse': ('72 bpm', {'value': 72}),
+    'heart rate': ('88/min', {'value': 88}),
+    'weight': ('64.5 kg', {'value': 64.5}),
+    'oxygen saturation (spo2)': ('95-97 %', {'value': 96}),
+    'spo2': ('98', None),
+    'temperature': ('37.0 C', {'value': 98.6}),
+    'height': ('5\' 7"', {'value': 5 * vitals.CM_PER_FOOT + 7 * vitals.CM_PER_INCH}),
+    'respiratory rate': ('18/min', {'value': 18}),
+    'respiration rate': ('20 breaths', {'value': 20}),
+    'random blood sugar (rbs)': ('140 mg/dl', {'value': 140}),
+    'rbs': ('7.8 mmol/l', {'value': 7.8 * vitals.MG_DL_PER_MMOL_L}),
+}
+
+
+def spo2_facts(values):
+    """Valid SpO2 facts, one reading per patient, all of them in one (gender, age_group) stratum."""
+    return pd.DataFrame({
+        'row': range(len(values)),
+        'id': pd.Categorical([f"P{row}" for row in range(len(values))]),
+        'vital_type': pd.Categorical([SPO2] * len(values)),
+        'systolic': np.nan,
+        'diastolic': np.nan,
+        'value': np.array(values, dtype=vitals.READING_DTYPE),
+        'valid': True,
+        'age_group': pd.Categorical(['26-40'] * len(values), dtype=vitals.AGE_GROUP_DTYPE),
+        'gender': pd.Categorical(['FEMALE'] * len(values)),
+    })
+
+def test_stratum_with_one_dominant_value_is_not_clipped_to_it():
+    values = [98] * 35 + [92, 94, 95, 96, 97]
+    facts = spo2_facts(values)
+    bounds = vitals.robust_bounds(facts, vitals.patient_matrix(facts))
+    spo2 = bounds[bounds['vital'] == SPO2]
+    assert spo2['gender'].isna().all()
+    assert vitals.clip_outliers(facts, SPO2, 'value', bounds).tolist() == values
+
+def test_stratum_with_spread_clips_outliers():
+    values = [90 + row % 10 for row in range(39)] + [1000]
+    facts = spo2_facts(values)
+    bounds = vitals.robust_bounds(facts, vitals.patient_matrix(facts))
+    stratum = bounds[(bounds['vital'] == SPO2) & bounds['gender'].notna()].iloc[0]
+    clipped = vitals.clip_outliers(facts, SPO2, 'value', bounds)
+    assert clipped.tolist() == values[:-1] + [stratum['upper']]
+    assert stratum['upper'] < 1000
+
+def test_all_invalid_facts_give_empty_bounds_and_cells():
+    facts = spo2_facts([98] * 5).assign(value=np.nan, valid=False)
+    bounds = vitals.robust_bounds(facts, vitals.patient_matrix(facts))
+    assert bounds.empty and bounds.columns.tolist() == vitals.BOUNDS_COLUMNS
+    assert vitals.clip_outliers(facts, SPO2, 'value', bounds).isna().all()
+    assert vitals.build_cells(facts, bounds).empty
+
+def test_every_registered_vital_has_a_parser_case():
+    assert set(PARSER_CASES) == set(vitals.VITAL_PARSERS)
+
+@pytest.mark.parametrize('vital_type', sorted(PARSER_CASES))
+def test_parser_reads_its_vital(vital_type):
+    reading, expected = PARSER_CASES[vital_type]
+    parsed = vitals.parse_vital(pd.Series([reading, np.nan]), vital_type.title()).iloc[0]
+    assert parsed['valid'] == (expected is not None)
+    for column, value in (expected or {}).items():
+        assert parsed[column] == pytest.approx(value)
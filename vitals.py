@@ -0,0 +1,478 @@
+"""
+Vectorized parsers for the free-text vital sign readings, one per vital_type.
+
+Every parser takes the value column of the rows of one vital type and returns a frame on the
+same index with typed numeric columns and a boolean 'valid' column, False where the reading
+could not be parsed. Readings repeat a lot ('120/80 mmHg'), so each distinct reading is
+parsed once and the result is expanded back to the rows through the factorized codes.
+
+    parsed = parse_vital(data['value'], 'Blood pressure (BP)')   # systolic, diastolic, valid
+
+build_facts parses every vital row of a dataset at once into the typed fact table the
+vitals tab reads, which data_store.load_vital_facts stores with the snapshot, and
+patient_matrix pivots that table into one row per patient with derived metrics, and
+robust_bounds holds the quartiles and outlier fences of every reading that clip_outliers
+clips against. build_cells keeps mergeable statistics (moments and a t-digest) of the
+readings per day, state, gender and age group, so summaries of any date range and states
+merge cells instead of scanning readings.
+"""
+import numpy as np
+import pandas as pd
+
+# First number in a reading, e.g. '98.6' of '98.6 F' or '72' of '72/min'
+NUMBER_PATTERN = r'(\d+\.?\d*)'
+# Readings without a unit above this are taken as Fahrenheit, the rest as Celsius
+CELSIUS_MAX = 45
+# Heights without a unit below this are taken as feet, the rest as centimetres
+FEET_MAX = 8
+CM_PER_FOOT = 30.48
+CM_PER_INCH = 2.54
+# Blood sugar in mmol/L is converted to mg/dL
+MG_DL_PER_MMOL_L = 18.0
+# Age groups of the vitals tab; rows without an age are 'Unknown'
+AGE_BINS = [0, 18, 25, 40, 60, 200]
+AGE_LABELS = ["0-18", "19-25", "26-40", "41-60", "60+"]
+AGE_GROUP_DTYPE = pd.CategoricalDtype(AGE_LABELS + ["Unknown"], ordered=True)
+# The dataset columns build_facts reads
+FACT_SOURCE_COLUMNS = ['id', 'start_time', 'state_name', 'vital_type', 'value', 'age', 'gender']
+# Readings are stored in this dtype in the fact table
+READING_DTYPE = 'float32'
+# Bumped whenever build_facts or a parser changes what it derives, so fact tables stored by
+# an older version are rebuilt instead of read
+FACTS_VERSION = 4
+# Likewise for patient_matrix, robust_bounds and build_cells
+MATRIX_VERSION = 1
+BOUNDS_VERSION = 2
+CELLS_VERSION = 2
+# Readings further than OUTLIER_IQR_FACTOR interquartile ranges outside the quartiles are
+# clipped to that distance; a (gender, age_group) stratum needs MIN_STRATUM_READINGS
+# readings for fences of its own, smaller ones use the fences of the whole vital
+OUTLIER_IQR_FACTOR = 10
+MIN_STRATUM_READINGS = 30
+# The columns robust_bounds stratifies by, and those of the frame it returns
+STRATA = ['gender', 'age_group']
+BOUNDS_COLUMNS = ['vital', 'reading', *STRATA, 'count', 'q1', 'median', 'q3', 'lower', 'upper']
+# build_cells keeps one cell per combination of these; 'day' is the date of start_time and
+# 'timed' whether start_time has a time of day
+CELL_KEYS = ['vital', 'reading', 'day', 'timed', 'state_name', *STRATA]
+# The cells of these keys hold the readings of the same facts
+CELL_GROUP_KEYS = [key for key in CELL_KEYS if key != 'reading']
+# A t-digest keeps up to DIGEST_COMPRESSION distinct values exactly, as value and count,
+# and about half as many centroids once it holds more. Readings repeat a lot (pulse 72,
+# BP 120/80), so summaries of most vitals stay exact.
+DIGEST_COMPRESSION = 1000
+# The statistics of the vitals summary tables, in their order
+SUMMARY_STATISTICS = ['count', 'mean', 'median', 'std', 'min', 'max']
+
+
+def per_unique(parse):
+    """Runs parse(readings) over the distinct readings only, returning its result for every row."""
+    def parse_values(values):
+        codes, uniques = pd.factorize(values)
+        readings = pd.Series(uniques, dtype=object)
+        readings = readings.where(readings.isna(), readings.astype(str)).str.lower()
+        # Code -1 (missing) picks the appended row, which is not valid
+        parsed = parse(readings).reset_index(drop=True).reindex(range(len(uniques) + 1))
+        parsed['valid'] = parsed['valid'].fillna(False).astype(bool)
+        return parsed.iloc[codes].set_axis(values.index)
+    parse_values.__doc__ = parse.__doc__
+    return parse_values
+
+def first_number(readings):
+    return pd.to_numeric(readings.str.extract(NUMBER_PATTERN, expand=False), errors='coerce')
+
+def number_frame(value, valid):
+    return pd.DataFrame({'value': value.astype('float64'), 'valid': valid.fillna(False).astype(bool)})
+
+@per_unique
+def parse_blood_pressure(readings):
+    """'120/80 mmHg' -> systolic 120, diastolic 80; only readings with both (2-3 digits each) are valid."""
+    text = readings.str.replace('mmhg', '', regex=False).str.replace('mm/hg', '', regex=False).str.strip()
+    parts = text.str.extract(r'^(\d{2,3})/(\d{2,3})$')
+    parts = parts.apply(pd.to_numeric, errors='coerce')
+    return pd.DataFrame({
+        'systolic': parts[0].astype('float64'),
+        'diastolic': parts[1].astype('float64'),
+        'valid': parts.notna().all(axis=1),
+    })
+
+@per_unique
+def parse_pulse(readings):
+    """'72 bpm' -> 72; valid when the reading has a number."""
+    value = first_number(readings)
+    return number_frame(value, value.notna())
+
+@per_unique
+def parse_respiratory_rate(readings):
+    """'18/min' -> 18 breaths per minute; valid when the reading has a number."""
+    value = first_number(readings)
+    return number_frame(value, value.notna())
+
+@per_unique
+def parse_weight(readings):
+    """'64.5 kg' -> 64.5; valid when the reading is in kg and has a number."""
+    value = first_number(readings)
+    return number_frame(value, readings.str.contains('kg', regex=False) & value.notna())
+
+@per_unique
+def parse_oxygen_saturation(readings):
+    """
+    '97%' -> 97 and '95-97 %' -> 96 (the integer mean of a range); valid when the reading
+    is a percentage within 0-100. Longer numbers are cut to their first 2 digits, or 3 when
+    they start with 1 ('100.0' -> 100, '97.5' -> 97).
+    """
+    text = readings.str.split('%').str[0].str.strip()
+    ranges = text.str.extract(r'^\s*(\d+)\s*-\s*(\d+)\s*$').apply(pd.to_numeric, errors='coerce')
+    text = text.where(ranges[0].isna(), ((ranges[0] + ranges[1]) // 2).astype('Int64').astype(str))
+    text = text.str[:3].where(text.str[:1] == '1', text.str[:2])
+    value = pd.to_numeric(text, errors='coerce')
+    return number_frame(value, readings.str.contains('%', regex=False) & value.between(0, 100))
+
+@per_unique
+def parse_temperature(readings):
+    """'37.0 C' or '98.6 F' -> degrees Fahrenheit; unitless readings up to CELSIUS_MAX are Celsius."""
+    value = first_number(readings)
+    unit = readings.str.extract(r'\d\s*°?\s*([cf])\b', expand=False)
+    celsius = (unit == 'c') | (unit.isna() & (value <= CELSIUS_MAX))
+    return number_frame(value.where(~celsius, value * 9 / 5 + 32), value.notna())
+
+@per_unique
+def parse_height(readings):
+    """
+    '160 cm', '5.7 ft', '5\' 7"' or '64 in' -> centimetres; unitless readings below FEET_MAX
+    are feet. Valid when the reading has a number.
+    """
+    value = first_number(readings)
+    feet = readings.str.contains(r"\d\s*(?:ft|feet|foot|')", regex=True) | (
+        ~readings.str.contains(r'\d\s*(?:cm|in)', regex=True) & (value < FEET_MAX))
+    inches = readings.str.contains(r'^\s*\d+\.?\d*\s*in', regex=True)
+    feet_inches = readings.str.extract(r"^\s*(\d+)\s*(?:ft|feet|foot|')\s*(\d+\.?\d*)").apply(
+        pd.to_numeric, errors='coerce')
+    centimetres = value.where(~feet, value * CM_PER_FOOT).where(~inches, value * CM_PER_INCH)
+    centimetres = centimetres.where(feet_inches[1].isna(), feet_inches[0] * CM_PER_FOOT + feet_inches[1] * CM_PER_INCH)
+    return number_frame(centimetres, value.notna())
+
+@per_unique
+def parse_blood_sugar(readings):
+    """'140 mg/dl' or '7.8 mmol/l' -> mg/dL; valid when the reading has a number."""
+    value = first_number(readings)
+    mmol = readings.str.contains('mmol', regex=False)
+    return number_frame(value.where(~mmol, value * MG_DL_PER_MMOL_L), value.notna())
+
+# vital_type (lowercased) -> parser; the exports use the first spelling of each
+VITAL_PARSERS = {
+    'blood pressure (bp)': parse_blood_pressure,
+    'blood pressure': parse_blood_pressure,
+    'bp': parse_blood_pressure,
+    'pulse': parse_pulse,
+    'heart rate': parse_pulse,
+    'weight': parse_weight,
+    'oxygen saturation (spo2)': parse_oxygen_saturation,
+    'spo2': parse_oxygen_saturation,
+    'temperature': parse_temperature,
+    'height': parse_height,
+    'respiratory rate': parse_respiratory_rate,
+    'respiration rate': parse_respiratory_rate,
+    'random blood sugar (rbs)': parse_blood_sugar,
+    'rbs': parse_blood_sugar,
+}
+# Column of the latest reading of each vital in the per-patient matrix; blood pressure is
+# split into SYSTOLIC_COLUMN and DIASTOLIC_COLUMN
+MATRIX_COLUMNS = {
+    parse_height: 'Height',
+    parse_weight: 'Weight',
+    parse_pulse: 'Pulse',
+    parse_oxygen_saturation: 'Oxygen saturation (SpO2)',
+    parse_temperature: 'Temperature',
+    parse_respiratory_rate: 'Respiration rate',
+    parse_blood_sugar: 'Random Blood Sugar (RBS)',
+}
+SYSTOLIC_COLUMN = 'Systolic BP'
+DIASTOLIC_COLUMN = 'Diastolic BP'
+# Metrics patient_matrix derives from the readings of each patient
+BMI_COLUMN = 'BMI'
+MAP_COLUMN = 'Mean arterial pressure (MAP)'
+DERIVED_COLUMNS = [BMI_COLUMN, MAP_COLUMN]
+
+
+def parser_for(vital_type):
+    """The parser registered for vital_type, or None."""
+    return VITAL_PARSERS.get(str(vital_type).strip().lower())
+
+def parse_vital(values, vital_type):
+    """The readings of values parsed as vital_type; raises KeyError for a vital type without a parser."""
+    parser = parser_for(vital_type)
+    if parser is None:
+        raise KeyError(f"no parser for vital type {vital_type!r}")
+    return parser(values)
+
+def build_facts(data):
+    """
+    The vitals fact table of data: one row per row with a vital_type, holding its row
+    position ('row'), patient id, start_time, state_name, vital_type, the systolic, diastolic and value readings
+    (READING_DTYPE) with the 'valid' flag of its parser, and the age_group and gender the
+    vitals tab groups by. Vital types without a parser have no valid readings.
+    """
+    data = data[data['vital_type'].notna()]
+    parsed = [
+        parse_vital(values, vital_type)
+        for vital_type, values in data.groupby('vital_type', observed=True)['value']
+        if parser_for(vital_type) is not None
+    ]
+    readings = pd.concat(parsed) if parsed else pd.DataFrame()
+    readings = readings.reindex(index=data.index, columns=['systolic', 'diastolic', 'value', 'valid'])
+    age = pd.to_numeric(data.get('age', pd.Series(index=data.index, dtype='float64')), errors='coerce')
+    age_group = pd.cut(age, bins=AGE_BINS, labels=AGE_LABELS, include_lowest=True)
+    facts = pd.DataFrame({'row': data.index.to_numpy()})
+    for column in ['id', 'start_time', 'state_name']:
+        if column in data.columns:
+            facts[column] = data[column].array
+    facts['vital_type'] = data['vital_type'].astype('category').cat.remove_unused_categories().array
+    for column in ['systolic', 'diastolic', 'value']:
+        facts[column] = readings[column].astype(READING_DTYPE).to_numpy()
+    facts['valid'] = readings['valid'].eq(True).to_numpy()
+    facts['age_group'] = age_group.astype(AGE_GROUP_DTYPE).fillna("Unknown").array
+    facts['gender'] = data['gender'].astype('category').array if 'gender' in data.columns else pd.Categorical(["Unknown"] * len(data))
+    return facts
+
+def patient_matrix(facts):
+    """
+    The fact table of build_facts as one row per patient ('id'): the latest valid reading of
+    each vital in its MATRIX_COLUMNS column, BMI (kg/m²) and MAP (diastolic plus a third of
+    the pulse pressure) derived from those, and the gender and age_group of the patient's
+    latest vital row. Readings are ordered by start_time, undated first, then row position.
+    """
+    facts = facts.sort_values(['start_time', 'row'] if 'start_time' in facts.columns else 'row',
+                              na_position='first', kind='stable')
+    matrix = facts.drop_duplicates('id', keep='last').set_index('id')[['gender', 'age_group']]
+    readings = facts[facts['valid']]
+    parsers = readings['vital_type'].map(parser_for)
+    columns = parsers.map(MATRIX_COLUMNS)
+    scalar = readings.assign(column=columns).dropna(subset='column').drop_duplicates(['id', 'column'], keep='last')
+    matrix = matrix.join(scalar.pivot(index='id', columns='column', values='value'))
+    blood_pressure = readings[(parsers == parse_blood_pressure).to_numpy()].drop_duplicates('id', keep='last')
+    matrix = matrix.join(blood_pressure.set_index('id')[['systolic', 'diastolic']].rename(
+        columns={'systolic': SYSTOLIC_COLUMN, 'diastolic': DIASTOLIC_COLUMN}))
+    matrix = matrix.reindex(columns=['gender', 'age_group', *MATRIX_COLUMNS.values(), SYSTOLIC_COLUMN, DIASTOLIC_COLUMN])
+    matrix[BMI_COLUMN] = matrix['Weight'] / (matrix['Height'].where(matrix['Height'] > 0) / 100) ** 2
+    matrix[MAP_COLUMN] = matrix[DIASTOLIC_COLUMN] + (matrix[SYSTOLIC_COLUMN] - matrix[DIASTOLIC_COLUMN]) / 3
+    readings_columns = [*MATRIX_COLUMNS.values(), SYSTOLIC_COLUMN, DIASTOLIC_COLUMN, *DERIVED_COLUMNS]
+    matrix[readings_columns] = matrix[readings_columns].astype(READING_DTYPE)
+    return matrix.reset_index()
+
+def robust_bounds(facts, matrix):
+    """
+    The robust statistics of every reading: one row per vital (its vital_type, or the
+    DERIVED_COLUMNS metric of the patient matrix) and reading column ('systolic',
+    'diastolic' or 'value') with its count, q1, median, q3 and the lower and upper outlier
+    fences, over all of its valid readings (gender and age_group missing) and per
+    (gender, age_group) stratum with at least MIN_STRATUM_READINGS readings and q1 below q3.
+    The fences are missing, clipping nothing, when q1 equals q3.
+    """
+    facts = facts[facts['valid']]
+    blood_pressure = (facts['vital_type'].map(parser_for) == parse_blood_pressure).to_numpy()
+    readings = pd.concat([
+        facts[blood_pressure].melt(id_vars=['vital_type', *STRATA], value_vars=['systolic', 'diastolic'],
+                                   var_name='reading', value_name='x'),
+        facts[~blood_pressure].assign(reading='value').rename(columns={'value': 'x'})[
+            ['vital_type', *STRATA, 'reading', 'x']],
+        matrix.melt(id_vars=STRATA, value_vars=DERIVED_COLUMNS, var_name='vital_type', value_name='x')
+        .assign(reading='value').dropna(subset='x'),
+    ], ignore_index=True).rename(columns={'vital_type': 'vital'})
+    if readings.empty:
+        return pd.DataFrame(columns=BOUNDS_COLUMNS)
+    readings[['vital', *STRATA]] = readings[['vital', *STRATA]].astype(object)
+    groups = [['vital', 'reading'], ['vital', 'reading', *STRATA]]
+    bounds = []
+    for keys in groups:
+        grouped = readings.groupby(keys)['x']
+        stats = grouped.quantile([0.25, 0.5, 0.75]).unstack().set_axis(['q1', 'median', 'q3'], axis=1)
+        stats.insert(0, 'count', grouped.size())
+        if STRATA[0] in keys:
+            # A stratum dominated by one value has no spread to fence with, so its rows fall
+            # back to the fences of the whole vital
+            stats = stats[(stats['count'] >= MIN_STRATUM_READINGS) & (stats['q3'] > stats['q1'])]
+        bounds.append(stats.reset_index())
+    bounds = pd.concat(bounds, ignore_index=True).reindex(columns=BOUNDS_COLUMNS[:-2])
+    spread = (OUTLIER_IQR_FACTOR * (bounds['q3'] - bounds['q1'])).where(bounds['q3'] > bounds['q1'])
+    return bounds.assign(lower=bounds['q1'] - spread, upper=bounds['q3'] + spread)
+
+def vital_bounds(bounds, vital, reading='value'):
+    """The row of bounds over all readings of vital, or None."""
+    rows = bounds[(bounds['vital'] == vital) & (bounds['reading'] == reading) & bounds[STRATA].isna().all(axis=1)]
+    return rows.iloc[0] if len(rows) else None
+
+def outlier_fences(data, vital, reading, bounds):
+    """
+    The lower and upper fences in bounds of reading of vital for every row of data, as
+    arrays: those of the (gender, age_group) stratum of the row, or those of the whole vital
+    for rows of strata without fences of their own. None when bounds has no row for reading.
+    """
+    overall = vital_bounds(bounds, vital, reading)
+    if overall is None:
+        return None
+    strata = bounds[(bounds['vital'] == vital) & (bounds['reading'] == reading)].dropna(subset=STRATA)
+    fences = strata.set_index(STRATA)[['lower', 'upper']].reindex(
+        pd.MultiIndex.from_frame(data[STRATA].astype(object)))
+    return (fences['lower'].fillna(overall['lower']).to_numpy('float64'),
+            fences['upper'].fillna(overall['upper']).to_numpy('float64'))
+
+def clip_outliers(data, vital, column, bounds, reading=None):
+    """
+    data[column] clipped to its outlier_fences. Missing fences leave the readings unclipped.
+    reading names the reading of vital in bounds when it is not column.
+    """
+    fences = outlier_fences(data, vital, reading or column, bounds)
+    if fences is None:
+        return data[column]
+    lower, upper = fences
+    return data[column].clip(lower=lower, upper=upper)
+
+def stored_median(values, vital, bounds, reading='value'):
+    """The median of values, from bounds when values are every reading it was computed from."""
+    overall = vital_bounds(bounds, vital, reading)
+    if overall is not None and len(values) == overall['count']:
+        return overall['median']
+    return values.median()
+
+def digest(values, compression=DIGEST_COMPRESSION):
+    """The t-digest of values: the means and weights of its centroids, in ascending order."""
+    values = np.asarray(values, dtype='float64')
+    return compress(values, np.ones(len(values)), compression)
+
+def compress(means, weights, compression=DIGEST_COMPRESSION):
+    """
+    The centroids means, weights with equal means merged, and if more than compression
+    remain, merged along the k1 scale of the t-digest, which keeps the tails finer than the middle.
+    """
+    means, groups = np.unique(means, return_inverse=True)
+    weights = np.bincount(groups, weights)
+    if len(means) <= compression:
+        return means, weights
+    cumulative = np.cumsum(weights)
+    k = compression / (2 * np.pi) * np.arcsin(2 * (cumulative - weights / 2) / cumulative[-1] - 1)
+    _, groups = np.unique(np.floor(k), return_inverse=True)
+    merged_weights = np.bincount(groups, weights)
+    return np.bincount(groups, weights * means) / merged_weights, merged_weights
+
+def merge_digests(digests, compression=DIGEST_COMPRESSION):
+    """One t-digest of the (means, weights) digests."""
+    means, weights = zip(*digests)
+    return compress(np.concatenate(means), np.concatenate(weights), compression)
+
+def digest_quantile(means, weights, q):
+    """
+    Quantile q of a t-digest. Every centroid holds the ranks of its points at its mean, and
+    ranks in between are interpolated linearly as pandas does, so it is exact while the
+    digest is.
+    """
+    cumulative = np.cumsum(weights)
+    ranks = np.column_stack([cumulative - weights, cumulative - 1]).ravel()
+    return float(np.interp(q * (cumulative[-1] - 1), ranks, np.repeat(means, 2)))
+
+def build_cells(facts, bounds):
+    """
+    The summary cells of the valid readings of facts, clipped like clip_outliers as the
+    vitals tab shows them: one row per CELL_KEYS combination with the count, sum,
+    sum_squares, min and max of its readings, their t-digest ('means', 'weights') and the
+    outlier_fences they were clipped to ('lower', 'upper'). Metrics derived per patient
+    have no cells.
+    """
+    facts = facts[facts['valid']]
+    facts = facts.reindex(columns=facts.columns.union(['start_time', 'state_name'], sort=False))
+    readings = []
+    for vital, rows in facts.groupby('vital_type', observed=True):
+        columns = ['systolic', 'diastolic'] if parser_for(vital) is parse_blood_pressure else ['value']
+        day = rows['start_time'].dt.floor('D')
+        for column in columns:
+            lower, upper = outlier_fences(rows, vital, column, bounds) or (np.nan, np.nan)
+            readings.append(rows[['state_name', *STRATA]].assign(
+                vital=vital, reading=column, day=day, timed=rows['start_time'] != day,
+                x=rows[column].clip(lower=lower, upper=upper).astype('float64'), lower=lower, upper=upper))
+    if not readings:
+        return pd.DataFrame(columns=[*CELL_KEYS, 'count', 'sum', 'sum_squares', 'min', 'max', 'means', 'weights',
+                                     'lower', 'upper'])
+    readings = pd.concat(readings, ignore_index=True)
+    grouped = readings.assign(x_squared=readings['x'] ** 2).groupby(CELL_KEYS, observed=True, dropna=False)
+    cells = grouped.agg(count=('x', 'size'), sum=('x', 'sum'), sum_squares=('x_squared', 'sum'),
+                        min=('x', 'min'), max=('x', 'max'), lower=('lower', 'first'),
+                        upper=('upper', 'first')).reset_index()
+    # The readings of each cell, in ascending order, one after the other
+    order = np.lexsort((readings['x'].to_numpy(), grouped.ngroup().to_numpy()))
+    points = np.split(readings['x'].to_numpy()[order], np.cumsum(cells['count'].to_numpy())[:-1])
+    digests = [digest(values) for values in points]
+    cells['means'] = [means for means, _ in digests]
+    cells['weights'] = [weights for _, weights in digests]
+    return cells[[*CELL_KEYS, 'count', 'sum', 'sum_squares', 'min', 'max', 'means', 'weights', 'lower', 'upper']]
+
+def split_cells(cells, facts, bounds, rows):
+    """
+    The cells that still hold once the facts of the row positions in the range rows are
+    added to cells and bounds recomputed, with the new fences, and a mask over facts of
+    those to build the other cells from again: the cells that get new valid readings, and
+    those whose readings bounds clips differently, with a minimum or maximum on the fence
+    they were clipped to or beyond the new one.
+    """
+    facts = facts.reindex(columns=facts.columns.union(['start_time', 'state_name'], sort=False))
+    day = facts['start_time'].dt.floor('D')
+    keys = facts[['state_name', *STRATA]].assign(vital=facts['vital_type'], day=day,
+                                                 timed=facts['start_time'] != day)[CELL_GROUP_KEYS]
+    stale = [keys[(facts['valid'] & (facts['row'] >= rows.start) & (facts['row'] < rows.stop)).to_numpy()]]
+    cells = cells.copy()
+    for (vital, reading), group in cells.groupby(['vital', 'reading']):
+        lower, upper = outlier_fences(group, vital, reading, bounds) or (np.nan, np.nan)
+        # Comparisons with missing fences are false: nothing was or will be clipped there
+        clipped = ((group['min'] <= group['lower']) | (group['min'] < lower)
+                   | (group['max'] >= group['upper']) | (group['max'] > upper))
+        stale.append(group.loc[clipped.to_numpy(), CELL_GROUP_KEYS])
+        cells.loc[group.index, 'lower'] = lower
+        cells.loc[group.index, 'upper'] = upper
+    stale = pd.concat(stale, ignore_index=True)
+    days = stale['day'].unique()
+    stale = stale.astype(object).drop_duplicates().assign(stale=True)
+
+    def is_stale(frame):
+        # Only rows of the stale days are matched on every key; merge matches missing keys
+        # with each other, as groupby(dropna=False) grouped them
+        mask = np.zeros(len(frame), dtype=bool)
+        candidates = np.flatnonzero(frame['day'].isin(days).to_numpy())
+        mask[candidates] = frame[CELL_GROUP_KEYS].iloc[candidates].astype(object).merge(
+            stale, on=CELL_GROUP_KEYS, how='left')['stale'].eq(True).to_numpy()
+        return mask
+    return cells[~is_stale(cells)], is_stale(keys)
+
+def select_cells(cells, start_date, end_date, states=None):
+    """
+    The cells of the readings filter_by_date_range keeps for start_date to end_date (from
+    the start of start_date up to midnight of end_date) and, given states, of those states.
+    """
+    start_date, end_date = pd.to_datetime(start_date), pd.to_datetime(end_date)
+    selected = (cells['day'] >= start_date) & (
+        (cells['day'] < end_date) | ((cells['day'] == end_date) & ~cells['timed'].astype(bool)))
+    if states:
+        selected &= cells['state_name'].isin(states)
+    return cells[selected]
+
+def summarize_cells(cells, vital, by, readings):
+    """
+    The SUMMARY_STATISTICS of the given readings of vital per value of by ('gender' or
+    'age_group'), merged from cells and shaped like
+    data.groupby(by, observed=True).agg({reading: SUMMARY_STATISTICS for reading in readings}).
+    Readings without a gender count as 'Unknown' when none of them has one.
+    """
+    cells = cells[cells['vital'] == vital]
+    if cells['gender'].isna().all():
+        cells = cells.assign(gender='Unknown')
+    summaries = {}
+    for reading in readings:
+        grouped = cells[cells['reading'] == reading].groupby(by, observed=True)
+        summary = grouped.agg(count=('count', 'sum'), sum=('sum', 'sum'), sum_squares=('sum_squares', 'sum'),
+                              min=('min', 'min'), max=('max', 'max'))
+        summary['mean'] = summary['sum'] / summary['count']
+        variance = (summary['sum_squares'] - summary['sum'] * summary['mean']) / (summary['count'] - 1)
+        summary['std'] = np.sqrt(variance.clip(lower=0)).where(summary['count'] > 1)
+        summary['median'] = [
+            digest_quantile(*merge_digests(zip(group['means'], group['weights'])), 0.5) for _, group in grouped
+        ]
+        summaries[reading] = summary[SUMMARY_STATISTICS]
+    return pd.concat(summaries, axis=1)